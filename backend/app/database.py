@@ -1,10 +1,72 @@
+import asyncio
+import os
+from collections import deque
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 from .config import settings
 
 engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
+# Engine async (psycopg 3 async) para ingesta y lectura de telemetría: los handlers
+# `async def` no ocupan el thread pool de FastAPI; la concurrencia real hacia la DB
+# la acota el pool (DB_POOL_SIZE + DB_MAX_OVERFLOW por proceso).
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+async_engine = create_async_engine(
+    settings.DATABASE_URL,
+    pool_pre_ping=True,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+
+class _FifoSlots:
+    """
+    Cupos en orden de llegada para las sesiones async.
+
+    La cola del pool deja que una request recién llegada tome la conexión que
+    se liberó antes que la que ya esperaba (que vuelve al final): con cientos
+    de requests concurrentes eso dispara el p99. Aquí el cupo liberado pasa
+    directo al primero de la fila.
+    """
+
+    def __init__(self, size: int) -> None:
+        self._free = size
+        self._waiters = deque()
+
+    async def __aenter__(self):
+        if self._free > 0 and not self._waiters:
+            self._free -= 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self._release()  # el cupo ya era nuestro
+            elif fut in self._waiters:
+                self._waiters.remove(fut)
+            raise
+
+    async def __aexit__(self, *exc):
+        self._release()
+
+    def _release(self) -> None:
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._free += 1
+
+
+_db_slots = _FifoSlots(DB_POOL_SIZE + DB_MAX_OVERFLOW)
+
 class Base(DeclarativeBase): pass
 
 def get_db():
@@ -13,3 +75,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with _db_slots, AsyncSessionLocal() as db:
+        yield db
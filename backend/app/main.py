@@ -1,12 +1,18 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from .routers import tenants, users, devices, ingest_http, telemetry
 from .routers import admin_roles   # 👈 nuevo router de roles
 from .routers import dashboards
-from app.routers.ingest_teltonika import router as ingest_teltonika_router
+from app.routers.ingest_teltonika import router as ingest_teltonika_router, write_telemetry
 from app.routers import telemetry_read
 from app.routers import connectors
 from app.routers import audit
+from app.utils.device_cache import device_cache
+from app.utils.write_behind import write_behind
+from app.database import AsyncSessionLocal
+from app.models_rbac import RoleEnum
+from app.utils.rbac import require_role
 
 app = FastAPI(title="API JOSE", version="0.1.0")
 
@@ -30,6 +36,23 @@ app.include_router(telemetry_read.router)
 app.include_router(connectors.router)
 app.include_router(audit.router, tags=["audit"])
 
+# Invalidación de la caché de devices entre procesos (sólo con DEVICE_CACHE_REDIS_URL)
+app.add_event_handler("startup", device_cache.start_invalidation_listener)
+
+
+# Ingesta write-behind (sólo con INGEST_WRITE_BEHIND=1): drainers en segundo plano
+async def _start_write_behind():
+    await write_behind.start(write_telemetry, AsyncSessionLocal)
+
+app.add_event_handler("startup", _start_write_behind)
+app.add_event_handler("shutdown", write_behind.stop)
+
+
+# Métricas globales (todas las colas / tenants): sólo admin, como /ingest/write-behind/stats
+@app.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(require_role(RoleEnum.admin))])
+def metrics():
+    return write_behind.prometheus_text()
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+Registro único de IO Teltonika (mismo archivo en backend/app/parsers/teltonika
+y services/teltonika-tcp: cada uno se construye por separado;
+tests/test_io_registry.py verifica que sigan iguales).
+
+- Un perfil por modelo de equipo (`profile("FMC650")`; IO_PROFILE elige el
+  de por defecto) con las tablas precompiladas al importar: id -> nombre,
+  nombre -> id, id -> snake_case y un lookup que acepta la clave tal como
+  llega (239 o "239") sin int(k) por record.
+- `IoProfile.normalize(io)` -> (mapped, rejected); `normalize_batch(ios)`
+  para muchos records: la partición de claves se resuelve una vez por
+  combinación de claves (los records de un equipo repiten casi siempre el
+  mismo set) y cada record queda en un zip de valores.
+"""
+
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# -------------------------------------------------------------------
+# Catálogos por modelo (id AVL -> nombre)
+# -------------------------------------------------------------------
+FMC650_IO: Dict[int, str] = {
+    239: "Ignition",
+    240: "Movement",
+    21: "GSM Signal",
+    200: "Sleep Mode",
+    71: "GNSS Status",
+    182: "GNSS HDOP",
+    66: "External Voltage",
+    24: "Speed",
+    205: "GSM Cell ID",
+    67: "Battery Voltage",
+    68: "Battery Current",
+    199: "Trip Odometer",
+    216: "Total Odometer",
+    1: "Digital Input 1",
+    9: "Analog Input 1",
+    179: "Digital Output 1",
+    219: "CCID Part1",
+    220: "CCID Part2",
+    221: "CCID Part3",
+    2: "Digital Input 2",
+    3: "Digital Input 3",
+    10: "Analog Input 2",
+    180: "Digital Output 2",
+    72: "Dallas Temperature 1",
+    73: "Dallas Temperature 2",
+    74: "Dallas Temperature 3",
+    75: "Dallas Temperature 4",
+    62: "Dallas Temperature ID 1",
+    63: "Dallas Temperature ID 2",
+    64: "Dallas Temperature ID 3",
+    65: "Dallas Temperature ID 4",
+    78: "iButton",
+    76: "Fuel Counter",
+    10640: "Impulse counter frequency 1",
+    10641: "Impulse counter RPM 1",
+    483: "Impulse Counter 2",
+    10642: "Impulse counter frequency 2",
+    10643: "Impulse counter RPM 2",
+    10911: "Impulse counter value 1",
+    10912: "Impulse counter value 3",
+    10913: "Impulse counter frequency 3",
+    10914: "Impulse counter RPM 3",
+    10915: "Impulse counter value 4",
+    10916: "Impulse counter frequency 4",
+    10917: "Impulse counter RPM 4",
+    4: "Digital Input 4",
+    50: "Digital Output 3",
+    51: "Digital Output 4",
+    11: "Analog Input 3",
+    245: "Analog Input 4",
+    70: "PCB Temperature",
+    5: "Dallas Temperature ID 5",
+    10487: "1Wire Humidity 1",
+    10488: "1Wire Humidity 2",
+    449: "Ignition On Counter",
+    1161: "IMEI",
+    1148: "Connectivity Quality",
+    87: "Fuel Level",
+    88: "Engine Speed",
+    89: "Axle weight 1",
+    90: "Axle weight 2",
+    135: "Fuel Rate",
+    10348: "Fuel level 2",
+    12: "Program Number",
+    13: "Module ID",
+    14: "Engine Worktime",
+    15: "Engine Worktime (Counted)",
+    16: "Total Mileage (Counted)",
+    17: "Fuel Consumed (counted)",
+    18: "Fuel Rate",
+    19: "AdBlue Level Percent",
+    20: "AdBlue Level Liters",
+    23: "Engine Load",
+    25: "Engine Temperature",
+    26: "Axle 1 Load",
+    27: "Axle 2 Load",
+    30: "Vehicle Speed",
+    31: "Accelerator Pedal Position",
+    33: "Fuel Consumed",
+    34: "Fuel Level Liters",
+    35: "Engine RPM",
+    36: "Total Mileage",
+    37: "Fuel Level Percent",
+    141: "Battery Temperature",
+    142: "Battery Level Percent",
+    143: "Door Status",
+    521: "Load Weight",
+    250: "Trip",
+    247: "Crash Detection",
+    251: "Immobilizer",
+    254: "Green Driving Value",
+    249: "Jamming",
+    10611: "RS232_COM1Data",
+    10612: "RS232_COM2Data",
+    191: "Vehicle Speed",
+    192: "Odometer",
+    193: "Trip Distance",
+    194: "Timestamp",
+    10683: "Temperature 1",
+    10684: "Temperature 2",
+    10685: "Temperature 3",
+    10686: "Temperature 4",
+    10687: "Status 1",
+    10688: "Status 2",
+    10691: "Alarm 1",
+    10692: "Alarm 2",
+    10695: "Input 1",
+    10696: "Input 2",
+    10697: "Input 3",
+    10698: "Input 4",
+    701: "BLE Temperature 1",
+    702: "BLE Temperature 2",
+    705: "BLE Battery 1",
+    706: "BLE Battery 2",
+    709: "BLE Humidity 1",
+    710: "BLE Humidity 2",
+}
+
+_CATALOGS: Dict[str, Dict[int, str]] = {
+    "FMC650": FMC650_IO,
+}
+
+DEFAULT_MODEL = os.getenv("IO_PROFILE", "FMC650").upper()
+
+
+def to_snake(name: str) -> str:
+    # "Engine RPM" -> "engine_rpm", "RS232_COM1Data" -> "rs232_com1_data"
+    s = re.sub(r"([a-z0-9])([A-Z])", r"\1_\2", name)
+    s = s.replace("/", "_").replace("-", "_")
+    s = re.sub(r"\s+", "_", s)
+    s = re.sub(r"[^a-zA-Z0-9_]", "", s)
+    return s.lower().strip("_")
+
+
+# (clave de salida | None si se rechaza, clave en rejected) por clave de entrada
+_Slot = Tuple[Optional[str], str]
+# (slots, claves de salida si no hay rechazos -> dict(zip(...)) directo)
+_Layout = Tuple[Tuple[_Slot, ...], Optional[Tuple[str, ...]]]
+_LAYOUTS_MAX = 4096  # tope ante combinaciones arbitrarias de claves
+
+
+class IoProfile:
+    """Tablas de IO de un modelo; inmutable salvo la caché de layouts."""
+
+    __slots__ = ("model", "by_id", "by_name", "snake", "_ids", "_layouts")
+
+    def __init__(self, model: str, names: Dict[int, str]) -> None:
+        self.model = model
+        self.by_id: Dict[int, str] = dict(names)
+        # nombres repetidos (p.ej. "Fuel Rate" 18/135): gana el primer id del catálogo
+        self.by_name: Dict[str, int] = {}
+        for io_id, name in names.items():
+            self.by_name.setdefault(name, io_id)
+        self.snake: Dict[int, str] = {io_id: to_snake(name) for io_id, name in names.items()}
+        # clave tal como llega (int o str) -> id
+        self._ids: Dict[Any, int] = {}
+        for io_id in names:
+            self._ids[io_id] = io_id
+            self._ids[str(io_id)] = io_id
+        self._layouts: Dict[Tuple[Tuple[Any, ...], bool], _Layout] = {}
+
+    def name(self, io_id: int) -> Optional[str]:
+        return self.by_id.get(io_id)
+
+    def id(self, name: str) -> Optional[int]:
+        return self.by_name.get(name)
+
+    def _slot(self, raw: Any, snake: bool) -> _Slot:
+        io_id = self._ids.get(raw)
+        if io_id is None:
+            try:
+                io_id = int(raw)  # "0239", " 239 ", 239.0 ...
+            except (TypeError, ValueError):
+                return None, str(raw)
+            if io_id not in self.by_id:
+                return None, str(io_id)
+        return (self.snake if snake else self.by_id)[io_id], ""
+
+    def _layout(self, keys: Tuple[Any, ...], snake: bool) -> _Layout:
+        ck = (keys, snake)
+        lay = self._layouts.get(ck)
+        if lay is None:
+            slots = tuple(self._slot(k, snake) for k in keys)
+            names = tuple(name for name, _ in slots)
+            lay = (slots, None if None in names else names)  # type: ignore[assignment]
+            if len(self._layouts) < _LAYOUTS_MAX:
+                self._layouts[ck] = lay
+        return lay
+
+    def normalize(self, io: Any, snake: bool = False) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        {id: valor} -> ({nombre: valor}, {id: valor} no soportados). Acepta
+        ids int o str; con `snake` los nombres salen en snake_case.
+        """
+        if not isinstance(io, dict) or not io:
+            return {}, {}
+        return self._apply(self._layout(tuple(io), snake), io)
+
+    @staticmethod
+    def _apply(lay: _Layout, io: Dict[Any, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        slots, names = lay
+        if names is not None:
+            return dict(zip(names, io.values())), {}
+        mapped: Dict[str, Any] = {}
+        rejected: Dict[str, Any] = {}
+        for (name, rej), value in zip(slots, io.values()):
+            if name is None:
+                rejected[rej] = value
+            else:
+                mapped[name] = value
+        return mapped, rejected
+
+    def normalize_batch(
+        self, ios: Iterable[Any], snake: bool = False,
+    ) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """normalize() sobre muchos records, con los lookups resueltos por layout."""
+        layouts = self._layouts
+        layout = self._layout
+        apply = self._apply
+        out: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+        append = out.append
+        for io in ios:
+            if not isinstance(io, dict) or not io:
+                append(({}, {}))
+                continue
+            keys = tuple(io)
+            lay = layouts.get((keys, snake)) or layout(keys, snake)
+            names = lay[1]
+            append((dict(zip(names, io.values())), {}) if names is not None else apply(lay, io))
+        return out
+
+
+PROFILES: Dict[str, IoProfile] = {model: IoProfile(model, ids) for model, ids in _CATALOGS.items()}
+
+
+def profile(model: Optional[str] = None) -> IoProfile:
+    """Perfil del modelo (sin modelo: IO_PROFILE / FMC650); KeyError si no existe."""
+    key = (model or DEFAULT_MODEL).upper()
+    try:
+        return PROFILES[key]
+    except KeyError:
+        raise KeyError(f"Perfil de IO desconocido: {model!r} (disponibles: {', '.join(sorted(PROFILES))})")
@@ -12,6 +12,7 @@ from ..database import get_db
 from ..models import Device, Tenant
 from ..schemas import DeviceCreate, DeviceOut
 from ..auth import get_current_user
+from ..utils.device_cache import device_cache
 
 
 router = APIRouter(prefix="/devices", tags=["devices"])
@@ -50,6 +51,8 @@ def create_device(
     db.add(d)
     db.commit()
     db.refresh(d)
+    # puede haber una entrada negativa para ese external_id
+    device_cache.invalidate_device(d)
     return d
 
 
@@ -95,11 +98,13 @@ def put_device(
     if not db.get(Tenant, body.tenant_id):
         raise HTTPException(400, "Tenant not found")
 
+    old_external_id = dev.external_id
     dev.name = body.name
     dev.external_id = body.external_id
     # dev.tenant_id = body.tenant_id  # (mantenemos igual por seguridad)
     db.commit()
     db.refresh(dev)
+    device_cache.invalidate_device(dev, old_external_id)
     return dev
 
 
@@ -122,6 +127,7 @@ def patch_device(
     if dev.tenant_id != user.tenant_id:
         raise HTTPException(403, "Cross-tenant not allowed (resource)")
 
+    old_external_id = dev.external_id
     if body.name is not None:
         dev.name = body.name
     if body.external_id is not None:
@@ -129,6 +135,7 @@ def patch_device(
 
     db.commit()
     db.refresh(dev)
+    device_cache.invalidate_device(dev, old_external_id)
     return dev
 
 
@@ -151,6 +158,17 @@ def delete_device(
         raise HTTPException(403, "Cross-tenant not allowed (resource)")
 
     # Con ON DELETE CASCADE en DB, basta con borrar el device
+    token, external_id = dev.token, dev.external_id
     db.delete(dev)
     db.commit()
+    device_cache.invalidate(token, (external_id,))
     return None
+
+
+# ---------- CACHÉ DE RESOLUCIÓN (ingesta) ----------
+@router.get(
+    "/cache/stats",
+    dependencies=[Depends(require_role(RoleEnum.admin))],
+)
+def device_cache_stats():
+    return device_cache.stats()
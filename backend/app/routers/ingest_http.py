@@ -1,21 +1,39 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from datetime import datetime
-from ..database import get_db
-from ..models import Device, Telemetry
+import json
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timezone
+from ..database import get_async_db
+from ..models import Telemetry
+from ..models_rbac import RoleEnum
 from ..schemas import TelemetryIn
+from ..utils.device_cache import device_cache
+from ..utils.rbac import require_role
+from ..utils.write_behind import QueueFull, write_behind
 
 router = APIRouter(prefix="/ingest", tags=["ingest"])
 
 @router.post("/http")
-def ingest_http(body: TelemetryIn, db: Session = Depends(get_db)):
-    dev = db.query(Device).filter(Device.token==body.token).first()
+async def ingest_http(body: TelemetryIn, response: Response, db: AsyncSession = Depends(get_async_db)):
+    dev = await device_cache.aresolve(db, token=body.token)
     if not dev: raise HTTPException(401, "Invalid token")
+    if write_behind.active:
+        try:
+            await write_behind.enqueue(dev.tenant_id, dev.id, [(body.ts or datetime.now(timezone.utc), json.dumps(body.data))])
+        except QueueFull as e:
+            raise HTTPException(503, str(e), headers={"Retry-After": "1"})
+        response.status_code = 202
+        return {"ok": True, "queued": True, "device_id": dev.id}
     tel = Telemetry(
         tenant_id=dev.tenant_id,
         device_id=dev.id,
         ts=body.ts or datetime.utcnow(),
         data=body.data
     )
-    db.add(tel); db.commit()
+    db.add(tel); await db.commit()
     return {"ok": True, "device_id": dev.id}
+
+
+# ---------- WRITE-BEHIND (cola de ingesta) ----------
+@router.get("/write-behind/stats", dependencies=[Depends(require_role(RoleEnum.admin))])
+def write_behind_stats():
+    return write_behind.stats()
@@ -2,18 +2,22 @@ from __future__ import annotations
 
 import json
 import logging
+import time
 import traceback
+import zlib
 from datetime import datetime, timezone
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, AsyncIterator, Iterable, List, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, validator
 from sqlalchemy import text, bindparam
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.dialects.postgresql import JSONB
 
-from app.database import get_db
-from app.models import Device
+from app.database import get_async_db
+from app.utils.device_cache import DeviceRef, device_cache
+from app.utils.write_behind import QueueFull, TelemetryRow, write_behind
 
 log = logging.getLogger("ingest.teltonika")
 
@@ -21,16 +25,22 @@ log = logging.getLogger("ingest.teltonika")
 try:
     from app.auth import get_current_user_optional  # type: ignore
 except Exception:
-    def get_current_user_optional():
+    async def get_current_user_optional():  # async: no pasa por el thread pool
         return None  # type: ignore
 
-# Parser Teltonika opcional: si no existe, dejamos io tal cual
+from app.parsers.teltonika.io_registry import profile as io_profile
+
+# Perfil de IO (IO_PROFILE, FMC650 por defecto): mismo normalizador en todos los caminos
+_IO = io_profile()
+
+
+# Transporte binario interno (teltonika-tcp -> API) opcional
 try:
-    from app.parsers.teltonika.teltonika_FMC650 import parse_io  # type: ignore
+    import msgpack  # type: ignore
 except Exception:
-    def parse_io(io: Dict[str, Any]):
-        return (io or {}), {}  # mapped, rejected
+    msgpack = None  # type: ignore
 
+MSGPACK_CONTENT_TYPE = "application/x-msgpack"
 
 router = APIRouter(prefix="/ingest/teltonika", tags=["ingest: teltonika"])
 
@@ -53,17 +63,35 @@ class TeltonikaIn(BaseModel):
 
     @validator("ts", pre=True)
     def _norm_ts(cls, v):
-        if v is None:
-            return None
-        if isinstance(v, (int, float)):
-            return int(v)
-        if isinstance(v, str):
-            # Acepta "2025-10-08T12:34:56Z" etc.
-            try:
-                return int(datetime.fromisoformat(v.replace("Z", "+00:00")).timestamp() * 1000)
-            except Exception:
-                return None
+        ts = _parse_ts(v)
+        if v is not None and ts is None:
+            raise ValueError("ts debe ser epoch ms o ISO8601")
+        return ts
+
+
+def _parse_ts(v: Any) -> Optional[int]:
+    """epoch ms (int/float) o ISO8601 -> epoch ms; None si no se reconoce."""
+    if v is None:
         return None
+    if isinstance(v, (int, float)):
+        return int(v)
+    if isinstance(v, str):
+        # Acepta "2025-10-08T12:34:56Z" etc.
+        try:
+            return int(datetime.fromisoformat(v.replace("Z", "+00:00")).timestamp() * 1000)
+        except Exception:
+            return None
+    return None
+
+
+class TcpBulkItem(BaseModel):
+    imei: str
+    codec: Optional[int] = None
+    records: List[Dict[str, Any]] = []  # salida de decode_avl_payload (ts en segundos)
+
+
+class TcpBulkIn(BaseModel):
+    items: List[TcpBulkItem]
 
 
 def _ts_to_datetime(ts_ms: Optional[int]) -> datetime:
@@ -72,39 +100,246 @@ def _ts_to_datetime(ts_ms: Optional[int]) -> datetime:
     return datetime.fromtimestamp(ts_ms / 1000.0, tz=timezone.utc)
 
 
-def _resolve_device(
-    db: Session,
+async def _resolve_device(
+    db: AsyncSession,
     tenant_id: Optional[int],
     token: Optional[str],
     external_id: Optional[str],
-) -> Device:
+) -> DeviceRef:
     if not token and not external_id:
         raise HTTPException(status_code=400, detail="Falta token o external_id")
 
-    q = db.query(Device)
-    if token:
-        q = q.filter(Device.token == token)
-    if external_id:
-        q = q.filter(Device.external_id == external_id)
-    # Filtra por tenant SOLO si viene informado (con auth)
-    if tenant_id is not None:
-        q = q.filter(Device.tenant_id == tenant_id)
-
-    dev = q.first()
+    # Caché compartida (TTL + negativa); filtra por tenant SOLO si viene informado (con auth)
+    dev = await device_cache.aresolve(db, token=token, external_id=external_id, tenant_id=tenant_id)
     if not dev:
         raise HTTPException(status_code=404, detail="Dispositivo no encontrado")
     return dev
 
 
+# INSERT con binder JSONB (dict -> jsonb vía psycopg3)
+_TELEMETRY_INSERT = text("""
+    INSERT INTO telemetry (tenant_id, device_id, ts, data)
+    VALUES (:tenant_id, :device_id, :ts, :data)
+""").bindparams(
+    bindparam("tenant_id"),
+    bindparam("device_id"),
+    bindparam("ts"),
+    bindparam("data", type_=JSONB),
+)
+
+
+# Variante para /bulk/msgpack: data llega como texto JSON y Postgres lo castea
+_TELEMETRY_INSERT_RAW = text("""
+    INSERT INTO telemetry (tenant_id, device_id, ts, data)
+    VALUES (:tenant_id, :device_id, :ts, CAST(:data AS jsonb))
+""")
+
+_COPY_TELEMETRY = "COPY telemetry (tenant_id, device_id, ts, data) FROM STDIN"
+
+# Lotes más grandes se normalizan en el thread pool (no deben frenar el loop)
+_NORMALIZE_INLINE_MAX = 200
+
+
+def _opt(cast, v):
+    return None if v is None else cast(v)
+
+
+def _gps_blob(gps: Dict[str, Any]) -> Dict[str, Any]:
+    """Mismo resultado que GPS(**gps).dict(), sin construir el modelo."""
+    return {
+        "lat": float(gps["lat"]),
+        "lon": float(gps["lon"]),
+        "speed": _opt(float, gps.get("speed")),
+        "sat": _opt(int, gps.get("sat")),
+        "hdop": _opt(float, gps.get("hdop")),
+    }
+
+
+class BatchItemError(ValueError):
+    def __init__(self, index: int, message: str) -> None:
+        super().__init__(message)
+        self.index = index
+
+
+def normalize_batch(
+    batch: List[Dict[str, Any]],
+    default_ts: Optional[int] = None,
+    errors: Optional[List[BatchItemError]] = None,
+) -> List[Tuple[datetime, str]]:
+    """
+    Una pasada sobre `batch` ([{ts, gps, io}, ...]) -> [(ts, data JSON), ...]
+    con el mismo blob que el camino single (gps / io / rejected_io).
+    BatchItemError (con el índice del item) si gps o ts no son válidos (un ts
+    ilegible no se reemplaza por la hora actual); con `errors` el item se
+    omite y el error se agrega a la lista.
+    """
+    rows: List[Tuple[datetime, str]] = []
+    ios = _IO.normalize_batch([item.get("io") for item in batch])
+    for i, item in enumerate(batch):
+        gps = item.get("gps")
+        blob: Dict[str, Any] = {}
+        try:
+            if isinstance(gps, dict):
+                try:
+                    blob["gps"] = _gps_blob(gps)
+                except (KeyError, TypeError, ValueError) as e:
+                    raise BatchItemError(i, f"batch[{i}].gps inválido: {e!r}")
+            raw_ts = item.get("ts")
+            ts_ms = _parse_ts(raw_ts) if raw_ts is not None else default_ts
+            try:
+                if raw_ts is not None and ts_ms is None:
+                    raise ValueError(f"{raw_ts!r} no es epoch ms ni ISO8601")
+                ts = _ts_to_datetime(ts_ms)
+            except (ValueError, OverflowError, OSError) as e:
+                raise BatchItemError(i, f"batch[{i}].ts inválido: {e}")
+        except BatchItemError as err:
+            if errors is None:
+                raise
+            errors.append(err)
+            continue
+        io_mapped, io_rejected = ios[i]
+        if io_mapped:
+            blob["io"] = io_mapped
+        if io_rejected:
+            blob["rejected_io"] = io_rejected
+        rows.append((ts, json.dumps(blob)))
+    return rows
+
+
+async def write_telemetry(db: AsyncSession, rows: Iterable[TelemetryRow]) -> None:
+    """
+    Escribe (tenant_id, device_id, ts, data JSON) en la transacción de la
+    sesión: COPY si el driver es psycopg 3 (un solo round trip de datos); si
+    no, un executemany. También lo usan los drainers write-behind.
+    """
+    conn = await db.connection()
+    raw = (await conn.get_raw_connection()).driver_connection
+    if type(raw).__module__.startswith("psycopg"):
+        async with raw.cursor() as cur, cur.copy(_COPY_TELEMETRY) as copy:
+            for row in rows:
+                await copy.write_row(row)
+        return
+    await db.execute(
+        _TELEMETRY_INSERT_RAW,
+        [{"tenant_id": t, "device_id": d, "ts": ts, "data": data} for t, d, ts, data in rows],
+    )
+
+
+async def _write_rows(db: AsyncSession, tenant_id: int, device_id: int, rows: List[Tuple[datetime, str]]) -> None:
+    await write_telemetry(db, ((tenant_id, device_id, ts, data) for ts, data in rows))
+
+
+async def enqueue_rows(response: Response, dev: DeviceRef, rows: List[Tuple[datetime, str]]) -> None:
+    """Write-behind: encola y marca la respuesta 202; 503 si la cola está llena."""
+    try:
+        await write_behind.enqueue(dev.tenant_id, dev.id, rows)
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    response.status_code = 202
+
+
+async def _bulk_devices(db: AsyncSession, imeis) -> Dict[str, Any]:
+    """external_id -> (device_id, tenant_id); los que no están en caché, en una sola consulta."""
+    if not imeis:
+        return {}
+    return {ext: (ref.id, ref.tenant_id) for ext, ref in (await device_cache.aresolve_many(db, imeis)).items()}
+
+
+def unpack_bulk(body: bytes) -> List[Dict[str, Any]]:
+    """
+    Decodifica y valida el sobre msgpack de teltonika-tcp:
+        {"items": [{"imei": str, "codec": int, "ts_ms": [int, ...], "data": [str(JSON), ...]}, ...]}
+    Sólo se valida la forma (tipos y largos); no se construye un modelo por record.
+    """
+    if msgpack is None:
+        raise RuntimeError("msgpack no instalado")
+    try:
+        doc = msgpack.unpackb(body, raw=False)
+    except Exception as e:
+        raise ValueError(f"msgpack inválido: {e}")
+    items = doc.get("items") if isinstance(doc, dict) else None
+    if not isinstance(items, list):
+        raise ValueError("Falta 'items'")
+    for i, it in enumerate(items):
+        if not isinstance(it, dict) or not isinstance(it.get("imei"), str):
+            raise ValueError(f"items[{i}]: falta imei")
+        ts_ms, data = it.get("ts_ms") or [], it.get("data") or []
+        if not isinstance(ts_ms, list) or not isinstance(data, list) or len(ts_ms) != len(data):
+            raise ValueError(f"items[{i}]: ts_ms/data inválidos")
+        if not all(isinstance(t, int) for t in ts_ms) or not all(isinstance(d, str) for d in data):
+            raise ValueError(f"items[{i}]: tipos inválidos en ts_ms/data")
+        it["ts_ms"], it["data"] = ts_ms, data
+    return items
+
+
+async def _raw_body(request: Request) -> bytes:
+    return await request.body()
+
+
+# NDJSON: tope por línea y por bloque inflado (acota memoria ante gzip muy comprimible)
+_NDJSON_MAX_LINE = 1024 * 1024
+_INFLATE_STEP = 256 * 1024
+
+
+async def _inflate(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """gzip (uno o varios miembros concatenados) -> bloques de a lo más _INFLATE_STEP bytes."""
+    d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        data = chunk
+        while data:
+            out = d.decompress(data, _INFLATE_STEP)
+            if out:
+                yield out
+            if d.eof:
+                data = d.unused_data
+                d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            else:
+                data = d.unconsumed_tail
+    out = d.flush()
+    if out:
+        yield out
+
+
+async def ndjson_lines(
+    chunks: AsyncIterator[bytes], gzip: bool = False, max_line: int = _NDJSON_MAX_LINE,
+) -> AsyncIterator[Tuple[int, bytes]]:
+    """
+    (nº de línea, línea) a medida que llegan los bytes; sólo guarda la línea
+    incompleta del final. Omite líneas vacías; ValueError si una línea supera `max_line`.
+    """
+    source = _inflate(chunks) if gzip else chunks
+    buf = bytearray()
+    line_no = 0
+    async for chunk in source:
+        buf += chunk
+        start = 0
+        while True:
+            nl = buf.find(b"\n", start)
+            if nl < 0:
+                break
+            line_no += 1
+            line = bytes(buf[start:nl]).strip()
+            start = nl + 1
+            if line:
+                yield line_no, line
+        del buf[:start]
+        if len(buf) > max_line:
+            raise ValueError(f"línea {line_no + 1} supera {max_line} bytes")
+    line = bytes(buf).strip()
+    if line:
+        yield line_no + 1, line
+
+
 @router.get("/ping")
-def ping():
+async def ping():
     return {"status": "ok"}
 
 
 @router.post("/ingest")
-def ingest_one(
+async def ingest_one(
     payload: TeltonikaIn,
-    db: Session = Depends(get_db),
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
     user=Depends(get_current_user_optional),
 ):
     try:
@@ -121,24 +356,10 @@ def ingest_one(
             raise HTTPException(status_code=400, detail="Usa batch o single (gps/io), no ambos.")
 
         # Resuelve device por token/external_id (+tenant si lo hay)
-        dev = _resolve_device(db, ctx_tenant_id, payload.token, payload.external_id)
-
-        # Statement con binder JSONB (no usamos ::jsonb, dejamos que el driver lo maneje)
-        stmt = text("""
-            INSERT INTO telemetry (tenant_id, device_id, ts, data)
-            VALUES (:tenant_id, :device_id, :ts, :data)
-        """)
-
-        # Forzamos type_ JSONB para que psycopg3 serialice dict -> jsonb
-        stmt = stmt.bindparams(
-            bindparam("tenant_id"),
-            bindparam("device_id"),
-            bindparam("ts"),
-            bindparam("data", type_=JSONB),
-        )
+        dev = await _resolve_device(db, ctx_tenant_id, payload.token, payload.external_id)
 
-        def _save_row(ts_ms: Optional[int], gps_obj: Optional[GPS], io_obj: Dict[str, Any]):
-            io_mapped, io_rejected = parse_io(io_obj or {})
+        async def _save_row(ts_ms: Optional[int], gps_obj: Optional[GPS], io_obj: Dict[str, Any]):
+            io_mapped, io_rejected = _IO.normalize(io_obj)
             blob: Dict[str, Any] = {}
             if gps_obj:
                 blob["gps"] = gps_obj.dict()
@@ -147,8 +368,8 @@ def ingest_one(
             if io_rejected:
                 blob["rejected_io"] = io_rejected
 
-            db.execute(
-                stmt,
+            await db.execute(
+                _TELEMETRY_INSERT,  # binder JSONB: psycopg3 serializa dict -> jsonb
                 {
                     "tenant_id": dev.tenant_id,
                     "device_id": dev.id,
@@ -157,21 +378,46 @@ def ingest_one(
                 },
             )
 
+        if not payload.batch and write_behind.active:
+            rows = normalize_batch([{"ts": payload.ts, "gps": payload.gps.dict() if payload.gps else None, "io": payload.io}])
+            await enqueue_rows(response, dev, rows)
+            return {"status": "queued", "device_id": dev.id, "tenant_id": dev.tenant_id}
+
         if not payload.batch:
-            _save_row(payload.ts, payload.gps, payload.io or {})
-            db.commit()
+            await _save_row(payload.ts, payload.gps, payload.io or {})
+            await db.commit()
             return {"status": "ok", "device_id": dev.id, "tenant_id": dev.tenant_id}
 
-        # batch
-        for item in payload.batch:
-            ts_item = item.get("ts", payload.ts)
-            gps_item = item.get("gps")
-            io_item = item.get("io", {})
-            gps_model = GPS(**gps_item) if isinstance(gps_item, dict) else None
-            _save_row(ts_item, gps_model, io_item)
-
-        db.commit()
-        return {"status": "ok", "ingested": len(payload.batch), "device_id": dev.id, "tenant_id": dev.tenant_id}
+        # batch: normalización en una pasada + COPY (una sola escritura por lote)
+        t0 = time.perf_counter()
+        try:
+            if len(payload.batch) > _NORMALIZE_INLINE_MAX:
+                rows = await run_in_threadpool(normalize_batch, payload.batch, payload.ts)
+            else:
+                rows = normalize_batch(payload.batch, payload.ts)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        if write_behind.active:
+            # sin esperar el commit: los drainers escriben por lotes
+            await enqueue_rows(response, dev, rows)
+            return {"status": "queued", "ingested": len(rows), "device_id": dev.id, "tenant_id": dev.tenant_id}
+        t1 = time.perf_counter()
+        await _write_rows(db, dev.tenant_id, dev.id, rows)
+        t2 = time.perf_counter()
+        await db.commit()
+        t3 = time.perf_counter()
+
+        timing = {
+            "normalize_ms": round((t1 - t0) * 1000.0, 2),
+            "write_ms": round((t2 - t1) * 1000.0, 2),
+            "commit_ms": round((t3 - t2) * 1000.0, 2),
+            "total_ms": round((t3 - t0) * 1000.0, 2),
+        }
+        log.info(
+            "Batch device_id=%s filas=%d normalize=%.1fms write=%.1fms commit=%.1fms",
+            dev.id, len(rows), timing["normalize_ms"], timing["write_ms"], timing["commit_ms"],
+        )
+        return {"status": "ok", "ingested": len(rows), "device_id": dev.id, "tenant_id": dev.tenant_id, "timing": timing}
 
     except HTTPException:
         # Propaga 4xx tal cual
@@ -179,4 +425,223 @@ def ingest_one(
     except Exception as e:
         # Log detallado del 500 para depurar rápido
         log.error("Ingest error: %s\n%s", e, traceback.format_exc())
+        # un device borrado sigue en caché hasta el TTL (FK): se relee en el próximo intento
+        device_cache.invalidate(payload.token, (payload.external_id,), publish=False)
         raise HTTPException(status_code=500, detail="Internal error in ingest")
+
+
+@router.post("/ndjson")
+async def ingest_ndjson(
+    request: Request,
+    token: Optional[str] = None,
+    external_id: Optional[str] = None,
+    chunk_size: int = Query(5000, ge=500, le=50000),
+    skip_invalid: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_current_user_optional),
+):
+    """
+    Backfill en streaming para un device (?token= o ?external_id=): una línea
+    JSON por record ({ts, gps, io}, como los items de `batch`), opcionalmente
+    con Content-Encoding: gzip. Se parsea a medida que llega y se escribe por
+    chunks de `chunk_size` filas (COPY + commit por chunk): la memoria queda
+    acotada al chunk en curso.
+
+    Cada chunk confirmado queda persistido aunque uno posterior falle: el error
+    trae `committed_rows` y `resume_from_line` para reanudar. Con
+    `skip_invalid=true` las líneas inválidas se cuentan y se omiten.
+    """
+    ctx_tenant_id: Optional[int] = None
+    if user is not None and getattr(user, "tenant_id", None) is not None:
+        ctx_tenant_id = int(user.tenant_id)
+    dev = await _resolve_device(db, ctx_tenant_id, token, external_id)
+    gz = "gzip" in request.headers.get("content-encoding", "").lower()
+
+    t_start = time.perf_counter()
+    chunks: List[Dict[str, Any]] = []
+    pending: List[Dict[str, Any]] = []
+    pending_lines: List[int] = []
+    committed = skipped = lines = 0
+    last_committed_line = 0
+    samples: List[str] = []
+
+    def _skip(line_no: int, msg: str) -> None:
+        nonlocal skipped
+        skipped += 1
+        if len(samples) < 10:
+            samples.append(f"línea {line_no}: {msg}")
+
+    async def _flush() -> None:
+        nonlocal committed, last_committed_line
+        t0 = time.perf_counter()
+        errors: Optional[List[BatchItemError]] = [] if skip_invalid else None
+        try:
+            rows = await run_in_threadpool(normalize_batch, pending, None, errors)
+        except BatchItemError as e:
+            raise _NdjsonError(422, pending_lines[e.index], str(e))
+        for e in errors or ():
+            _skip(pending_lines[e.index], str(e))
+        t1 = time.perf_counter()
+        if rows:
+            await _write_rows(db, dev.tenant_id, dev.id, rows)
+        t2 = time.perf_counter()
+        await db.commit()
+        t3 = time.perf_counter()
+        committed += len(rows)
+        last_committed_line = pending_lines[-1]
+        chunks.append({
+            "chunk": len(chunks) + 1,
+            "lines": [pending_lines[0], pending_lines[-1]],
+            "rows": len(rows),
+            "normalize_ms": round((t1 - t0) * 1000.0, 2),
+            "write_ms": round((t2 - t1) * 1000.0, 2),
+            "commit_ms": round((t3 - t2) * 1000.0, 2),
+        })
+        log.info(
+            "NDJSON device_id=%s chunk=%d filas=%d (total %d) normalize=%.1fms write=%.1fms commit=%.1fms",
+            dev.id, len(chunks), len(rows), committed, (t1 - t0) * 1000.0, (t2 - t1) * 1000.0, (t3 - t2) * 1000.0,
+        )
+        pending.clear()
+        pending_lines.clear()
+
+    def _progress() -> Dict[str, Any]:
+        return {
+            "committed_rows": committed,
+            "resume_from_line": last_committed_line + 1,
+            "skipped": skipped,
+            "chunks": len(chunks),
+        }
+
+    try:
+        async for line_no, line in ndjson_lines(request.stream(), gzip=gz):
+            lines = line_no
+            try:
+                rec = json.loads(line)
+                if not isinstance(rec, dict):
+                    raise ValueError("se esperaba un objeto JSON")
+            except ValueError as e:
+                if not skip_invalid:
+                    raise _NdjsonError(422, line_no, f"JSON inválido: {e}")
+                _skip(line_no, str(e))
+                continue
+            pending.append(rec)
+            pending_lines.append(line_no)
+            if len(pending) >= chunk_size:
+                await _flush()
+        if pending:
+            await _flush()
+    except _NdjsonError as e:
+        await db.rollback()
+        raise HTTPException(status_code=e.status, detail={"error": e.message, "line": e.line, **_progress()})
+    except (ValueError, zlib.error) as e:
+        # línea demasiado larga / gzip corrupto
+        await db.rollback()
+        raise HTTPException(status_code=400, detail={"error": str(e), **_progress()})
+    except Exception as e:
+        await db.rollback()
+        log.error("NDJSON ingest error: %s\n%s", e, traceback.format_exc())
+        device_cache.invalidate(token, (external_id,), publish=False)
+        raise HTTPException(status_code=500, detail={"error": "Internal error in ndjson ingest", **_progress()})
+
+    return {
+        "status": "ok",
+        "device_id": dev.id,
+        "tenant_id": dev.tenant_id,
+        "ingested": committed,
+        "lines": lines,
+        "skipped": skipped,
+        "errors": samples,
+        "total_ms": round((time.perf_counter() - t_start) * 1000.0, 2),
+        "chunks": chunks,
+    }
+
+
+class _NdjsonError(Exception):
+    def __init__(self, status: int, line: int, message: str) -> None:
+        super().__init__(message)
+        self.status, self.line, self.message = status, line, message
+
+
+@router.post("/bulk")
+async def ingest_bulk(payload: TcpBulkIn, db: AsyncSession = Depends(get_async_db)):
+    """
+    Ingesta multi-dispositivo desde teltonika-tcp (lotes coalescidos).
+    Los records ya vienen decodificados/nombrados, se guardan tal cual.
+    Devuelve un resultado por item (mismo orden): ok | unknown.
+    El commit es único: si responde 2xx, todo lo "ok" quedó persistido.
+    """
+    try:
+        devices = await _bulk_devices(db, {it.imei for it in payload.items})
+
+        rows: List[Dict[str, Any]] = []
+        results: List[Dict[str, Any]] = []
+        for it in payload.items:
+            dev = devices.get(it.imei)
+            if dev is None:
+                results.append({"imei": it.imei, "status": "unknown"})
+                continue
+            for rec in it.records:
+                ts = rec.get("ts")
+                rows.append({
+                    "tenant_id": dev[1],
+                    "device_id": dev[0],
+                    "ts": _ts_to_datetime(int(ts * 1000) if ts is not None else None),
+                    "data": {
+                        "gps": rec.get("gps"),
+                        "io": rec.get("io") or {},
+                        "rejected_io": rec.get("rejected_io") or {},
+                    },
+                })
+            results.append({"imei": it.imei, "status": "ok", "ingested": len(it.records), "device_id": dev[0]})
+
+        if rows:
+            await db.execute(_TELEMETRY_INSERT, rows)  # executemany
+        await db.commit()
+        return {"status": "ok", "ingested": len(rows), "results": results}
+
+    except Exception as e:
+        log.error("Bulk ingest error: %s\n%s", e, traceback.format_exc())
+        device_cache.invalidate(external_ids=[it.imei for it in payload.items], publish=False)
+        raise HTTPException(status_code=500, detail="Internal error in bulk ingest")
+
+
+@router.post("/bulk/msgpack")
+async def ingest_bulk_msgpack(body: bytes = Depends(_raw_body), db: AsyncSession = Depends(get_async_db)):
+    """
+    Igual que /bulk pero con transporte msgpack (Content-Type: application/x-msgpack):
+    sin parseo JSON ni modelos Pydantic por record; `data` de cada record ya
+    viene serializado y se inserta con CAST(... AS jsonb).
+    Responde 415 si el API no tiene msgpack (el cliente vuelve a /bulk JSON).
+    """
+    if msgpack is None:
+        raise HTTPException(status_code=415, detail="msgpack no disponible en el API")
+    try:
+        items = unpack_bulk(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        devices = await _bulk_devices(db, {it["imei"] for it in items})
+
+        rows: List[Dict[str, Any]] = []
+        results: List[Dict[str, Any]] = []
+        for it in items:
+            imei = it["imei"]
+            dev = devices.get(imei)
+            if dev is None:
+                results.append({"imei": imei, "status": "unknown"})
+                continue
+            device_id, tenant_id = dev
+            for ts_ms, data in zip(it["ts_ms"], it["data"]):
+                rows.append({"tenant_id": tenant_id, "device_id": device_id, "ts": _ts_to_datetime(ts_ms), "data": data})
+            results.append({"imei": imei, "status": "ok", "ingested": len(it["data"]), "device_id": device_id})
+
+        if rows:
+            await db.execute(_TELEMETRY_INSERT_RAW, rows)  # executemany
+        await db.commit()
+        return {"status": "ok", "ingested": len(rows), "results": results}
+
+    except Exception as e:
+        log.error("Bulk msgpack ingest error: %s\n%s", e, traceback.format_exc())
+        device_cache.invalidate(external_ids=[it["imei"] for it in items], publish=False)
+        raise HTTPException(status_code=500, detail="Internal error in bulk ingest")
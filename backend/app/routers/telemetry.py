@@ -5,12 +5,12 @@ from typing import Any, Dict, List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, desc
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, desc, select
 
 from ..utils.rbac import require_role
 from ..models_rbac import RoleEnum
-from ..database import get_db
+from ..database import get_async_db
 from ..auth import get_current_user
 from ..models import Telemetry, Device  # Modelos existentes
 
@@ -49,12 +49,10 @@ def _project_keys(data: Dict[str, Any], keys: Optional[List[str]]) -> Dict[str,
     return out
 
 
-def _validate_device_in_tenant(db: Session, device_id: int, tenant_id: int) -> Device:
-    device = (
-        db.query(Device)
-        .filter(Device.id == device_id, Device.tenant_id == tenant_id)
-        .first()
-    )
+async def _validate_device_in_tenant(db: AsyncSession, device_id: int, tenant_id: int) -> Device:
+    device = (await db.execute(
+        select(Device).where(Device.id == device_id, Device.tenant_id == tenant_id).limit(1)
+    )).scalar_one_or_none()
     if not device:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -70,9 +68,9 @@ def _validate_device_in_tenant(db: Session, device_id: int, tenant_id: int) -> D
     "/query",
     dependencies=[Depends(require_role(RoleEnum.viewer))],
 )
-def query_telemetry(
+async def query_telemetry(
     q: _TelemetryQuery,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user=Depends(get_current_user),
 ) -> List[Dict[str, Any]]:
     """
@@ -83,7 +81,7 @@ def query_telemetry(
     hard_max = 1000
     limit = max(1, min(q.limit or 100, hard_max))
 
-    _validate_device_in_tenant(db, q.device_id, user.tenant_id)
+    await _validate_device_in_tenant(db, q.device_id, user.tenant_id)
 
     filters = [
         Telemetry.tenant_id == user.tenant_id,
@@ -94,13 +92,12 @@ def query_telemetry(
     if q.end_ts is not None:
         filters.append(Telemetry.ts <= q.end_ts)
 
-    items: List[Telemetry] = (
-        db.query(Telemetry)
-        .filter(and_(*filters))
+    items: List[Telemetry] = (await db.execute(
+        select(Telemetry)
+        .where(and_(*filters))
         .order_by(desc(Telemetry.ts))
         .limit(limit)
-        .all()
-    )
+    )).scalars().all()
 
     return [{"ts": t.ts.isoformat(), "data": _project_keys(t.data, q.keys)} for t in items]
 
@@ -112,34 +109,31 @@ def query_telemetry(
     "/devices/{imei}/latest",
     dependencies=[Depends(require_role(RoleEnum.viewer))],
 )
-def get_latest_by_imei(
+async def get_latest_by_imei(
     imei: str,
     keys: Optional[List[str]] = Query(None, description="Claves opcionales a proyectar, ej: io.IButton, io.IButton_Reverse"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user=Depends(get_current_user),
 ) -> Dict[str, Any]:
     """
     Último punto para un dispositivo del tenant, referenciado por IMEI (Device.external_id).
     """
 
-    device: Optional[Device] = (
-        db.query(Device)
-        .filter(Device.external_id == imei, Device.tenant_id == user.tenant_id)
-        .first()
-    )
+    device: Optional[Device] = (await db.execute(
+        select(Device).where(Device.external_id == imei, Device.tenant_id == user.tenant_id).limit(1)
+    )).scalar_one_or_none()
     if not device:
         raise HTTPException(status_code=404, detail="IMEI no encontrado en tu tenant")
 
-    row: Optional[Telemetry] = (
-        db.query(Telemetry)
-        .filter(
+    row: Optional[Telemetry] = (await db.execute(
+        select(Telemetry)
+        .where(
             Telemetry.tenant_id == user.tenant_id,
             Telemetry.device_id == device.id,
         )
         .order_by(desc(Telemetry.ts))
         .limit(1)
-        .first()
-    )
+    )).scalar_one_or_none()
     if not row:
         raise HTTPException(status_code=404, detail="Sin registros para ese IMEI")
 
@@ -158,25 +152,23 @@ def get_latest_by_imei(
     "/devices/{imei}",
     dependencies=[Depends(require_role(RoleEnum.viewer))],
 )
-def list_by_imei(
+async def list_by_imei(
     imei: str,
     limit: int = Query(100, ge=1, le=1000),
     start_ts: Optional[datetime] = Query(None, description="ISO8601 (UTC) desde"),
     end_ts:   Optional[datetime] = Query(None, description="ISO8601 (UTC) hasta"),
     keys: Optional[List[str]] = Query(None, description="Claves a proyectar (ej. gps, io.Speed, io.IButton)"),
     offset: int = Query(0, ge=0, description="Paginación por offset"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user=Depends(get_current_user),
 ) -> Dict[str, Any]:
     """
     Histórico por IMEI con filtros de tiempo y proyección de claves.
     """
 
-    device: Optional[Device] = (
-        db.query(Device)
-        .filter(Device.external_id == imei, Device.tenant_id == user.tenant_id)
-        .first()
-    )
+    device: Optional[Device] = (await db.execute(
+        select(Device).where(Device.external_id == imei, Device.tenant_id == user.tenant_id).limit(1)
+    )).scalar_one_or_none()
     if not device:
         raise HTTPException(status_code=404, detail="IMEI no encontrado en tu tenant")
 
@@ -189,14 +181,13 @@ def list_by_imei(
     if end_ts is not None:
         filters.append(Telemetry.ts <= end_ts)
 
-    rows: List[Telemetry] = (
-        db.query(Telemetry)
-        .filter(and_(*filters))
+    rows: List[Telemetry] = (await db.execute(
+        select(Telemetry)
+        .where(and_(*filters))
         .order_by(desc(Telemetry.ts))
         .offset(offset)
         .limit(limit)
-        .all()
-    )
+    )).scalars().all()
 
     return {
         "imei": imei,
@@ -2,10 +2,10 @@ from __future__ import annotations
 from datetime import datetime, timezone
 from typing import Optional, List, Any, Dict
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text, bindparam
-from app.database import get_db
-from app.models import Device
+from app.database import get_async_db
+from app.utils.device_cache import device_cache
 
 router = APIRouter(tags=["telemetry"], prefix="/telemetry")
 
@@ -21,8 +21,8 @@ def _to_dt(s: Optional[str]) -> Optional[datetime]:
         return None
 
 @router.get("/query")
-def get_telemetry(
-    db: Session = Depends(get_db),
+async def get_telemetry(
+    db: AsyncSession = Depends(get_async_db),
     external_id: Optional[str] = Query(None),
     device_id: Optional[int] = Query(None),
     limit: int = Query(50, ge=1, le=1000),
@@ -34,7 +34,7 @@ def get_telemetry(
         raise HTTPException(status_code=400, detail="Debes enviar external_id o device_id")
 
     if external_id and not device_id:
-        dev = db.query(Device).filter(Device.external_id == external_id).first()
+        dev = await device_cache.aresolve(db, external_id=external_id)
         if not dev:
             raise HTTPException(status_code=404, detail="Dispositivo no encontrado")
         device_id = dev.id
@@ -60,14 +60,14 @@ def get_telemetry(
         ORDER BY ts {"DESC" if order=="desc" else "ASC"}
         LIMIT :limit
     """)
-    rows = db.execute(
+    rows = (await db.execute(
         stmt.bindparams(
             bindparam("device_id", value=device_id),
             bindparam("from_ts", value=dt_from),
             bindparam("to_ts", value=dt_to),
             bindparam("limit", value=limit),
         )
-    ).fetchall()
+    )).fetchall()
 
     # Normalizamos la salida
     out = [{"ts": r[0].isoformat(), **(r[1] if isinstance(r[1], dict) else {"data": r[1]})} for r in rows]
@@ -0,0 +1,306 @@
+"""
+Caché en proceso para resolver dispositivos en la ingesta.
+
+token / external_id -> DeviceRef(id, tenant_id, token, external_id)
+
+- LRU acotada (DEVICE_CACHE_SIZE) con TTL (DEVICE_CACHE_TTL) y caché negativa
+  más corta (DEVICE_CACHE_NEGATIVE_TTL) para tokens / IMEIs desconocidos.
+- Ambas columnas son UNIQUE: una entrada por token y otra por external_id
+  apuntan al mismo DeviceRef; el filtro por tenant se aplica sobre el ref.
+- El router de devices invalida en create / update / delete. Con
+  DEVICE_CACHE_REDIS_URL la invalidación se publica en Redis y cada proceso
+  del API la aplica (thread suscriptor); sin Redis sólo afecta al proceso
+  local y el TTL acota la inconsistencia en los demás.
+- `stats()`: hits / misses / entradas (GET /devices/cache/stats).
+- `aresolve` / `aresolve_many`: lo mismo sobre AsyncSession (routers async).
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ..models import Device
+
+# Redis opcional (sólo para invalidar entre procesos)
+try:
+    import redis  # type: ignore
+except Exception:
+    redis = None  # type: ignore
+
+log = logging.getLogger("device_cache")
+
+CHANNEL = "device-cache:invalidate"
+
+
+class DeviceRef(NamedTuple):
+    id: int
+    tenant_id: int
+    token: Optional[str]
+    external_id: Optional[str]
+
+
+_Key = Tuple[str, str]  # ("token" | "ext", valor)
+
+
+class DeviceCache:
+    def __init__(self, max_size: int = 100_000, ttl: float = 300.0, negative_ttl: float = 30.0) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._data: "OrderedDict[_Key, Tuple[Optional[DeviceRef], float]]" = OrderedDict()  # -> (ref | None, vence)
+        self._lock = threading.Lock()
+        self._redis = None
+        self._listener: Optional[threading.Thread] = None
+        # métricas
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls) -> "DeviceCache":
+        return cls(
+            max_size=int(os.getenv("DEVICE_CACHE_SIZE", "100000")),
+            ttl=float(os.getenv("DEVICE_CACHE_TTL", "300")),
+            negative_ttl=float(os.getenv("DEVICE_CACHE_NEGATIVE_TTL", "30")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl > 0
+
+    # ------------------------------------------------------------------
+    # LRU
+    # ------------------------------------------------------------------
+    def _get(self, key: _Key) -> Tuple[bool, Optional[DeviceRef]]:
+        """(encontrado, ref | None si es negativa)."""
+        now = time.monotonic()
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None or hit[1] <= now:
+                if hit is not None:
+                    del self._data[key]
+                self.misses += 1
+                return False, None
+            self._data.move_to_end(key)
+            if hit[0] is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return True, hit[0]
+
+    def _put(self, key: _Key, ref: Optional[DeviceRef]) -> None:
+        if not self.enabled:
+            return
+        expires = time.monotonic() + (self.ttl if ref is not None else self.negative_ttl)
+        with self._lock:
+            self._data[key] = (ref, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def _put_ref(self, ref: DeviceRef) -> None:
+        if ref.token:
+            self._put(("token", ref.token), ref)
+        if ref.external_id:
+            self._put(("ext", ref.external_id), ref)
+
+    # ------------------------------------------------------------------
+    # Resolución
+    # ------------------------------------------------------------------
+    def resolve(
+        self,
+        db: Session,
+        token: Optional[str] = None,
+        external_id: Optional[str] = None,
+        tenant_id: Optional[int] = None,
+    ) -> Optional[DeviceRef]:
+        """
+        Device por token y/o external_id (si vienen ambos deben coincidir los dos)
+        y, si se indica, del tenant dado. None si no existe.
+        """
+        if not token and not external_id:
+            return None
+        key = _key(token, external_id)
+        found, ref = self._get(key) if self.enabled else (False, None)
+        if not found:
+            ref = self._store(key, db.execute(_select_one(key)).first())
+        return _match(ref, token, external_id, tenant_id)
+
+    async def aresolve(
+        self,
+        db: AsyncSession,
+        token: Optional[str] = None,
+        external_id: Optional[str] = None,
+        tenant_id: Optional[int] = None,
+    ) -> Optional[DeviceRef]:
+        if not token and not external_id:
+            return None
+        key = _key(token, external_id)
+        found, ref = self._get(key) if self.enabled else (False, None)
+        if not found:
+            ref = self._store(key, (await db.execute(_select_one(key))).first())
+        return _match(ref, token, external_id, tenant_id)
+
+    def resolve_many(self, db: Session, external_ids: Iterable[str]) -> Dict[str, DeviceRef]:
+        """external_id -> DeviceRef para los que existen; los faltantes se consultan en un solo IN."""
+        out, missing = self._split(external_ids)
+        if missing:
+            self._store_many(out, missing, db.execute(_select_many(missing)).all())
+        return out
+
+    async def aresolve_many(self, db: AsyncSession, external_ids: Iterable[str]) -> Dict[str, DeviceRef]:
+        out, missing = self._split(external_ids)
+        if missing:
+            self._store_many(out, missing, (await db.execute(_select_many(missing))).all())
+        return out
+
+    def _store(self, key: _Key, row) -> Optional[DeviceRef]:
+        if row is None:
+            self._put(key, None)
+            return None
+        ref = DeviceRef(*row)
+        self._put_ref(ref)
+        return ref
+
+    def _split(self, external_ids: Iterable[str]) -> Tuple[Dict[str, DeviceRef], List[str]]:
+        out: Dict[str, DeviceRef] = {}
+        missing: List[str] = []
+        for ext in set(external_ids):
+            found, ref = self._get(("ext", ext)) if self.enabled else (False, None)
+            if not found:
+                missing.append(ext)
+            elif ref is not None:
+                out[ext] = ref
+        return out, missing
+
+    def _store_many(self, out: Dict[str, DeviceRef], missing: List[str], rows) -> None:
+        for row in rows:
+            ref = DeviceRef(*row)
+            out[ref.external_id] = ref
+            self._put_ref(ref)
+        for ext in missing:
+            if ext not in out:
+                self._put(("ext", ext), None)
+
+    # ------------------------------------------------------------------
+    # Invalidación
+    # ------------------------------------------------------------------
+    def invalidate(self, token: Optional[str] = None, external_ids: Iterable[Optional[str]] = (), publish: bool = True) -> None:
+        """Descarta las entradas de ese token / external_ids (y las del device al que apuntan)."""
+        external_ids = [e for e in external_ids if e]
+        keys = [("ext", e) for e in external_ids]
+        if token:
+            keys.append(("token", token))
+        self._drop(keys)
+        if publish and self._redis is not None:
+            try:
+                self._redis.publish(CHANNEL, json.dumps({"token": token, "external_ids": external_ids}))
+            except Exception as e:
+                log.warning("No se pudo publicar invalidación de devices en Redis: %s", e)
+
+    def invalidate_device(self, dev: Device, old_external_id: Optional[str] = None) -> None:
+        self.invalidate(dev.token, (dev.external_id, old_external_id))
+
+    def _drop(self, keys) -> None:
+        with self._lock:
+            for key in keys:
+                hit = self._data.pop(key, None)
+                if hit is not None and hit[0] is not None:
+                    ref = hit[0]
+                    # la otra clave del mismo device
+                    self._data.pop(("token", ref.token), None)
+                    self._data.pop(("ext", ref.external_id), None)
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def start_invalidation_listener(self, url: Optional[str] = None) -> None:
+        """Suscribe (thread daemon) al canal de invalidación; no hace nada sin Redis configurado."""
+        url = url if url is not None else os.getenv("DEVICE_CACHE_REDIS_URL", "")
+        if not url or redis is None or self._listener is not None:
+            if url and redis is None:
+                log.warning("DEVICE_CACHE_REDIS_URL definido pero el paquete redis no está instalado")
+            return
+        self._redis = redis.Redis.from_url(url, socket_timeout=2.0)
+        self._listener = threading.Thread(target=self._listen, args=(url,), name="device-cache-redis", daemon=True)
+        self._listener.start()
+
+    def _listen(self, url: str) -> None:
+        while True:
+            try:
+                client = redis.Redis.from_url(url, socket_keepalive=True)
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+                # lo publicado mientras no estábamos suscritos se perdió
+                self.clear()
+                log.info("Caché de devices: invalidación vía Redis activa")
+                for msg in pubsub.listen():
+                    try:
+                        doc = json.loads(msg["data"])
+                        self.invalidate(doc.get("token"), doc.get("external_ids") or (), publish=False)
+                    except Exception as e:
+                        log.warning("Mensaje de invalidación inválido: %s", e)
+            except Exception as e:
+                log.warning("Suscripción Redis de la caché de devices caída: %s (reintento en 5 s)", e)
+                time.sleep(5.0)
+
+    def stats(self) -> Dict[str, object]:
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "entries": len(self._data),
+            "max_size": self.max_size,
+            "ttl_s": self.ttl,
+            "negative_ttl_s": self.negative_ttl,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.negative_hits) / lookups, 4) if lookups else None,
+            "invalidations": self.invalidations,
+            "redis": self._listener is not None,
+        }
+
+
+_COLUMNS = (Device.id, Device.tenant_id, Device.token, Device.external_id)
+
+
+def _key(token: Optional[str], external_id: Optional[str]) -> _Key:
+    return ("token", token) if token else ("ext", external_id)  # type: ignore[return-value]
+
+
+def _select_one(key: _Key):
+    kind, value = key
+    col = Device.token if kind == "token" else Device.external_id
+    return select(*_COLUMNS).where(col == value).limit(1)
+
+
+def _select_many(external_ids: List[str]):
+    return select(*_COLUMNS).where(Device.external_id.in_(external_ids))
+
+
+def _match(
+    ref: Optional[DeviceRef], token: Optional[str], external_id: Optional[str], tenant_id: Optional[int]
+) -> Optional[DeviceRef]:
+    """Aplica los filtros que no forman parte de la clave (ambas credenciales, tenant)."""
+    if ref is None:
+        return None
+    if token and external_id and ref.external_id != external_id:
+        return None
+    if tenant_id is not None and ref.tenant_id != tenant_id:
+        return None
+    return ref
+
+
+device_cache = DeviceCache.from_env()
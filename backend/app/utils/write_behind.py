@@ -0,0 +1,533 @@
+"""
+Ingesta write-behind (opcional, INGEST_WRITE_BEHIND=1).
+
+Las rutas de ingesta validan, normalizan y encolan las filas y responden 202
+sin esperar el commit; drainers en segundo plano las escriben por lotes
+(COPY + commit por lote).
+
+- Cola: Redis Streams con WRITE_BEHIND_REDIS_URL (durable: sobrevive a un
+  reinicio del API). Sin Redis, una cola en memoria del proceso: sirve para
+  desarrollo / un solo proceso, lo encolado se pierde si el proceso muere.
+- Shards: device_id % WRITE_BEHIND_SHARDS. Cada shard lo drena un solo
+  drainer a la vez (con Redis, lease por shard entre procesos del API): las
+  filas de un device se escriben en el orden en que se encolaron.
+- Entrega al menos una vez: si el proceso cae entre el commit y el XACK, el
+  lote se vuelve a escribir al retomar el shard.
+- Errores de conexión: el lote se reintenta con backoff. Errores de datos
+  (FK de un device borrado, JSON inválido): el lote se reintenta entrada por
+  entrada y las que siguen fallando van a dead-letter.
+- Backpressure: sobre WRITE_BEHIND_MAX_DEPTH entradas pendientes, enqueue
+  lanza QueueFull (503 en las rutas).
+- Métricas: `stats()` (JSON) y `prometheus_text()` (GET /metrics):
+  profundidad y lag por shard, filas encoladas / drenadas, errores.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy.exc import InterfaceError, OperationalError, TimeoutError as PoolTimeout
+
+# Redis opcional (sin él, cola local en memoria)
+try:
+    import redis.asyncio as aioredis  # type: ignore
+except Exception:
+    aioredis = None  # type: ignore
+
+# El COPY va por la conexión psycopg cruda: sus errores no llegan envueltos por SQLAlchemy
+try:
+    import psycopg  # type: ignore
+except Exception:
+    psycopg = None  # type: ignore
+
+log = logging.getLogger("ingest.write_behind")
+
+Row = Tuple[datetime, str]  # ts, data JSON
+TelemetryRow = Tuple[int, int, datetime, str]  # tenant_id, device_id, ts, data JSON
+Writer = Callable[[Any, List[TelemetryRow]], Awaitable[None]]
+
+_TRANSIENT: Tuple[type, ...] = (OperationalError, InterfaceError, PoolTimeout, OSError, asyncio.TimeoutError)
+if psycopg is not None:
+    _TRANSIENT += (psycopg.OperationalError, psycopg.InterfaceError)
+
+
+def _env_flag(name: str, default: str = "0") -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes", "on")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Entry(NamedTuple):
+    id: Any  # id del stream (Redis) o secuencia local
+    tenant_id: int
+    device_id: int
+    enqueued: float  # epoch s
+    rows: List[Row]
+
+
+# -------------------------------------------------------------------
+# Cola local (en memoria, no durable)
+# -------------------------------------------------------------------
+class _LocalQueue:
+    kind = "local"
+    durable = False
+
+    def __init__(self, shards: int) -> None:
+        self._q: List[Deque[Entry]] = [deque() for _ in range(shards)]
+        self._ev = [asyncio.Event() for _ in range(shards)]
+        self._seq = itertools.count(1)
+        self.dead_letters: Deque[Tuple[Entry, str]] = deque(maxlen=1000)
+
+    async def add(self, shard: int, tenant_id: int, device_id: int, rows: List[Row]) -> None:
+        self._q[shard].append(Entry(next(self._seq), tenant_id, device_id, time.time(), rows))
+        self._ev[shard].set()
+
+    async def acquire(self, shard: int) -> bool:
+        return True
+
+    async def read(self, shard: int, count: int, block_s: float) -> List[Entry]:
+        """Las primeras `count` entradas sin sacarlas (salen con ack)."""
+        q = self._q[shard]
+        if not q:
+            ev = self._ev[shard]
+            ev.clear()
+            try:
+                await asyncio.wait_for(ev.wait(), block_s)
+            except asyncio.TimeoutError:
+                return []
+        return list(itertools.islice(q, count))
+
+    async def ack(self, shard: int, entries: Sequence[Entry]) -> None:
+        # un solo drainer por shard: lo leído es siempre la cabeza de la cola
+        q = self._q[shard]
+        for _ in entries:
+            q.popleft()
+
+    async def dead(self, shard: int, entry: Entry, error: str) -> None:
+        self.dead_letters.append((entry, error))
+        await self.ack(shard, (entry,))
+
+    def retry(self, shard: int) -> None:
+        pass
+
+    async def depth(self) -> List[Tuple[int, Optional[float]]]:
+        return [(len(q), q[0].enqueued if q else None) for q in self._q]
+
+    async def close(self) -> None:
+        pass
+
+
+# -------------------------------------------------------------------
+# Redis Streams (durable, varios procesos)
+# -------------------------------------------------------------------
+# Toma o renueva el lease del shard si está libre o ya es nuestro
+_LEASE_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+if redis.call('set', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 1
+end
+return 0
+"""
+
+_RELEASE_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class _RedisQueue:
+    kind = "redis"
+    durable = True
+    GROUP = "drainers"
+    # un solo consumidor lógico por shard: el dueño del lease; quien lo retoma
+    # relee lo pendiente (entregado y sin ack) del dueño anterior
+    CONSUMER = "drainer"
+
+    def __init__(self, url: str, shards: int, prefix: str, lease_ttl: float) -> None:
+        self._r = aioredis.Redis.from_url(url)
+        self.prefix = prefix
+        self.lease_ttl = lease_ttl
+        self._owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._shards = shards
+        self._lease_until = [0.0] * shards
+        self._recovering = [True] * shards
+        self._groups: set = set()
+
+    def _key(self, shard: int) -> str:
+        return f"{self.prefix}:{shard}"
+
+    async def add(self, shard: int, tenant_id: int, device_id: int, rows: List[Row]) -> None:
+        # json.dumps nunca deja saltos de línea sin escapar: "\n" separa filas sin re-serializar
+        await self._r.xadd(self._key(shard), {
+            "t": tenant_id,
+            "d": device_id,
+            "ts": "\n".join(ts.isoformat() for ts, _ in rows),
+            "data": "\n".join(data for _, data in rows),
+        })
+
+    async def acquire(self, shard: int) -> bool:
+        now = time.monotonic()
+        if now < self._lease_until[shard] - self.lease_ttl * 2 / 3:
+            return True  # renovado hace menos de ttl/3
+        ok = await self._r.eval(_LEASE_LUA, 1, f"{self.prefix}:lease:{shard}", self._owner, int(self.lease_ttl * 1000))
+        if not ok:
+            self._lease_until[shard] = 0.0
+            return False
+        if self._lease_until[shard] < now:
+            self._recovering[shard] = True  # recién tomado: primero lo pendiente
+            log.info("Write-behind: shard %d tomado por %s", shard, self._owner)
+        self._lease_until[shard] = now + self.lease_ttl
+        return True
+
+    async def _ensure_group(self, key: str) -> None:
+        if key in self._groups:
+            return
+        try:
+            await self._r.xgroup_create(key, self.GROUP, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._groups.add(key)
+
+    async def read(self, shard: int, count: int, block_s: float) -> List[Entry]:
+        key = self._key(shard)
+        await self._ensure_group(key)
+        if self._recovering[shard]:
+            res = await self._r.xreadgroup(self.GROUP, self.CONSUMER, {key: "0"}, count=count)
+            entries = _decode(res)
+            if entries:
+                return entries
+            self._recovering[shard] = False
+        res = await self._r.xreadgroup(self.GROUP, self.CONSUMER, {key: ">"}, count=count, block=int(block_s * 1000))
+        return _decode(res)
+
+    async def ack(self, shard: int, entries: Sequence[Entry]) -> None:
+        ids = [e.id for e in entries]
+        key = self._key(shard)
+        async with self._r.pipeline(transaction=False) as p:
+            p.xack(key, self.GROUP, *ids)
+            p.xdel(key, *ids)
+            await p.execute()
+
+    async def dead(self, shard: int, entry: Entry, error: str) -> None:
+        await self._r.xadd(f"{self.prefix}:dead", {
+            "t": entry.tenant_id,
+            "d": entry.device_id,
+            "ts": "\n".join(ts.isoformat() for ts, _ in entry.rows),
+            "data": "\n".join(data for _, data in entry.rows),
+            "error": error[:500],
+        }, maxlen=10000, approximate=True)
+        await self.ack(shard, (entry,))
+
+    def retry(self, shard: int) -> None:
+        # lo entregado y sin ack se relee desde el PEL
+        self._recovering[shard] = True
+
+    async def depth(self) -> List[Tuple[int, Optional[float]]]:
+        # lo confirmado se borra (XDEL): XLEN = pendiente; el id más antiguo trae su hora de encolado
+        async with self._r.pipeline(transaction=False) as p:
+            for shard in range(self._shards):
+                p.xlen(self._key(shard))
+                p.xrange(self._key(shard), count=1)
+            res = await p.execute()
+        out: List[Tuple[int, Optional[float]]] = []
+        for n, first in zip(res[::2], res[1::2]):
+            out.append((int(n), _id_time(first[0][0]) if first else None))
+        return out
+
+    async def close(self) -> None:
+        for shard in range(self._shards):
+            try:
+                await self._r.eval(_RELEASE_LUA, 1, f"{self.prefix}:lease:{shard}", self._owner)
+            except Exception:
+                pass
+        await self._r.aclose()
+
+
+def _id_time(stream_id) -> float:
+    if isinstance(stream_id, bytes):
+        stream_id = stream_id.decode()
+    return int(stream_id.split("-", 1)[0]) / 1000.0
+
+
+def _decode(res) -> List[Entry]:
+    entries: List[Entry] = []
+    for _key, items in res or ():
+        for sid, f in items:
+            try:
+                ts = f[b"ts"].decode().split("\n")
+                data = f[b"data"].decode().split("\n")
+                rows = [(datetime.fromisoformat(t), d) for t, d in zip(ts, data)]
+                entries.append(Entry(sid, int(f[b"t"]), int(f[b"d"]), _id_time(sid), rows))
+            except Exception as e:
+                # entrada ilegible (o borrada): se confirma sin escribir
+                log.error("Write-behind: entrada %s ilegible, se descarta: %r", sid, e)
+                entries.append(Entry(sid, 0, 0, _id_time(sid), []))
+    return entries
+
+
+# -------------------------------------------------------------------
+# Encolado + drainers
+# -------------------------------------------------------------------
+class WriteBehind:
+    def __init__(self) -> None:
+        self.enabled = _env_flag("INGEST_WRITE_BEHIND")
+        self.shards = max(1, int(os.getenv("WRITE_BEHIND_SHARDS", "4")))
+        self.batch_entries = int(os.getenv("WRITE_BEHIND_BATCH_ENTRIES", "500"))
+        self.batch_rows = int(os.getenv("WRITE_BEHIND_BATCH_ROWS", "5000"))
+        self.max_depth = int(os.getenv("WRITE_BEHIND_MAX_DEPTH", "200000"))
+        self.redis_url = os.getenv("WRITE_BEHIND_REDIS_URL", "")
+        self.prefix = os.getenv("WRITE_BEHIND_PREFIX", "ingest:wb")
+        self.lease_ttl = float(os.getenv("WRITE_BEHIND_LEASE_TTL", "15"))
+        self._queue: Any = None
+        self._writer: Optional[Writer] = None
+        self._session_factory: Any = None
+        self._tasks: List[asyncio.Task] = []
+        self._depth = [0] * self.shards
+        self._oldest: List[Optional[float]] = [None] * self.shards
+        # métricas
+        self.enqueued_entries = 0
+        self.enqueued_rows = 0
+        self.drained_entries = 0
+        self.drained_rows = 0
+        self.batches = 0
+        self.errors = 0
+        self.dead_letters = 0
+        self.rejected = 0
+        self.last_batch: Dict[str, Any] = {}
+
+    @property
+    def active(self) -> bool:
+        return self._queue is not None
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+    async def start(self, writer: Writer, session_factory: Any) -> None:
+        """Crea la cola y lanza un drainer por shard; no hace nada si el modo está apagado."""
+        if not self.enabled or self._queue is not None:
+            return
+        if self.redis_url and aioredis is None:
+            log.warning("WRITE_BEHIND_REDIS_URL definido pero el paquete redis no está instalado: cola local")
+        if self.redis_url and aioredis is not None:
+            self._queue = _RedisQueue(self.redis_url, self.shards, self.prefix, self.lease_ttl)
+        else:
+            self._queue = _LocalQueue(self.shards)
+        self._writer = writer
+        self._session_factory = session_factory
+        self._tasks = [asyncio.create_task(self._drain(s), name=f"write-behind-{s}") for s in range(self.shards)]
+        self._tasks.append(asyncio.create_task(self._monitor(), name="write-behind-monitor"))
+        log.info("Write-behind activo: cola %s, %d shards", self._queue.kind, self.shards)
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Detiene los drainers; con la cola local antes intenta vaciarla (hasta `timeout`)."""
+        q = self._queue
+        if q is None:
+            return
+        if not q.durable:
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline and any(n for n, _ in await q.depth()):
+                await asyncio.sleep(0.05)
+            left = sum(n for n, _ in await q.depth())
+            if left:
+                log.error("Write-behind: %d entradas sin escribir se pierden al detener (cola local)", left)
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await q.close()
+        self._queue = None
+
+    # ------------------------------------------------------------------
+    # Encolado
+    # ------------------------------------------------------------------
+    async def enqueue(self, tenant_id: int, device_id: int, rows: Sequence[Row]) -> None:
+        """Encola las filas de un device (en orden); QueueFull si el shard está sobre su cupo."""
+        if not rows:
+            return
+        shard = device_id % self.shards
+        if self._depth[shard] >= max(1, self.max_depth // self.shards):
+            self.rejected += 1
+            raise QueueFull(f"Cola write-behind llena (shard {shard})")
+        await self._queue.add(shard, tenant_id, device_id, list(rows))
+        self._depth[shard] += 1
+        self.enqueued_entries += 1
+        self.enqueued_rows += len(rows)
+
+    # ------------------------------------------------------------------
+    # Drenado
+    # ------------------------------------------------------------------
+    async def _drain(self, shard: int) -> None:
+        q = self._queue
+        backoff = 0.5
+        while True:
+            try:
+                if not await q.acquire(shard):
+                    await asyncio.sleep(q.lease_ttl / 3)  # otro proceso tiene el shard
+                    continue
+                entries = await q.read(shard, self.batch_entries, 1.0)
+                for chunk in self._chunks(entries):
+                    await self._write(shard, chunk)
+                backoff = 0.5
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                log.error("Write-behind shard %d: %r (reintento en %.1fs)", shard, e, backoff)
+                q.retry(shard)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    def _chunks(self, entries: List[Entry]):
+        """Entradas consecutivas hasta ~batch_rows filas por commit."""
+        chunk: List[Entry] = []
+        rows = 0
+        for e in entries:
+            if chunk and rows + len(e.rows) > self.batch_rows:
+                yield chunk
+                chunk, rows = [], 0
+            chunk.append(e)
+            rows += len(e.rows)
+        if chunk:
+            yield chunk
+
+    async def _commit(self, rows: List[TelemetryRow]) -> None:
+        if not rows:
+            return
+        async with self._session_factory() as db:
+            await self._writer(db, rows)
+            await db.commit()
+
+    async def _write(self, shard: int, entries: List[Entry]) -> None:
+        t0 = time.perf_counter()
+        rows = [(e.tenant_id, e.device_id, ts, data) for e in entries for ts, data in e.rows]
+        try:
+            await self._commit(rows)
+        except _TRANSIENT:
+            raise
+        except Exception as e:
+            self.errors += 1
+            log.warning("Write-behind shard %d: lote de %d entradas falló (%r); se reintenta por entrada",
+                        shard, len(entries), e)
+            await self._isolate(shard, entries)
+            return
+        await self._queue.ack(shard, entries)
+        self._drained(shard, entries, len(rows), t0)
+
+    async def _isolate(self, shard: int, entries: List[Entry]) -> None:
+        for entry in entries:
+            t0 = time.perf_counter()
+            try:
+                await self._commit([(entry.tenant_id, entry.device_id, ts, data) for ts, data in entry.rows])
+            except _TRANSIENT:
+                raise
+            except Exception as e:
+                self.dead_letters += 1
+                log.error("Write-behind: device_id=%s %d filas a dead-letter: %r", entry.device_id, len(entry.rows), e)
+                await self._queue.dead(shard, entry, repr(e))
+                self._depth[shard] = max(0, self._depth[shard] - 1)
+                continue
+            await self._queue.ack(shard, (entry,))
+            self._drained(shard, (entry,), len(entry.rows), t0)
+
+    def _drained(self, shard: int, entries: Sequence[Entry], n_rows: int, t0: float) -> None:
+        now = time.time()
+        self._depth[shard] = max(0, self._depth[shard] - len(entries))
+        self.drained_entries += len(entries)
+        self.drained_rows += n_rows
+        self.batches += 1
+        self.last_batch = {
+            "shard": shard,
+            "entries": len(entries),
+            "rows": n_rows,
+            "write_ms": round((time.perf_counter() - t0) * 1000.0, 2),
+            "lag_s": round(now - entries[0].enqueued, 3),
+        }
+
+    async def _monitor(self) -> None:
+        """Refresca profundidad / entrada más antigua por shard (métricas y backpressure)."""
+        while True:
+            try:
+                for shard, (n, oldest) in enumerate(await self._queue.depth()):
+                    self._depth[shard] = n
+                    self._oldest[shard] = oldest
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning("Write-behind: no se pudo leer la profundidad de la cola: %r", e)
+            await asyncio.sleep(1.0)
+
+    # ------------------------------------------------------------------
+    # Métricas
+    # ------------------------------------------------------------------
+    def _lags(self) -> List[float]:
+        now = time.time()
+        return [max(0.0, now - o) if o is not None else 0.0 for o in self._oldest]
+
+    def stats(self) -> Dict[str, Any]:
+        lags = self._lags()
+        return {
+            "enabled": self.enabled,
+            "backend": self._queue.kind if self._queue is not None else None,
+            "durable": self._queue.durable if self._queue is not None else None,
+            "shards": self.shards,
+            "depth": sum(self._depth),
+            "lag_s": round(max(lags), 3) if lags else 0.0,
+            "per_shard": [
+                {"shard": s, "depth": self._depth[s], "lag_s": round(lags[s], 3)} for s in range(self.shards)
+            ],
+            "max_depth": self.max_depth,
+            "enqueued_entries": self.enqueued_entries,
+            "enqueued_rows": self.enqueued_rows,
+            "drained_entries": self.drained_entries,
+            "drained_rows": self.drained_rows,
+            "batches": self.batches,
+            "errors": self.errors,
+            "dead_letters": self.dead_letters,
+            "rejected": self.rejected,
+            "last_batch": self.last_batch,
+        }
+
+    def prometheus_text(self) -> str:
+        lags = self._lags()
+        lines: List[str] = []
+
+        def metric(name: str, kind: str, help_: str, samples) -> None:
+            lines.append(f"# HELP {name} {help_}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{labels} {value}")
+
+        shards = range(self.shards)
+        metric("ingest_write_behind_depth", "gauge", "Entradas pendientes en la cola write-behind",
+               [(f'{{shard="{s}"}}', self._depth[s]) for s in shards])
+        metric("ingest_write_behind_lag_seconds", "gauge", "Antigüedad de la entrada pendiente más antigua",
+               [(f'{{shard="{s}"}}', round(lags[s], 3)) for s in shards])
+        for name, help_, value in (
+            ("ingest_write_behind_enqueued_rows_total", "Filas encoladas", self.enqueued_rows),
+            ("ingest_write_behind_drained_rows_total", "Filas escritas en telemetry", self.drained_rows),
+            ("ingest_write_behind_batches_total", "Lotes escritos (COPY + commit)", self.batches),
+            ("ingest_write_behind_errors_total", "Lotes fallidos", self.errors),
+            ("ingest_write_behind_dead_letters_total", "Entradas enviadas a dead-letter", self.dead_letters),
+            ("ingest_write_behind_rejected_total", "Requests rechazadas por cola llena", self.rejected),
+        ):
+            metric(name, "counter", help_, [("", value)])
+        return "\n".join(lines) + "\n"
+
+
+write_behind = WriteBehind()
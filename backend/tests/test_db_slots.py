@@ -0,0 +1,40 @@
+import asyncio
+
+from app.database import _FifoSlots
+
+
+def test_slots_are_handed_off_in_arrival_order():
+    async def scenario():
+        slots = _FifoSlots(1)
+        order = []
+
+        async def worker(n):
+            async with slots:
+                order.append(n)
+                await asyncio.sleep(0)
+
+        await slots.__aenter__()  # ocupa el único cupo
+        tasks = [asyncio.create_task(worker(n)) for n in range(3)]
+        await asyncio.sleep(0)
+        await slots.__aexit__(None, None, None)
+        # una request que llega justo al liberar no se adelanta a la fila
+        late = asyncio.create_task(worker("late"))
+        await asyncio.gather(*tasks, late)
+        return order
+
+    assert asyncio.run(scenario()) == [0, 1, 2, "late"]
+
+
+def test_cancelled_waiter_does_not_leak_slot():
+    async def scenario():
+        slots = _FifoSlots(1)
+        await slots.__aenter__()
+        waiter = asyncio.create_task(slots.__aenter__())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        await slots.__aexit__(None, None, None)
+        # el cupo volvió libre: se toma sin esperar
+        await asyncio.wait_for(slots.__aenter__(), timeout=1)
+
+    asyncio.run(scenario())
@@ -0,0 +1,65 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import Device, Tenant
+from app.utils.device_cache import DeviceCache
+
+
+@pytest.fixture()
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[Tenant.__table__, Device.__table__])
+    session = sessionmaker(bind=engine)()
+    session.add(Tenant(id=1, name="t1", slug="t1"))
+    session.add(Device(id=10, tenant_id=1, name="d", external_id="350000000000001", token="tok-1"))
+    session.commit()
+    yield session
+    session.close()
+
+
+def test_resolve_caches_both_keys(db):
+    cache = DeviceCache()
+    ref = cache.resolve(db, token="tok-1")
+    assert (ref.id, ref.tenant_id) == (10, 1)
+    assert cache.misses == 1
+    # la otra clave del mismo device ya quedó cargada
+    assert cache.resolve(db, external_id="350000000000001") == ref
+    assert cache.hits == 1
+    assert cache.resolve(db, token="tok-1", external_id="otro") is None
+    assert cache.resolve(db, token="tok-1", tenant_id=2) is None
+
+
+def test_negative_entry_until_invalidated(db):
+    cache = DeviceCache()
+    assert cache.resolve(db, external_id="350000000000002") is None
+    db.add(Device(id=11, tenant_id=1, name="n", external_id="350000000000002", token="tok-2"))
+    db.commit()
+    assert cache.resolve(db, external_id="350000000000002") is None
+    assert cache.negative_hits == 1
+    cache.invalidate(external_ids=["350000000000002"])
+    assert cache.resolve(db, external_id="350000000000002").id == 11
+
+
+def test_invalidate_drops_sibling_key(db):
+    cache = DeviceCache()
+    cache.resolve(db, token="tok-1")
+    cache.invalidate(external_ids=["350000000000001"])
+    assert cache.stats()["entries"] == 0
+
+
+def test_resolve_many_single_query_for_misses(db):
+    cache = DeviceCache()
+    out = cache.resolve_many(db, ["350000000000001", "999"])
+    assert set(out) == {"350000000000001"}
+    out = cache.resolve_many(db, ["350000000000001", "999"])
+    assert set(out) == {"350000000000001"}
+    assert cache.hits == 1 and cache.negative_hits == 1
+
+
+def test_lru_evicts_oldest(db):
+    cache = DeviceCache(max_size=1)
+    cache.resolve(db, external_id="a")
+    cache.resolve(db, external_id="b")
+    assert cache.stats()["entries"] == 1
@@ -0,0 +1,54 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from app.routers.ingest_teltonika import GPS, TeltonikaIn, normalize_batch
+
+
+def test_normalize_batch_matches_single_blob():
+    gps = {"lat": -33.4, "lon": -70.6, "speed": 12, "sat": 9}
+    rows = normalize_batch([{"ts": 1700000000000, "gps": gps, "io": {"239": 1}}])
+    assert len(rows) == 1
+    ts, data = rows[0]
+    assert ts == datetime.fromtimestamp(1700000000, tz=timezone.utc)
+    blob = json.loads(data)
+    assert blob["gps"] == GPS(**gps).dict()
+    assert blob["io"]
+
+
+def test_normalize_batch_ts_fallbacks():
+    rows = normalize_batch(
+        [{"io": {}}, {"ts": "2025-10-08T12:00:00Z"}, {"ts": None}],
+        default_ts=1700000000000,
+    )
+    assert rows[0][0] == rows[2][0] == datetime.fromtimestamp(1700000000, tz=timezone.utc)
+    assert rows[1][0] == datetime(2025, 10, 8, 12, 0, tzinfo=timezone.utc)
+    assert json.loads(rows[0][1]) == {}
+
+
+@pytest.mark.parametrize("gps", [{"lat": "x", "lon": 1}, {"lon": 1}])
+def test_normalize_batch_rejects_bad_gps(gps):
+    with pytest.raises(ValueError, match=r"batch\[1\]"):
+        normalize_batch([{"io": {}}, {"gps": gps}])
+
+
+@pytest.mark.parametrize("ts", ["ayer", "2025-13-45T00:00:00Z", {"ms": 1}, 10**20])
+def test_normalize_batch_rejects_bad_ts(ts):
+    with pytest.raises(ValueError, match=r"batch\[1\]\.ts"):
+        normalize_batch([{"io": {}}, {"ts": ts}], default_ts=1700000000000)
+    errors = []
+    rows = normalize_batch([{"io": {}}, {"ts": ts}], errors=errors)
+    assert len(rows) == 1 and [e.index for e in errors] == [1]
+
+
+def test_single_rejects_bad_ts():
+    with pytest.raises(ValueError):
+        TeltonikaIn(external_id="x", ts="no es fecha")
+
+
+def test_normalize_batch_collects_errors():
+    errors = []
+    rows = normalize_batch([{"io": {}}, {"gps": {"lon": 1}}, {"io": {}}], errors=errors)
+    assert len(rows) == 2
+    assert [e.index for e in errors] == [1]
@@ -0,0 +1,35 @@
+import pytest
+
+msgpack = pytest.importorskip("msgpack")
+
+from app.routers.ingest_teltonika import unpack_bulk
+
+
+def test_unpack_bulk_roundtrip():
+    body = msgpack.packb({"items": [
+        {"imei": "350000000000001", "codec": 0x8E, "ts_ms": [1700000000000, 1700000001000],
+         "data": ['{"gps":{"lat":-33.4},"io":{},"rejected_io":{}}', '{"gps":null,"io":{},"rejected_io":{}}']},
+        {"imei": "350000000000002", "codec": 8, "ts_ms": [], "data": []},
+    ]})
+    items = unpack_bulk(body)
+    assert [it["imei"] for it in items] == ["350000000000001", "350000000000002"]
+    assert items[0]["ts_ms"][1] == 1700000001000
+    assert items[0]["data"][0].startswith('{"gps"')
+    assert items[1]["data"] == []
+
+
+@pytest.mark.parametrize("doc", [
+    {"nope": []},
+    {"items": [{"codec": 8, "ts_ms": [], "data": []}]},
+    {"items": [{"imei": "1", "ts_ms": [1, 2], "data": ["{}"]}]},
+    {"items": [{"imei": "1", "ts_ms": [1.5], "data": ["{}"]}]},
+    {"items": [{"imei": "1", "ts_ms": [1], "data": [{"io": {}}]}]},
+])
+def test_unpack_bulk_rejects_bad_shapes(doc):
+    with pytest.raises(ValueError):
+        unpack_bulk(msgpack.packb(doc))
+
+
+def test_unpack_bulk_rejects_garbage():
+    with pytest.raises(ValueError):
+        unpack_bulk(b"\xc1not-msgpack")
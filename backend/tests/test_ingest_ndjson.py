@@ -0,0 +1,40 @@
+import asyncio
+import gzip
+
+import pytest
+
+from app.routers.ingest_teltonika import ndjson_lines
+
+
+def _collect(chunks, **kw):
+    async def gen():
+        for c in chunks:
+            yield c
+
+    async def run():
+        return [x async for x in ndjson_lines(gen(), **kw)]
+
+    return asyncio.run(run())
+
+
+def _split(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+BODY = b'{"ts": 1}\n\n{"ts": 2}\r\n  \n{"ts": 3}'
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 1024])
+def test_ndjson_lines_plain(size):
+    assert _collect(_split(BODY, size)) == [(1, b'{"ts": 1}'), (3, b'{"ts": 2}'), (5, b'{"ts": 3}')]
+
+
+@pytest.mark.parametrize("size", [1, 5, 64])
+def test_ndjson_lines_gzip_multimember(size):
+    data = gzip.compress(BODY[:14]) + gzip.compress(BODY[14:])
+    assert _collect(_split(data, size), gzip=True) == _collect([BODY])
+
+
+def test_ndjson_lines_max_line():
+    with pytest.raises(ValueError, match="línea 2"):
+        _collect([b"{}\n", b"x" * 100], max_line=50)
@@ -0,0 +1,36 @@
+from pathlib import Path
+
+import pytest
+
+from app.parsers.teltonika import io_registry
+from app.parsers.teltonika.io_registry import profile
+
+TCP_COPY = Path(__file__).resolve().parents[2] / "services" / "teltonika-tcp" / "io_registry.py"
+
+
+def test_lookups():
+    p = profile("fmc650")
+    assert p.name(239) == "Ignition"
+    assert p.id("External Voltage") == 66
+    assert p.snake[35] == "engine_rpm"
+    with pytest.raises(KeyError):
+        profile("FMB920")
+
+
+def test_normalize_accepts_int_and_str_keys():
+    mapped, rejected = profile().normalize({"239": 1, 66: 12500, "0024": 50, "9999": "xx", "abc": 2})
+    assert mapped == {"Ignition": 1, "External Voltage": 12500, "Speed": 50}
+    assert rejected == {"9999": "xx", "abc": 2}
+    assert profile().normalize(None) == ({}, {})
+
+
+def test_normalize_batch_matches_normalize():
+    p = profile()
+    ios = [{"239": 1, "66": 12000}, {"239": 0, "66": 11000}, {"35": 900, "1": 1}, None, {"239": 1, "66": 13000}]
+    assert p.normalize_batch(ios) == [p.normalize(io) for io in ios]
+    assert p.normalize_batch(ios, snake=True)[2] == ({"engine_rpm": 900, "digital_input_1": 1}, {})
+
+
+@pytest.mark.skipif(not TCP_COPY.exists(), reason="services/teltonika-tcp no está en el árbol")
+def test_tcp_copy_in_sync():
+    assert TCP_COPY.read_bytes() == Path(io_registry.__file__).read_bytes()
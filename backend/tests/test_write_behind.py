@@ -0,0 +1,108 @@
+import asyncio
+from datetime import datetime, timezone
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.utils.write_behind import WriteBehind
+
+TS = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeDB:
+    """Sesión mínima: el writer acumula y commit() publica en `store`."""
+
+    def __init__(self, store, fail):
+        self.store, self.fail, self.pending = store, fail, []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.pending = []
+
+    async def commit(self):
+        self.store.extend(self.pending)
+
+
+def make(monkeypatch, fail=lambda rows: None):
+    monkeypatch.setenv("INGEST_WRITE_BEHIND", "1")
+    monkeypatch.setenv("WRITE_BEHIND_SHARDS", "2")
+    monkeypatch.delenv("WRITE_BEHIND_REDIS_URL", raising=False)
+    wb = WriteBehind()
+    store = []
+
+    async def writer(db, rows):
+        fail(rows)
+        db.pending.extend(rows)
+
+    return wb, store, writer, (lambda: FakeDB(store, fail))
+
+
+async def _drain(wb, store, n):
+    for _ in range(200):
+        if len(store) >= n and wb.stats()["depth"] == 0:
+            return
+        await asyncio.sleep(0.01)
+
+
+def test_rows_keep_per_device_order(monkeypatch):
+    wb, store, writer, factory = make(monkeypatch)
+
+    async def scenario():
+        await wb.start(writer, factory)
+        for i in range(50):
+            await wb.enqueue(1, i % 3, [(TS, f'{{"n": {i}}}')])
+        await _drain(wb, store, 50)
+        await wb.stop()
+
+    asyncio.run(scenario())
+    assert len(store) == 50
+    for dev in range(3):
+        seq = [int(data[6:-1]) for _, d, _, data in store if d == dev]
+        assert seq == sorted(seq)
+    assert wb.stats()["drained_rows"] == 50
+
+
+def test_bad_entry_goes_to_dead_letter(monkeypatch):
+    def fail(rows):
+        if any(d == 99 for _, d, _, _ in rows):
+            raise ValueError("fk")
+
+    wb, store, writer, factory = make(monkeypatch, fail)
+
+    async def scenario():
+        await wb.start(writer, factory)
+        await wb.enqueue(1, 1, [(TS, "{}")])
+        await wb.enqueue(1, 99, [(TS, "{}")])
+        await wb.enqueue(1, 3, [(TS, "{}")])
+        await _drain(wb, store, 2)
+        await wb.stop()
+
+    asyncio.run(scenario())
+    assert sorted(d for _, d, _, _ in store) == [1, 3]
+    assert wb.dead_letters == 1
+
+
+def test_transient_error_is_retried(monkeypatch):
+    calls = []
+
+    def fail(rows):
+        calls.append(rows)
+        if len(calls) == 1:
+            raise ConnectionError("db caída")
+
+    wb, store, writer, factory = make(monkeypatch, fail)
+
+    async def scenario():
+        await wb.start(writer, factory)
+        await wb.enqueue(1, 1, [(TS, "{}"), (TS, "{}")])
+        await _drain(wb, store, 2)
+        await wb.stop()
+
+    asyncio.run(scenario())
+    assert len(store) == 2 and wb.errors == 1 and wb.dead_letters == 0
+
+
+def test_metrics_requires_auth():
+    assert TestClient(app).get("/metrics").status_code == 401
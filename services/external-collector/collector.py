@@ -3,9 +3,12 @@ from typing import Any, Dict, List, Optional
 import requests
 from datetime import datetime, timezone
 
+import fastlog
+
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
-logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s [%(levelname)s] %(message)s")
+fastlog.setup(LOG_LEVEL, "%(asctime)s [%(levelname)s] %(message)s")
 log = logging.getLogger("collector")
+sampler = fastlog.Sampler()
 
 API_BASE = os.getenv("API_BASE", "http://api:8000")
 INGEST_URL = f"{API_BASE}/ingest/teltonika/ingest"
@@ -366,7 +369,9 @@ def process_source(src: Dict[str, Any], global_state: Dict[str, Any]):
                 _external_id = eval_expr(dev_external_id_expr, ctx)
 
             if not _external_id and not _token:
-                log.warning("[%s] Record sin external_id/token; descarto", src_id)
+                n = sampler.allow((src_id, "sin-id"))
+                if n is not None:
+                    log.warning("[%s] Record sin external_id/token; descarto%s", src_id, fastlog.suppressed_note(n))
                 continue
 
             dev_key = f"ext:{_external_id}" if _external_id else f"tok:{_token}"
@@ -388,9 +393,14 @@ def process_source(src: Dict[str, Any], global_state: Dict[str, Any]):
         try:
             r = requests.post(INGEST_URL, json=body, timeout=10)
             if r.status_code >= 300:
-                log.error("[%s] POST %s -> %s %s", src_id, INGEST_URL, r.status_code, r.text[:200])
+                n = sampler.allow((src_id, "post"))
+                if n is not None:
+                    log.error("[%s] POST %s -> %s %s%s", src_id, INGEST_URL, r.status_code, r.text[:200],
+                              fastlog.suppressed_note(n))
         except Exception as e:
-            log.exception("[%s] Error POST ingest: %s", src_id, e)
+            n = sampler.allow((src_id, "exc"))
+            if n is not None:
+                log.exception("[%s] Error POST ingest: %s%s", src_id, e, fastlog.suppressed_note(n))
 
     # persistir estado
     global_state[src_id] = source_state
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Logging para hot paths (mismo archivo en teltonika-tcp, mqtt-worker y
+external-collector: cada servicio se construye por separado).
+
+- `setup()`: el root logger escribe en una cola acotada (QueueHandler) y un
+  thread (QueueListener) formatea y escribe a stderr. El thread que loguea no
+  formatea ni hace I/O; si la cola se llena se descarta y se cuenta.
+- `Sampler`: límite por clave (IMEI, tópico, fuente) con token bucket; cuando
+  vuelve a dejar pasar informa cuántos se suprimieron.
+- `LazyHex`: el hex dump se arma sólo si el registro llega a formatearse (y
+  en el thread del listener).
+
+LOG_ASYNC=0 deja el logging síncrono de siempre.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Dict, Hashable, Optional, Tuple
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes", "on")
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que no formatea en el caller y descarta si la cola está llena."""
+
+    def __init__(self, q: "queue.Queue") -> None:
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # msg % args se resuelve en el listener (args de los hot paths son inmutables)
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup(level: str = "INFO", fmt: str = "%(levelname)s:%(name)s:%(message)s") -> Optional[_DroppingQueueHandler]:
+    """Configura el root logger; devuelve el QueueHandler (métrica `dropped`) o None si es síncrono.
+
+    Se puede llamar de nuevo (p.ej. en un worker tras fork: el thread del padre no existe en el hijo).
+    """
+    global _listener
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.setLevel(level)
+    out = logging.StreamHandler(sys.stderr)
+    out.setFormatter(logging.Formatter(fmt))
+
+    if not _env_flag("LOG_ASYNC", "1"):
+        root.addHandler(out)
+        return None
+
+    q: "queue.Queue" = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    handler = _DroppingQueueHandler(q)
+    root.addHandler(handler)
+    _listener = logging.handlers.QueueListener(q, out, respect_handler_level=False)
+    _listener.start()
+    return handler
+
+
+def stop() -> None:
+    """Vacía la cola y detiene el thread (al salir)."""
+    global _listener
+    if _listener is not None:
+        try:
+            _listener.stop()
+        except Exception:
+            pass
+        _listener = None
+
+
+atexit.register(stop)
+
+
+class Sampler:
+    """Token bucket por clave: `rate` registros/s con ráfagas de hasta `burst`."""
+
+    def __init__(self, rate: Optional[float] = None, burst: Optional[int] = None, max_keys: int = 50_000) -> None:
+        self.rate = float(os.getenv("LOG_SAMPLE_RATE", "0.2")) if rate is None else rate
+        self.burst = int(os.getenv("LOG_SAMPLE_BURST", "5")) if burst is None else burst
+        self.max_keys = max_keys
+        self._buckets: Dict[Hashable, Tuple[float, float, int]] = {}  # key -> (tokens, t, suprimidos)
+        self._lock = threading.Lock()
+        self.suppressed = 0
+
+    def allow(self, key: Hashable) -> Optional[int]:
+        """None si se suprime; si no, cuántos se suprimieron desde el último permitido."""
+        if self.rate <= 0:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            tokens, last, skipped = self._buckets.get(key, (float(self.burst), now, 0))
+            tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+            if tokens < 1.0:
+                self._buckets[key] = (tokens, now, skipped + 1)
+                self.suppressed += 1
+                return None
+            if key not in self._buckets and len(self._buckets) >= self.max_keys:
+                self._buckets.clear()
+            self._buckets[key] = (tokens - 1.0, now, 0)
+            return skipped
+
+
+def suppressed_note(n: Optional[int]) -> str:
+    return f" (+{n} suprimidos)" if n else ""
+
+
+class LazyHex:
+    """Hex de los primeros `limit` bytes, calculado recién al formatear."""
+
+    __slots__ = ("data", "limit")
+
+    def __init__(self, data, limit: int = 256) -> None:
+        self.data = data
+        self.limit = limit
+
+    def __str__(self) -> str:
+        return bytes(self.data[: self.limit]).hex()
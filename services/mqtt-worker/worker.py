@@ -2,6 +2,8 @@ import os, json, time, logging
 import requests
 import paho.mqtt.client as mqtt
 
+import fastlog
+
 # --- Config ---
 EMQX_HOST = os.getenv("EMQX_HOST", "emqx")
 EMQX_PORT = int(os.getenv("EMQX_PORT", "1883"))
@@ -15,11 +17,10 @@ API_BASE = os.getenv("API_BASE", "http://api:8000")
 INGEST_URL = f"{API_BASE}/ingest/http"
 REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "5.0"))
 
-logging.basicConfig(
-    level=os.getenv("LOG_LEVEL", "INFO"),
-    format="%(asctime)s %(levelname)s [mqtt-worker] %(message)s"
-)
+# logging en cola + thread y muestreo por tópico (ver fastlog.py)
+fastlog.setup(os.getenv("LOG_LEVEL", "INFO").upper(), "%(asctime)s %(levelname)s [mqtt-worker] %(message)s")
 log = logging.getLogger("mqtt-worker")
+sampler = fastlog.Sampler()
 
 def on_connect(client, userdata, flags, reason_code, properties=None):
     if reason_code == 0:
@@ -43,14 +44,20 @@ def on_message(client, userdata, msg):
         if isinstance(payload, dict) and "ts" in payload:
             body["ts"] = payload["ts"]
 
-        log.info("→ Ingest %s bytes topic=%s", len(msg.payload or b""), topic)
         r = requests.post(INGEST_URL, json=body, timeout=REQUEST_TIMEOUT)
         if r.status_code >= 300:
-            log.error("API %s -> %s %s", INGEST_URL, r.status_code, r.text[:300])
-        else:
-            log.info("✔ Ingest OK device_id=%s", r.json().get("device_id"))
+            n = sampler.allow(("error", topic))
+            if n is not None:
+                log.error("API %s -> %s %s topic=%s%s", INGEST_URL, r.status_code, r.text[:300], topic, fastlog.suppressed_note(n))
+        elif log.isEnabledFor(logging.INFO):
+            n = sampler.allow(topic)
+            if n is not None:
+                log.info("✔ Ingest OK %s bytes topic=%s device_id=%s%s", len(msg.payload or b""), topic,
+                         r.json().get("device_id"), fastlog.suppressed_note(n))
     except Exception as e:
-        log.exception("Error procesando mensaje: %s", e)
+        n = sampler.allow(("exc", msg.topic))
+        if n is not None:
+            log.exception("Error procesando mensaje topic=%s: %s%s", msg.topic, e, fastlog.suppressed_note(n))
 
 def build_client():
     client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Admisión de IMEI en el handshake.
+
+Sin esto cualquier equipo (mal configurado o ajeno) pasa el handshake y recién
+se descubre que no existe cuando la API responde que no hay device, después de
+gastar decode y HTTP en cada frame.
+
+- Caché en memoria IMEI -> (device_id, tenant_id) precargada desde
+  `devices.external_id` y refrescada de forma incremental (id > último visto).
+- Cada entrada vence a los `ttl` s (así se notan borrados / cambios de IMEI):
+  al vencer, el próximo handshake vuelve a consultar.
+- Caché negativa (IMEI desconocido) con TTL propio más corto y tope de
+  entradas (scanners con IMEIs aleatorios no hacen crecer la memoria).
+- Los misses se consultan en bloque: los handshakes que llegan dentro de
+  `lookup_window_ms` comparten una sola query (tormenta de reconexiones).
+- Si la DB no responde se admite igual (fail-open, se cuenta como
+  "unverified"): una caída de Postgres no debe desconectar a toda la flota.
+  Tras un error, los misses se admiten sin consultar durante `retry_after` s
+  (no se paga el timeout de conexión en cada handshake).
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+log = logging.getLogger("teltonika-tcp.admission")
+
+Device = Tuple[int, Optional[int]]  # (device_id, tenant_id)
+
+
+class AdmissionCache:
+    def __init__(
+        self,
+        db,
+        ttl: float = 600.0,
+        negative_ttl: float = 60.0,
+        refresh: float = 30.0,
+        lookup_window_ms: float = 20.0,
+        max_negative: int = 100_000,
+        retry_after: float = 10.0,
+    ) -> None:
+        self._db = db  # DbFallback (fetch_devices)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.refresh = refresh
+        self.window = max(0.0, lookup_window_ms) / 1000.0
+        self.max_negative = max_negative
+        self.retry_after = retry_after
+        self._down_until = 0.0
+        self._known: Dict[str, Tuple[Device, float]] = {}
+        self._unknown: Dict[str, float] = {}  # IMEI -> vence
+        self._max_id = 0
+        self._loaded = False
+        self._task: Optional[asyncio.Task] = None
+        self._waiting: Dict[str, List[asyncio.Future]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._lookups: set = set()
+        # métricas
+        self.admitted = 0
+        self.rejected = 0
+        self.unverified = 0  # admitidos sin poder consultar la DB
+        self.hits = 0
+        self.misses = 0
+        self.lookups = 0
+        self.lookup_errors = 0
+        self.refreshes = 0
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        tasks = [t for t in (self._task, *self._lookups) if t is not None]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    # ---------------------------------------------------------------
+    # Hot path
+    # ---------------------------------------------------------------
+    def check(self, imei: str) -> Optional[bool]:
+        """True/False si la caché sabe la respuesta; None => hay que consultar (resolve)."""
+        now = time.monotonic()
+        entry = self._known.get(imei)
+        if entry is not None and entry[1] > now:
+            self.hits += 1
+            self.admitted += 1
+            return True
+        neg = self._unknown.get(imei)
+        if neg is not None and neg > now:
+            self.hits += 1
+            self.rejected += 1
+            return False
+        self.misses += 1
+        if now < self._down_until:
+            self.unverified += 1
+            return True
+        return None
+
+    def resolve(self, imei: str) -> asyncio.Future:
+        """Future[bool] con la decisión; los misses de la ventana van en una sola query."""
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._waiting.setdefault(imei, []).append(fut)
+        if self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return fut
+
+    def _flush(self) -> None:
+        self._timer = None
+        waiting, self._waiting = self._waiting, {}
+        if waiting:
+            task = asyncio.create_task(self._lookup(waiting))
+            self._lookups.add(task)
+            task.add_done_callback(self._lookups.discard)
+
+    async def _lookup(self, waiting: Dict[str, List[asyncio.Future]]) -> None:
+        self.lookups += 1
+        try:
+            rows = await self._db.fetch_devices(list(waiting))
+        except Exception as e:
+            self.lookup_errors += 1
+            self._down_until = time.monotonic() + self.retry_after
+            log.warning("Admisión: no se pudo consultar devices (%d IMEIs), se admiten: %s", len(waiting), e)
+            self._settle(waiting, None)
+            return
+        self._put_rows(rows)
+        found = {ext for _id, ext, _tenant in rows}
+        now = time.monotonic()
+        for imei in waiting:
+            if imei not in found:
+                self._put_unknown(imei, now)
+        self._settle(waiting, found)
+
+    def _settle(self, waiting: Dict[str, List[asyncio.Future]], found: Optional[set]) -> None:
+        for imei, futs in waiting.items():
+            if found is None:
+                ok = True
+                self.unverified += len(futs)
+            elif imei in found:
+                ok = True
+                self.admitted += len(futs)
+            else:
+                ok = False
+                self.rejected += len(futs)
+            for fut in futs:
+                if not fut.done():
+                    fut.set_result(ok)
+
+    # ---------------------------------------------------------------
+    # Carga / refresco
+    # ---------------------------------------------------------------
+    def _put_rows(self, rows, advance: bool = False) -> None:
+        expires = time.monotonic() + self.ttl
+        for dev_id, ext, tenant_id in rows:
+            if not ext:
+                continue
+            self._known[ext] = ((dev_id, tenant_id), expires)
+            self._unknown.pop(ext, None)  # alta nueva: deja de estar en la caché negativa
+            # sólo el refresco mueve el cursor (una consulta puntual no garantiza ids previos)
+            if advance and dev_id > self._max_id:
+                self._max_id = dev_id
+
+    def _put_unknown(self, imei: str, now: float) -> None:
+        self._known.pop(imei, None)
+        unknown = self._unknown
+        unknown.pop(imei, None)
+        unknown[imei] = now + self.negative_ttl
+        if len(unknown) > self.max_negative:
+            # orden de inserción = orden de vencimiento: se descartan los más viejos
+            for old in list(unknown)[: len(unknown) - self.max_negative]:
+                del unknown[old]
+
+    async def refresh_once(self) -> int:
+        """Trae devices con id > último visto (la primera vez, todos)."""
+        rows = await self._db.fetch_devices(after_id=self._max_id)
+        self._put_rows(rows, advance=True)
+        self.refreshes += 1
+        if not self._loaded:
+            self._loaded = True
+            log.info("Admisión: %d devices precargados", len(self._known))
+        elif rows:
+            log.debug("Admisión: %d devices nuevos", len(rows))
+        return len(rows)
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            try:
+                await self.refresh_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.lookup_errors += 1
+                log.warning("Admisión: refresco de devices falló: %s", e)
+            if self.refresh <= 0:
+                return
+            await asyncio.sleep(self.refresh)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "unverified": self.unverified,
+            "known": len(self._known),
+            "unknown": len(self._unknown),
+            "hits": self.hits,
+            "misses": self.misses,
+            "lookups": self.lookups,
+            "lookup_errors": self.lookup_errors,
+        }
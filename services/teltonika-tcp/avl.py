@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+Decodificador Teltonika AVL (Codec 08 / 8E).
+
+Trabaja sobre un memoryview del payload (sin copias) con `struct.Struct`
+precompilados por codec:
+- la cabecera fija de cada record (ts, prio, lon, lat, alt, ángulo, sats,
+  velocidad, event_id, total_io) se lee con un único unpack;
+- cada grupo de IO (1/2/4/8 bytes) se lee con un único unpack de N pares
+  (Struct cacheado por codec/tamaño/N);
+- los límites se verifican una vez por record (cabecera) y el resto lo
+  valida el propio unpack; cualquier desborde se reporta como ValueError.
+
+Cada record se representa con `AvlRecord` (__slots__): campos crudos de la
+cabecera, una referencia a un `IoLayout` compartido (ids + claves de IO
+internadas, uno por combinación de ids) y los valores de IO en una tupla
+paralela a esas claves. Los dicts {"ts", "gps", "io", ...} sólo se arman en
+el borde de serialización (`to_dict()` / `json_default`), con la misma forma
+que producía el decodificador original de server.py.
+"""
+
+import logging
+import struct
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+from io_registry import profile as io_profile
+
+log = logging.getLogger("teltonika-tcp")
+
+# -------------------------------------------------------------------
+# IO
+# -------------------------------------------------------------------
+# Catálogo del perfil (io_registry, IO_PROFILE / FMC650): id -> nombre amigable
+IO_NAME_MAP: Dict[int, str] = io_profile().by_id
+
+# Clave de salida por IO id: nombre amigable o el id como string
+_IO_KEYS: Dict[int, str] = {}
+
+
+def io_key(io_id: int) -> str:
+    key = _IO_KEYS.get(io_id)
+    if key is None:
+        key = sys.intern(IO_NAME_MAP.get(io_id) or str(io_id))
+        _IO_KEYS[io_id] = key
+    return key
+
+
+# -------------------------------------------------------------------
+# Structs precompilados
+# -------------------------------------------------------------------
+_U8 = struct.Struct(">B")
+_U16 = struct.Struct(">H")
+
+# ts(8) prio(1) lon(4) lat(4) alt(2) angle(2) sats(1) speed(2) event_id total_io
+_HEADER = {
+    0x08: struct.Struct(">QBiiHHBHBB"),
+    0x8E: struct.Struct(">QBiiHHBHHH"),
+}
+# Contador de elementos de cada grupo IO
+_COUNT = {0x08: _U8, 0x8E: _U16}
+# Formato del id de IO y del valor por tamaño de grupo
+_ID_FMT = {0x08: "B", 0x8E: "H"}
+_VAL_FMT = {1: "B", 2: "H", 4: "I", 8: "Q"}
+
+_ID_SIZE = {0x08: 1, 0x8E: 2}
+
+_PAIRS_CACHE: Dict[Tuple[int, int, int], struct.Struct] = {}
+_PAIRS_CACHE_MAX_N = 64  # grupos más grandes no se cachean (N lo declara el equipo: hasta 65535)
+
+
+def _pairs_struct(codec: int, size: int, n: int) -> struct.Struct:
+    """Struct para N pares (id, valor) de un grupo; cacheado sólo para N chico."""
+    key = (codec, size, n)
+    st = _PAIRS_CACHE.get(key)
+    if st is None:
+        st = struct.Struct(">" + (_ID_FMT[codec] + _VAL_FMT[size]) * n)
+        if n <= _PAIRS_CACHE_MAX_N:
+            _PAIRS_CACHE[key] = st
+    return st
+
+
+# -------------------------------------------------------------------
+# Post-proceso
+# -------------------------------------------------------------------
+def _to_hex_be(value: int, byte_len: int) -> str:
+    return value.to_bytes(byte_len, "big", signed=False).hex()
+
+
+def _reverse_hex_bytes(hex_str: str) -> str:
+    return "".join([hex_str[i:i+2] for i in range(0, len(hex_str), 2)][::-1])
+
+
+def _ascii(raw) -> str:
+    # relleno NUL (p.ej. partes de ICCID): Postgres no acepta \u0000 en jsonb
+    return bytes(raw).decode("ascii", errors="ignore").replace("\x00", "")
+
+
+_ICCID_IDS = (0xDB, 0xDC, 0xDD)
+_IBUTTON_ID = 0x4E
+
+
+# -------------------------------------------------------------------
+# Representación compacta
+# -------------------------------------------------------------------
+class IoLayout:
+    """Ids/claves de IO de un record (compartido por todos los records con los mismos ids)."""
+
+    __slots__ = ("groups", "ids", "keys", "ibutton")
+
+    def __init__(self, groups: Tuple[Tuple[int, ...], ...]) -> None:
+        self.groups = groups  # ids por grupo 1/2/4/8 bytes
+        ids: Tuple[int, ...] = ()
+        for g in groups:
+            ids += g
+        self.ids = ids
+        self.keys = tuple(io_key(i) for i in ids)
+        # iButton sólo se interpreta en el grupo de 8 bytes (como el original)
+        # (último si se repite, igual que dict(zip(...)))
+        g8 = groups[3]
+        self.ibutton = len(ids) - 1 - g8[::-1].index(_IBUTTON_ID) if _IBUTTON_ID in g8 else -1
+
+
+_LAYOUTS: Dict[Tuple[Tuple[int, ...], ...], IoLayout] = {}
+_LAYOUTS_MAX = 4096  # tope ante combinaciones arbitrarias (tráfico basura)
+
+
+def _layout(groups: Tuple[Tuple[int, ...], ...]) -> IoLayout:
+    lay = _LAYOUTS.get(groups)
+    if lay is None:
+        lay = IoLayout(groups)
+        if len(_LAYOUTS) < _LAYOUTS_MAX:
+            _LAYOUTS[groups] = lay
+    return lay
+
+
+class AvlRecord:
+    """Record AVL decodificado (valores crudos del protocolo)."""
+
+    __slots__ = ("ts_ms", "priority", "lon", "lat", "sats", "speed", "event_id", "layout", "io_vals", "xio")
+
+    def __init__(self, ts_ms: int, priority: int, lon: int, lat: int, sats: int, speed: int, event_id: int,
+                 layout: IoLayout, io_vals: Tuple[int, ...], xio: Optional[Tuple[Tuple[int, bytes], ...]]) -> None:
+        self.ts_ms = ts_ms
+        self.priority = priority
+        self.lon = lon  # grados * 1e7
+        self.lat = lat
+        self.sats = sats
+        self.speed = speed
+        self.event_id = event_id
+        self.layout = layout
+        self.io_vals = io_vals
+        self.xio = xio  # ((id, bytes), ...) o None
+
+    @property
+    def ts(self) -> float:
+        return self.ts_ms / 1000.0
+
+    def gps(self) -> Dict[str, Any]:
+        return {"lat": self.lat / 1e7, "lon": self.lon / 1e7, "sat": self.sats, "hdop": None, "speed": float(self.speed)}
+
+    def io(self) -> Dict[str, Any]:
+        io: Dict[str, Any] = {}
+        lay = self.layout
+
+        # iButton (0x4E, 8 bytes)
+        if lay.ibutton >= 0:
+            ib_val = self.io_vals[lay.ibutton]
+            ib_hex = _to_hex_be(ib_val, 8).upper()
+            if ib_val != 0:
+                io["IButton"] = ib_hex
+                io["IButton_Reverse"] = _reverse_hex_bytes(ib_hex).upper()
+                io["IButton_Connected"] = True
+            else:
+                io["IButton"] = "0"
+                io["IButton_Reverse"] = ""
+                io["IButton_Connected"] = False
+
+        # ICCID (DB/DC/DD concatenadas como ASCII)
+        xbytes = dict(self.xio) if self.xio else {}
+        if xbytes:
+            parts = [_ascii(xbytes[pid]) for pid in _ICCID_IDS if pid in xbytes]
+            if parts:
+                iccid_full = "".join(parts).strip("\x00")
+                if iccid_full:
+                    io["CCID"] = iccid_full
+                    io["CCID Part1"] = _ascii(xbytes.get(0xDB, b""))
+                    io["CCID Part2"] = _ascii(xbytes.get(0xDC, b""))
+                    io["CCID Part3"] = _ascii(xbytes.get(0xDD, b""))
+
+        # Nombrado amigable para todos los grupos 1/2/4/8
+        io.update(zip(lay.keys, self.io_vals))
+
+        # X-bytes restantes expuestos como hex
+        for io_id, raw in xbytes.items():
+            if io_id not in _ICCID_IDS:
+                io[io_key(io_id)] = "0x" + raw.hex()
+
+        return io
+
+    def telemetry_data(self) -> Dict[str, Any]:
+        """Lo que se guarda en telemetry.data."""
+        return {"gps": self.gps(), "io": self.io(), "rejected_io": {}}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "ts": self.ts,
+            "event_id": self.event_id,
+            "priority": self.priority,
+            "gps": self.gps(),
+            "io": self.io(),
+            "rejected_io": {},
+        }
+
+
+def json_default(o: Any) -> Any:
+    """`default=` para json.dumps: serializa AvlRecord en el borde (API, spool)."""
+    if isinstance(o, AvlRecord):
+        return o.to_dict()
+    raise TypeError(f"{type(o).__name__} no es serializable a JSON")
+
+
+def record_ts(rec: Any) -> float:
+    """Epoch (s) de un record, sea AvlRecord o dict (p.ej. re-leído del spool)."""
+    return rec.ts if isinstance(rec, AvlRecord) else rec["ts"]
+
+
+def record_ts_ms(rec: Any) -> int:
+    """Epoch en ms de un record, sea AvlRecord o dict."""
+    return rec.ts_ms if isinstance(rec, AvlRecord) else int(round(rec["ts"] * 1000))
+
+
+def record_data(rec: Any) -> Dict[str, Any]:
+    """telemetry.data de un record, sea AvlRecord o dict."""
+    if isinstance(rec, AvlRecord):
+        return rec.telemetry_data()
+    return {"gps": rec["gps"], "io": rec["io"], "rejected_io": rec.get("rejected_io", {})}
+
+
+# -------------------------------------------------------------------
+# Decodificación
+# -------------------------------------------------------------------
+def _truncated(what: str, pos: int, need: int, size: int) -> ValueError:
+    return ValueError(f"Payload truncado: {what} (pos={pos}, need={need}, len={size})")
+
+
+def open_payload(payload) -> Tuple[memoryview, int, int]:
+    """memoryview + codec + n1 (cantidad de records según cabecera)."""
+    mv = payload if isinstance(payload, memoryview) else memoryview(payload)
+    size = len(mv)
+    if size < 2:
+        raise _truncated("u8", size, 1, size)
+    codec = mv[0]
+    if codec not in _HEADER:
+        raise ValueError(f"Codec no soportado: 0x{codec:02X}")
+    return mv, codec, mv[1]
+
+
+def check_n2(mv: memoryview, pos: int, n1: int) -> None:
+    # N2 (debe coincidir con n1, según protocolo)
+    size = len(mv)
+    if pos + 1 > size:
+        raise _truncated("u8", pos, 1, size)
+    n2 = mv[pos]
+    if n2 != n1:
+        log.debug("Aviso: n1=%d n2=%d (no coinciden)", n1, n2)
+
+
+def decode_records(mv: memoryview, codec: int, pos: int, start: int, count: int, records: List[AvlRecord]) -> int:
+    """Decodifica `count` records desde `pos` (índices start..) agregándolos a `records`; devuelve el nuevo pos."""
+    size = len(mv)
+    header = _HEADER[codec]
+    hdr_unpack = header.unpack_from
+    hdr_size = header.size
+    cnt_unpack = _COUNT[codec].unpack_from
+    cnt_size = _COUNT[codec].size
+    is_8e = codec == 0x8E
+    id_size = _ID_SIZE[codec]
+    pairs_cache = _PAIRS_CACHE
+    layouts = _LAYOUTS
+    empty: Tuple[int, ...] = ()
+
+    for i in range(start, start + count):
+        # Única verificación explícita de límites del record (cabecera fija)
+        if pos + hdr_size > size:
+            raise _truncated(f"record {i} header", pos, hdr_size, size)
+        ts_ms, prio, lon, lat, _alt, _angle, sats, speed, event_id, _total_io = hdr_unpack(mv, pos)
+        pos += hdr_size
+
+        try:
+            ids: List[Tuple[int, ...]] = []
+            vals: Tuple[int, ...] = empty
+            for gsize in (1, 2, 4, 8):
+                (n,) = cnt_unpack(mv, pos)
+                pos += cnt_size
+                if n:
+                    # antes de armar el Struct: N viene del equipo y el payload puede no alcanzar
+                    if pos + n * (id_size + gsize) > size:
+                        raise _truncated(f"record {i} IO grupo {gsize}B (n={n})", pos, n * (id_size + gsize), size)
+                    st = pairs_cache.get((codec, gsize, n)) or _pairs_struct(codec, gsize, n)
+                    flat = st.unpack_from(mv, pos)
+                    pos += st.size
+                    ids.append(flat[0::2])
+                    vals += flat[1::2]
+                else:
+                    ids.append(empty)
+
+            xio = None
+            if is_8e:
+                (nx,) = _U16.unpack_from(mv, pos)
+                pos += 2
+                if nx:
+                    xs = []
+                    for _k in range(nx):
+                        io_id, vlen = struct.unpack_from(">HH", mv, pos)
+                        pos += 4
+                        if pos + vlen > size:
+                            raise _truncated(f"xbytes({io_id})", pos, vlen, size)
+                        xs.append((io_id, bytes(mv[pos:pos + vlen])))
+                        pos += vlen
+                    xio = tuple(xs)
+        except struct.error as e:
+            raise ValueError(f"Payload truncado: record {i} IO (pos={pos}, len={size}): {e}") from None
+
+        key = tuple(ids)
+        layout = layouts.get(key) or _layout(key)
+        records.append(AvlRecord(ts_ms, prio, lon, lat, sats, speed, event_id, layout, vals, xio))
+
+    return pos
+
+
+def decode_avl_payload(payload) -> Tuple[int, int, List[AvlRecord], bool]:
+    """
+    Retorna: codec, total_records (según cabecera), records_list, crc_ok_assumed(True si read_frame validó)
+    """
+    mv, codec, n1 = open_payload(payload)
+    records: List[AvlRecord] = []
+    pos = decode_records(mv, codec, 2, 0, n1, records)
+    check_n2(mv, pos, n1)
+    return codec, n1, records, True
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Decodificación por lotes (NumPy) para backlogs grandes de Codec 8 / 8E.
+
+Tras una pérdida de cobertura el equipo envía cientos de records en un frame
+y casi todos comparten la misma estructura (mismos ids de IO por grupo y
+mismos largos de X-bytes), o sea, el mismo tamaño en bytes. Para esos tramos:
+
+1. el primer record se decodifica con el decodificador escalar (avl.py), que
+   da su layout y su largo;
+2. se arma (y cachea) un dtype estructurado NumPy con todos sus campos
+   (ts, lat/lon, alt, ángulo, sats, velocidad, ids/valores de IO...) y la lista
+   de bytes "estructurales" (contadores, ids, largos de X-bytes);
+3. los records siguientes se ven como una matriz (n, largo) de bytes y se
+   comparan sólo esos bytes contra el primero: el tramo termina en el primer
+   record con otra estructura;
+4. el tramo se decodifica de una vez con `np.frombuffer(dtype)` y columnas
+   `.tolist()`.
+
+Los records irregulares (o tramos cortos) siguen por el camino escalar. La
+salida es idéntica (mismos AvlRecord / IoLayout) a `avl.decode_avl_payload`.
+Sin NumPy instalado se usa directamente el decodificador escalar.
+"""
+
+from itertools import repeat
+from typing import Dict, List, Optional, Tuple
+
+from avl import AvlRecord, IoLayout, check_n2, decode_records, open_payload
+from metrics import REGISTRY
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+BATCH_RECORDS = REGISTRY.counter("decode_batch_records_total", "Records decodificados por lote (NumPy)")
+SCALAR_RECORDS = REGISTRY.counter("decode_scalar_records_total", "Records decodificados por el camino escalar")
+
+_VAL_DT = {1: "u1", 2: ">u2", 4: ">u4", 8: ">u8"}
+
+
+class _RunSpec:
+    __slots__ = ("dtype", "size", "struct_idx", "value_fields", "x_ids", "x_fields")
+
+    def __init__(self, codec: int, layout: IoLayout, xsig: Tuple[Tuple[int, int], ...]) -> None:
+        ext = codec == 0x8E
+        cnt = ">u2" if ext else "u1"
+        fields = [
+            ("ts", ">u8"), ("prio", "u1"), ("lon", ">i4"), ("lat", ">i4"), ("alt", ">u2"),
+            ("angle", ">u2"), ("sats", "u1"), ("speed", ">u2"), ("event", cnt), ("total", cnt),
+        ]
+        structural = ["total"]
+        self.value_fields: List[str] = []
+        for gsize, ids in zip((1, 2, 4, 8), layout.groups):
+            fields.append((f"n{gsize}", cnt))
+            structural.append(f"n{gsize}")
+            for k in range(len(ids)):
+                fields += [(f"i{gsize}_{k}", cnt), (f"v{gsize}_{k}", _VAL_DT[gsize])]
+                structural.append(f"i{gsize}_{k}")
+                self.value_fields.append(f"v{gsize}_{k}")
+        self.x_ids = tuple(io_id for io_id, _ in xsig)
+        self.x_fields: List[str] = []
+        if ext:
+            fields.append(("nx", ">u2"))
+            structural.append("nx")
+            for k, (_io_id, vlen) in enumerate(xsig):
+                fields += [(f"xi{k}", ">u2"), (f"xl{k}", ">u2"), (f"xv{k}", f"V{vlen}")]
+                structural += [f"xi{k}", f"xl{k}"]
+                self.x_fields.append(f"xv{k}")
+
+        self.dtype = np.dtype(fields)  # empaquetado, sin alineación
+        self.size = self.dtype.itemsize
+        idx: List[int] = []
+        for name in structural:
+            dt, off = self.dtype.fields[name][:2]
+            idx.extend(range(off, off + dt.itemsize))
+        self.struct_idx = np.array(idx, dtype=np.intp)
+
+
+_MAX_MISSES = 2  # intentos fallidos por frame antes de seguir todo escalar
+
+_SPECS: Dict[tuple, _RunSpec] = {}
+_SPECS_MAX = 1024
+
+
+def _spec(codec: int, rec: AvlRecord) -> _RunSpec:
+    xsig = tuple((io_id, len(raw)) for io_id, raw in rec.xio) if rec.xio else ()
+    key = (codec, rec.layout.groups, xsig)
+    spec = _SPECS.get(key)
+    if spec is None:
+        spec = _RunSpec(codec, rec.layout, xsig)
+        if len(_SPECS) < _SPECS_MAX:
+            _SPECS[key] = spec
+    return spec
+
+
+def _run_length(mv: memoryview, pos: int, first: int, spec: _RunSpec, max_count: int) -> int:
+    """Cuántos records desde `pos` tienen la misma estructura que el record en `first`."""
+    size = spec.size
+    m = min(max_count, (len(mv) - pos) // size)
+    if m <= 0:
+        return 0
+    tmpl = np.frombuffer(mv, np.uint8, count=size, offset=first)[spec.struct_idx]
+    raw = np.frombuffer(mv, np.uint8, count=m * size, offset=pos).reshape(m, size)
+    bad = (raw[:, spec.struct_idx] != tmpl).any(axis=1)
+    return int(bad.argmax()) if bad.any() else m
+
+
+def _decode_run(mv: memoryview, pos: int, count: int, spec: _RunSpec, layout: IoLayout) -> List[AvlRecord]:
+    arr = np.frombuffer(mv, spec.dtype, count=count, offset=pos)
+    if spec.value_fields:
+        cols = np.empty((count, len(spec.value_fields)), dtype=np.uint64)
+        for j, f in enumerate(spec.value_fields):
+            cols[:, j] = arr[f]
+        vals = list(map(tuple, cols.tolist()))
+    else:
+        vals = repeat((), count)
+    if spec.x_fields:
+        x_ids = spec.x_ids
+        xcols = [arr[f].tolist() for f in spec.x_fields]
+        xios = [tuple(zip(x_ids, row)) for row in zip(*xcols)]
+    else:
+        xios = repeat(None, count)
+    return list(map(
+        AvlRecord,
+        arr["ts"].tolist(), arr["prio"].tolist(), arr["lon"].tolist(), arr["lat"].tolist(),
+        arr["sats"].tolist(), arr["speed"].tolist(), arr["event"].tolist(),
+        repeat(layout, count), vals, xios,
+    ))
+
+
+def decode_avl_payload_batch(payload, min_run: int = 16) -> Tuple[int, int, List[AvlRecord], bool]:
+    """Misma interfaz y salida que avl.decode_avl_payload; tramos homogéneos >= min_run van por NumPy."""
+    mv, codec, n1 = open_payload(payload)
+    records: List[AvlRecord] = []
+    if np is None or n1 < min_run + 1:
+        SCALAR_RECORDS.inc(n1)
+        check_n2(mv, decode_records(mv, codec, 2, 0, n1, records), n1)
+        return codec, n1, records, True
+
+    pos, i = 2, 0
+    n_batch = 0
+    misses = 0
+    while i < n1:
+        if misses >= _MAX_MISSES:
+            # frame irregular (p.ej. X-bytes de largo variable): el resto escalar
+            pos = decode_records(mv, codec, pos, i, n1 - i, records)
+            break
+
+        # el primer record del tramo (escalar) define layout y largo
+        first = pos
+        pos = decode_records(mv, codec, pos, i, 1, records)
+        i += 1
+        remaining = n1 - i
+        if remaining < min_run:
+            pos = decode_records(mv, codec, pos, i, remaining, records)
+            break
+
+        rec = records[-1]
+        spec = _spec(codec, rec)
+        run = _run_length(mv, pos, first, spec, remaining) if spec.size == pos - first else 0
+        if run >= min_run:
+            records.extend(_decode_run(mv, pos, run, spec, rec.layout))
+            pos += run * spec.size
+            i += run
+            n_batch += run
+        else:
+            # tramo irregular: escalar un poco antes de volver a intentar
+            misses += 1
+            k = min(remaining, max(run, min_run))
+            pos = decode_records(mv, codec, pos, i, k, records)
+            i += k
+
+    check_n2(mv, pos, n1)
+    BATCH_RECORDS.inc(n_batch)
+    SCALAR_RECORDS.inc(n1 - n_batch)
+    return codec, n1, records, True
+
+
+def describe() -> Optional[str]:
+    return f"numpy {np.__version__}" if np is not None else None
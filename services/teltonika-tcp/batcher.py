@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Coalescencia de records decodificados entre conexiones.
+
+Cada conexión entrega (imei, codec, records) con `submit()`/`enqueue()` y
+espera el resultado. Los envíos pendientes de todas las conexiones se agrupan en un
+lote que se despacha al sink cuando:
+- se alcanza `max_records` records acumulados (flush por tamaño), o
+- vence la ventana `linger_ms` desde el primer envío del lote (flush por tiempo).
+
+El sink recibe la lista de pendientes y devuelve un bool por pendiente
+(True = persistido). `submit()` resuelve con ese bool, de modo que la conexión
+sólo hace ACK cuando sus records quedaron aceptados.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+log = logging.getLogger("teltonika-tcp.batcher")
+
+
+class Pending:
+    __slots__ = ("imei", "codec", "records", "future")
+
+    def __init__(self, imei: str, codec: int, records: List[Any], future: asyncio.Future) -> None:
+        self.imei = imei
+        self.codec = codec
+        self.records = records
+        self.future = future
+
+
+Sink = Callable[[List[Pending]], Awaitable[List[bool]]]
+
+
+class IngestBatcher:
+    def __init__(self, sink: Sink, max_records: int = 500, linger_ms: float = 50.0) -> None:
+        self._sink = sink
+        self.max_records = max(1, max_records)
+        self.linger = max(0.0, linger_ms) / 1000.0
+        self._buf: List[Pending] = []
+        self._buf_records = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: Set[asyncio.Task] = set()
+        # métricas
+        self.batches = 0
+        self.batched_items = 0
+        self.batched_records = 0
+        self.flush_by_size = 0
+        self.flush_by_linger = 0
+        self.failed_items = 0
+
+    @property
+    def pending_records(self) -> int:
+        return self._buf_records
+
+    async def submit(self, imei: str, codec: int, records: List[Any]) -> bool:
+        return await self.enqueue(imei, codec, records)
+
+    def enqueue(self, imei: str, codec: int, records: List[Any]) -> asyncio.Future:
+        """Como submit() pero sin coroutine: devuelve el future (para callbacks de Protocol)."""
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._buf.append(Pending(imei, codec, records, fut))
+        self._buf_records += len(records)
+
+        if self._buf_records >= self.max_records or self.linger == 0:
+            self.flush_by_size += 1
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.linger, self._on_linger)
+        return fut
+
+    def _on_linger(self) -> None:
+        self._timer = None
+        if self._buf:
+            self.flush_by_linger += 1
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._buf, self._buf_records = self._buf, [], 0
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _run(self, batch: List[Pending]) -> None:
+        n_records = sum(len(p.records) for p in batch)
+        try:
+            results = await self._sink(batch)
+        except Exception as e:
+            log.error("Flush de lote falló (%d items): %s", len(batch), e)
+            results = [False] * len(batch)
+
+        self.batches += 1
+        self.batched_items += len(batch)
+        self.batched_records += n_records
+        for p, ok in zip(batch, results):
+            if not ok:
+                self.failed_items += 1
+            if not p.future.done():
+                p.future.set_result(bool(ok))
+
+    async def close(self) -> None:
+        """Despacha lo pendiente y espera los flushes en curso."""
+        if self._buf:
+            self._flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def log_stats(self) -> None:
+        s = self.snapshot()
+        log.info(
+            "batch stats: batches=%d items=%d records=%d avg=%.1f rec/lote size=%d linger=%d failed=%d pending=%d",
+            s["batches"], s["items"], s["records"], s["avg_records_per_batch"],
+            s["flush_by_size"], s["flush_by_linger"], s["failed_items"], s["pending_records"],
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.batched_items,
+            "records": self.batched_records,
+            "avg_records_per_batch": (self.batched_records / self.batches) if self.batches else 0.0,
+            "flush_by_size": self.flush_by_size,
+            "flush_by_linger": self.flush_by_linger,
+            "failed_items": self.failed_items,
+            "pending_records": self._buf_records,
+            "in_flight_batches": len(self._flushes),
+        }
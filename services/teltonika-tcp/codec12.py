@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Codec 12 (comandos GPRS) sobre el mismo framing TCP que AVL.
+
+Frame:   00000000 | LEN(4) | 0x0C | QTY1 | TYPE | SIZE(4) | TEXTO | QTY2 | CRC(4)
+TYPE:    0x05 comando (servidor -> equipo), 0x06 respuesta (equipo -> servidor)
+
+El protocolo no trae id de correlación: las respuestas llegan en el orden de
+los comandos, por eso se mantiene un solo comando en vuelo por conexión.
+"""
+
+import struct
+
+from crc16 import crc16_ibm
+
+CODEC_12 = 0x0C
+TYPE_COMMAND = 0x05
+TYPE_RESPONSE = 0x06
+
+_HEAD = struct.Struct(">BBBI")  # codec, qty1, type, size
+
+
+def encode_command(text: str) -> bytes:
+    """Frame TCP completo (preámbulo, LEN y CRC) con un comando de texto."""
+    cmd = text.encode("ascii", errors="replace")
+    data = _HEAD.pack(CODEC_12, 1, TYPE_COMMAND, len(cmd)) + cmd + b"\x01"
+    return b"\x00\x00\x00\x00" + struct.pack(">I", len(data)) + data + struct.pack(">I", crc16_ibm(data) & 0xFFFF)
+
+
+def parse_response(payload: bytes) -> str:
+    """Texto de una respuesta Codec 12 (payload sin preámbulo/LEN/CRC); ValueError si no cierra."""
+    if len(payload) < _HEAD.size + 1:
+        raise ValueError(f"Codec 12 corto ({len(payload)} bytes)")
+    codec, qty1, kind, size = _HEAD.unpack_from(payload)
+    if codec != CODEC_12:
+        raise ValueError(f"No es Codec 12: 0x{codec:02X}")
+    if kind != TYPE_RESPONSE:
+        raise ValueError(f"Tipo Codec 12 inesperado: 0x{kind:02X}")
+    end = _HEAD.size + size
+    if end + 1 != len(payload) or payload[end] != qty1:
+        raise ValueError(f"Codec 12: SIZE={size} / cantidad no coinciden con el payload ({len(payload)} bytes)")
+    return payload[_HEAD.size:end].decode("ascii", errors="replace")
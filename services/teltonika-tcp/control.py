@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Endpoint de control local (por defecto sólo 127.0.0.1).
+
+    GET  /sessions               equipos conectados a este proceso
+                                 ?sort=<campo numérico>&limit=N (p.ej. sort=rx_buffer_alloc_bytes)
+    GET  /sessions/<imei>        sesión de un IMEI (404 si no está conectado aquí)
+    POST /commands/<imei>        body: texto del comando, o JSON {"command": "...", "timeout": s}
+                                 -> {"imei", "command", "response", "latency_ms"}
+    GET  /memory                 RSS, tasks y totales de buffers / records pendientes
+    POST /memory/tracemalloc/start?frames=N   /   POST /memory/tracemalloc/stop
+    GET  /memory/top             ?limit=25&key=lineno|filename|traceback&diff=1
+                                 sitios de asignación (409 si tracemalloc no está activo)
+
+El comando viaja por el socket ya abierto del equipo (Codec 12). Errores:
+404 no conectado, 429 cola llena, 502 conexión cerrada / respuesta inválida,
+504 sin respuesta dentro del timeout.
+
+Con TCP_WORKERS > 1 cada worker expone su puerto (CONTROL_PORT + n) y sólo
+conoce sus propias conexiones.
+"""
+
+import asyncio
+import json
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import memprof
+import metrics
+from sessions import NotConnected, SessionRegistry
+
+log = logging.getLogger("teltonika-tcp.control")
+
+_JSON = "application/json"
+
+
+def _reply(status: int, doc: Any) -> Tuple[int, str, bytes]:
+    return status, _JSON, json.dumps(doc).encode()
+
+
+def _int(query: Dict[str, str], name: str, default: Optional[int]) -> Optional[int]:
+    try:
+        return int(query[name]) if name in query else default
+    except ValueError:
+        raise ValueError(f"{name} debe ser entero")
+
+
+def make_route(
+    registry: SessionRegistry,
+    default_timeout: float = 30.0,
+    max_timeout: float = 300.0,
+    extra: Optional[Callable[[], Dict[str, Any]]] = None,
+):
+    """`extra()`: contadores del proceso que se suman a /memory (batcher, forwarder...)."""
+
+    async def route(method: str, path: str, query: Dict[str, str], body: bytes) -> Tuple[int, str, bytes]:
+        parts = [p for p in path.split("/") if p]
+        if parts[:1] == ["sessions"] and len(parts) <= 2:
+            if method != "GET":
+                return _reply(405, {"detail": "method not allowed"})
+            if len(parts) == 1:
+                try:
+                    limit = _int(query, "limit", None)
+                    sessions = registry.describe(sort=query.get("sort"), limit=limit)
+                except ValueError as e:
+                    return _reply(400, {"detail": str(e)})
+                total = registry.devices
+                return _reply(200, {"count": total, "sessions": sessions})
+            found = registry.describe(parts[1])
+            return _reply(200, found[0]) if found else _reply(404, {"detail": "not connected"})
+
+        if parts[:1] == ["commands"] and len(parts) == 2:
+            if method != "POST":
+                return _reply(405, {"detail": "method not allowed"})
+            imei = parts[1]
+            text, timeout = body.decode("utf-8", errors="replace").strip(), default_timeout
+            if text.startswith("{"):
+                try:
+                    doc = json.loads(text)
+                    text = str(doc["command"]).strip()
+                    timeout = float(doc.get("timeout", default_timeout))
+                except (ValueError, KeyError, TypeError) as e:
+                    return _reply(400, {"detail": f"invalid body: {e}"})
+            if not text:
+                return _reply(400, {"detail": "empty command"})
+            timeout = max(0.1, min(timeout, max_timeout))
+            try:
+                res = await registry.command(imei, text, timeout)
+            except NotConnected:
+                return _reply(404, {"detail": "not connected", "imei": imei})
+            except OverflowError as e:
+                return _reply(429, {"detail": str(e), "imei": imei})
+            except asyncio.TimeoutError:
+                return _reply(504, {"detail": "no response", "imei": imei, "timeout_s": timeout})
+            except ConnectionError as e:
+                return _reply(502, {"detail": str(e), "imei": imei})
+            log.info("Comando IMEI=%s %r -> %r (%.0f ms)", imei, text, res["response"], res["latency_ms"])
+            return _reply(200, res)
+
+        if parts[:1] == ["memory"]:
+            return await _memory(method, parts[1:], query)
+
+        return _reply(404, {"detail": "not found"})
+
+    async def _memory(method: str, parts, query: Dict[str, str]) -> Tuple[int, str, bytes]:
+        if not parts:
+            if method != "GET":
+                return _reply(405, {"detail": "method not allowed"})
+            doc = memprof.summary(registry.accounting())
+            if extra is not None:
+                doc.update(extra())
+            return _reply(200, doc)
+
+        if parts == ["top"]:
+            if method != "GET":
+                return _reply(405, {"detail": "method not allowed"})
+            try:
+                limit = _int(query, "limit", 25)
+            except ValueError as e:
+                return _reply(400, {"detail": str(e)})
+            diff = query.get("diff", "0").lower() in ("1", "true", "yes")
+            loop = asyncio.get_running_loop()
+            try:
+                doc = await loop.run_in_executor(None, memprof.top, limit, query.get("key", "lineno"), diff)
+            except RuntimeError as e:
+                return _reply(409, {"detail": str(e), "hint": "POST /memory/tracemalloc/start"})
+            except ValueError as e:
+                return _reply(400, {"detail": str(e)})
+            return _reply(200, doc)
+
+        if parts[:1] == ["tracemalloc"] and len(parts) == 2 and parts[1] in ("start", "stop"):
+            if method != "POST":
+                return _reply(405, {"detail": "method not allowed"})
+            if parts[1] == "stop":
+                memprof.stop()
+                log.info("tracemalloc detenido")
+                return _reply(200, {"tracemalloc": False})
+            try:
+                frames = _int(query, "frames", 1)
+            except ValueError as e:
+                return _reply(400, {"detail": str(e)})
+            memprof.start(frames)
+            log.info("tracemalloc activo (%d frames)", frames)
+            return _reply(200, {"tracemalloc": True, "frames": frames})
+
+        return _reply(404, {"detail": "not found"})
+
+    return route
+
+
+async def serve(
+    host: str,
+    port: int,
+    registry: SessionRegistry,
+    default_timeout: float = 30.0,
+    extra: Optional[Callable[[], Dict[str, Any]]] = None,
+) -> asyncio.AbstractServer:
+    server = await metrics.serve_http(host, port, make_route(registry, default_timeout, extra=extra))
+    log.info("Control en http://%s:%d (sessions, commands, memory)", host, port)
+    return server
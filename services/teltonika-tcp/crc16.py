@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+CRC16/IBM (poly 0xA001 reflejado, init 0x0000) usado por Teltonika en los frames AVL.
+
+- Tabla precalculada de 256 entradas: 1 lookup por byte en vez de 8 iteraciones.
+- Acepta bytes, bytearray o memoryview (sin copiar).
+- Si está instalado `crcmod` con su extensión C, se usa como fast path que
+  procesa el buffer completo de una vez; si no, se usa la tabla en Python.
+
+Compartido por server.py y tools/sim_fmc650.py.
+"""
+
+from typing import Union
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+POLY = 0xA001
+
+
+def _build_table() -> tuple:
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ POLY
+            else:
+                crc >>= 1
+        table.append(crc)
+    return tuple(table)
+
+
+CRC16_TABLE = _build_table()
+
+
+def crc16_ibm_py(data: Buffer, crc: int = 0x0000) -> int:
+    """Versión por tabla en Python puro. `crc` permite cálculo incremental."""
+    table = CRC16_TABLE
+    for b in data:
+        crc = (crc >> 8) ^ table[(crc ^ b) & 0xFF]
+    return crc & 0xFFFF
+
+
+# -------------------------------------------------------------------
+# Fast path opcional (crcmod con extensión C)
+# -------------------------------------------------------------------
+_crc_ext = None
+try:
+    import importlib
+
+    import crcmod.predefined  # type: ignore
+
+    # sin la extensión C, crcmod es más lento que nuestra tabla
+    # (el paquete re-exporta su submódulo con el mismo nombre => importlib)
+    if getattr(importlib.import_module("crcmod.crcmod"), "_usingExtension", False):
+        # 'crc-16' de crcmod = CRC-16/ARC = CRC16/IBM con init 0x0000
+        _crc_ext = crcmod.predefined.mkPredefinedCrcFun("crc-16")
+except Exception:
+    _crc_ext = None
+
+BACKEND = "crcmod" if _crc_ext is not None else "table"
+
+
+if _crc_ext is not None:
+    def crc16_ibm(data: Buffer, crc: int = 0x0000) -> int:
+        """CRC16/IBM del buffer completo (extensión C)."""
+        return _crc_ext(data, crc) & 0xFFFF
+else:
+    crc16_ibm = crc16_ibm_py
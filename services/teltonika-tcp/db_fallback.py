@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Fallback directo a Postgres cuando la API no acepta un lote.
+
+- Pool persistente de conexiones asíncronas (psycopg_pool.AsyncConnectionPool).
+- Caché IMEI -> (device_id, tenant_id) con TTL; los IMEI desconocidos se
+  crean en bloque (mismo criterio que antes: tenant del primer device o 1)
+  sólo con `auto_create`. Con admisión activa no se crean: sus records se
+  descartan y se cuentan (un IMEI que admisión no aprobó no da de alta devices).
+- Inserción multi-fila con COPY en una única transacción por lote.
+"""
+
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+try:
+    import psycopg
+    from psycopg_pool import AsyncConnectionPool
+except Exception:
+    psycopg = None
+    AsyncConnectionPool = None
+
+from avl import record_data, record_ts
+
+log = logging.getLogger("teltonika-tcp.db")
+
+Device = Tuple[int, Optional[int]]  # (device_id, tenant_id)
+
+_COPY_TELEMETRY = "COPY telemetry (tenant_id, device_id, ts, data) FROM STDIN"
+
+
+class DeviceCache:
+    """IMEI -> (device_id, tenant_id) con expiración."""
+
+    def __init__(self, ttl: float = 600.0) -> None:
+        self.ttl = ttl
+        self._data: Dict[str, Tuple[Device, float]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, imei: str) -> Optional[Device]:
+        entry = self._data.get(imei)
+        if entry is None or entry[1] < time.monotonic():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def put(self, imei: str, dev: Device) -> None:
+        self._data[imei] = (dev, time.monotonic() + self.ttl)
+
+    def invalidate(self, imeis: Iterable[str]) -> None:
+        for imei in imeis:
+            self._data.pop(imei, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class DbFallback:
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        dbname: str,
+        user: str,
+        password: Optional[str],
+        min_size: int = 1,
+        max_size: int = 8,
+        cache_ttl: float = 600.0,
+        connect_timeout: float = 3.0,
+        auto_create: bool = True,
+    ) -> None:
+        self._kwargs = {
+            "host": host,
+            "port": port,
+            "dbname": dbname,
+            "user": user,
+            "password": password,
+            "connect_timeout": int(connect_timeout),
+        }
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = connect_timeout
+        self.auto_create = auto_create
+        self.cache = DeviceCache(cache_ttl)
+        self._pool: Optional["AsyncConnectionPool"] = None
+        # métricas
+        self.batches = 0
+        self.rows = 0
+        self.errors = 0
+        self.unknown_items = 0  # items descartados por IMEI sin device (sin auto_create)
+
+    @property
+    def available(self) -> bool:
+        return psycopg is not None and AsyncConnectionPool is not None
+
+    async def start(self) -> None:
+        if not self.available or self._pool is not None:
+            return
+        self._pool = AsyncConnectionPool(
+            kwargs=self._kwargs,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            open=False,
+        )
+        # no bloquea el arranque si la DB aún no está arriba
+        await self._pool.open(wait=False)
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    # ---------------------------------------------------------------
+    async def fetch_devices(
+        self, imeis: Optional[Sequence[str]] = None, after_id: int = 0
+    ) -> List[Tuple[int, str, Optional[int]]]:
+        """(id, external_id, tenant_id) por lista de IMEI, o todos con id > after_id (carga incremental)."""
+        if self._pool is None:
+            raise RuntimeError("psycopg/psycopg_pool no disponible")
+        async with self._pool.connection(timeout=self.timeout) as conn:
+            async with conn.cursor() as cur:
+                if imeis is not None:
+                    await cur.execute(
+                        "SELECT id, external_id, tenant_id FROM devices WHERE external_id = ANY(%s)", (list(imeis),)
+                    )
+                else:
+                    await cur.execute(
+                        "SELECT id, external_id, tenant_id FROM devices WHERE id > %s ORDER BY id", (after_id,)
+                    )
+                return await cur.fetchall()
+
+    async def _resolve(self, cur, imeis: Sequence[str]) -> Dict[str, Device]:
+        out: Dict[str, Device] = {}
+        missing: List[str] = []
+        for imei in imeis:
+            dev = self.cache.get(imei)
+            if dev is None:
+                missing.append(imei)
+            else:
+                out[imei] = dev
+        if not missing:
+            return out
+
+        await cur.execute(
+            "SELECT external_id, id, tenant_id FROM devices WHERE external_id = ANY(%s)", (missing,)
+        )
+        for ext, dev_id, tenant_id in await cur.fetchall():
+            out[ext] = (dev_id, tenant_id)
+
+        # sin auto_create los IMEI sin device quedan fuera de `out` (insert_batch los descarta)
+        to_create = [imei for imei in missing if imei not in out] if self.auto_create else []
+        if to_create:
+            # crea con tenant del primero que exista (o 1)
+            await cur.execute("SELECT tenant_id FROM devices LIMIT 1")
+            trow = await cur.fetchone()
+            tenant_id = trow[0] if trow else 1
+            for imei in to_create:
+                # ON CONFLICT: otro lote concurrente pudo crearlo entre el SELECT y el INSERT
+                await cur.execute(
+                    "INSERT INTO devices (tenant_id, name, external_id) VALUES (%s,%s,%s) "
+                    "ON CONFLICT (external_id) DO UPDATE SET external_id = EXCLUDED.external_id "
+                    "RETURNING id, tenant_id",
+                    (tenant_id, f"Teltonika {imei}", imei),
+                )
+                out[imei] = tuple(await cur.fetchone())
+                log.info("Fallback DB: device IMEI=%s (device_id=%s)", imei, out[imei][0])
+
+        for imei in missing:
+            if imei in out:
+                self.cache.put(imei, out[imei])
+        return out
+
+    async def insert_batch(self, items: Sequence[Tuple[str, List[Any]]]) -> Tuple[int, Set[str]]:
+        """
+        Inserta [(imei, records), ...] en una transacción (COPY).
+        Devuelve (filas insertadas, IMEIs sin device descartados); lanza
+        excepción si falla (nada queda a medias).
+        """
+        if self._pool is None:
+            raise RuntimeError("psycopg/psycopg_pool no disponible")
+
+        imeis = list(dict.fromkeys(imei for imei, _ in items))
+        try:
+            async with self._pool.connection(timeout=self.timeout) as conn:
+                async with conn.transaction(), conn.cursor() as cur:
+                    devices = await self._resolve(cur, imeis)
+                    unknown = {imei for imei in imeis if imei not in devices}
+                    n = 0
+                    async with cur.copy(_COPY_TELEMETRY) as copy:
+                        for imei, records in items:
+                            if imei in unknown:
+                                self.unknown_items += 1
+                                continue
+                            device_id, tenant_id = devices[imei]
+                            for rec in records:
+                                # t.data => json con gps/io
+                                await copy.write_row((
+                                    tenant_id,
+                                    device_id,
+                                    datetime.fromtimestamp(record_ts(rec), tz=timezone.utc),
+                                    json.dumps(record_data(rec)),
+                                ))
+                                n += 1
+        except Exception:
+            self.errors += 1
+            # un device borrado deja la caché inconsistente (FK): se relee en el próximo intento
+            self.cache.invalidate(imeis)
+            raise
+
+        self.batches += 1
+        self.rows += n
+        if unknown:
+            log.warning("Fallback DB: %d IMEIs sin device, records descartados: %s",
+                        len(unknown), ", ".join(sorted(unknown)[:5]))
+        log.debug("Fallback DB: %d filas (%d IMEIs)", n, len(imeis))
+        return n, unknown
+
+    def snapshot(self) -> Dict[str, Any]:
+        pool = self._pool.get_stats() if self._pool is not None else {}
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "errors": self.errors,
+            "unknown_items": self.unknown_items,
+            "cache_size": len(self.cache),
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+            "pool_size": pool.get("pool_size", 0),
+            "pool_available": pool.get("pool_available", 0),
+        }
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Reenvío asíncrono a la API (httpx.AsyncClient).
+
+- Un único cliente con pool keep-alive compartido por todas las conexiones TCP.
+- Concurrencia acotada (semáforo) para no saturar la API cuando responde lento.
+- Timeout por request (incluye la espera por un slot libre).
+- Métricas de latencia en memoria (conteo, errores, p50/p95/p99 sobre ventana).
+- Transporte: msgpack a /bulk/msgpack (data de cada record ya serializada,
+  el API no parsea JSON ni arma modelos) o JSON a /bulk. Si el API no expone
+  msgpack (404/415) se pasa a JSON automáticamente.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+import httpx
+
+try:
+    import msgpack
+except Exception:
+    msgpack = None
+
+from avl import json_default, record_data, record_ts_ms
+from metrics import REGISTRY
+
+log = logging.getLogger("teltonika-tcp.forwarder")
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+_MSGPACK_HEADERS = {"Content-Type": "application/x-msgpack"}
+_NO_MSGPACK = (404, 415)  # API sin el endpoint binario
+
+FORWARD_SECONDS = REGISTRY.histogram("forward_seconds", "Latencia de POST bulk a la API")
+
+
+# -------------------------------------------------------------------
+# Métricas de latencia
+# -------------------------------------------------------------------
+class LatencyStats:
+    """Contadores + ventana deslizante de latencias (segundos)."""
+
+    def __init__(self, window: int = 2048) -> None:
+        self.count = 0
+        self.ok = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.rejected = 0  # sin slot libre dentro del timeout
+        self.total_s = 0.0
+        self.max_s = 0.0
+        self._window: Deque[float] = deque(maxlen=window)
+
+    def observe(self, elapsed: float, ok: bool) -> None:
+        self.count += 1
+        self.total_s += elapsed
+        if elapsed > self.max_s:
+            self.max_s = elapsed
+        self._window.append(elapsed)
+        if ok:
+            self.ok += 1
+        else:
+            self.errors += 1
+
+    def percentile(self, q: float) -> float:
+        if not self._window:
+            return 0.0
+        data = sorted(self._window)
+        idx = min(len(data) - 1, int(round(q * (len(data) - 1))))
+        return data[idx]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "ok": self.ok,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "avg_ms": (self.total_s / self.count * 1000.0) if self.count else 0.0,
+            "max_ms": self.max_s * 1000.0,
+            "p50_ms": self.percentile(0.50) * 1000.0,
+            "p95_ms": self.percentile(0.95) * 1000.0,
+            "p99_ms": self.percentile(0.99) * 1000.0,
+        }
+
+
+# -------------------------------------------------------------------
+# Forwarder
+# -------------------------------------------------------------------
+class ApiForwarder:
+    def __init__(
+        self,
+        ingest_url: str,
+        timeout: float = 5.0,
+        max_in_flight: int = 64,
+        max_connections: int = 32,
+        keepalive_expiry: float = 30.0,
+        transport: str = "msgpack",
+    ) -> None:
+        self.ingest_url = ingest_url
+        self.msgpack_url = ingest_url + "/msgpack"
+        self.transport = "msgpack" if transport == "msgpack" and msgpack is not None else "json"
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._sem = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.stats = LatencyStats()
+
+    async def start(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=self._limits,
+            )
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _post(
+        self, url: str, body: bytes, headers: Dict[str, str], passthrough: tuple = ()
+    ) -> Optional[httpx.Response]:
+        """POST con slot acotado; devuelve la respuesta 2xx (o con status en passthrough) o None."""
+        if self._client is None:
+            await self.start()
+        deadline = time.monotonic() + self.timeout
+
+        try:
+            await asyncio.wait_for(self._sem.acquire(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.stats.rejected += 1
+            log.error("API ingest sin slot libre (in_flight=%d)", self.in_flight)
+            return None
+
+        self.in_flight += 1
+        t0 = time.perf_counter()
+        resp: Optional[httpx.Response] = None
+        try:
+            remaining = max(0.001, deadline - time.monotonic())
+            r = await asyncio.wait_for(self._client.post(url, content=body, headers=headers), timeout=remaining)
+            if r.status_code // 100 == 2 or r.status_code in passthrough:
+                resp = r
+            else:
+                log.error("API ingest falló HTTP %s: %s", r.status_code, r.text[:200])
+        except (asyncio.TimeoutError, httpx.TimeoutException):
+            self.stats.timeouts += 1
+            log.error("API ingest timeout (%.1fs)", self.timeout)
+        except Exception as e:
+            log.error("API ingest error: %s", e)
+        finally:
+            elapsed = time.perf_counter() - t0
+            self.stats.observe(elapsed, resp is not None and resp.status_code // 100 == 2)
+            FORWARD_SECONDS.observe(elapsed)
+            self.in_flight -= 1
+            self._sem.release()
+        return resp
+
+    async def bulk_ingest(self, items: List[Dict[str, Any]]) -> Optional[List[str]]:
+        """
+        Envía un lote multi-dispositivo [{imei, codec, records}, ...].
+        Devuelve el estado por item ("ok" | "unknown" | ...) o None si el lote falló.
+        """
+        r = None
+        if self.transport == "msgpack":
+            r = await self._post(self.msgpack_url, self._pack(items), _MSGPACK_HEADERS, passthrough=_NO_MSGPACK)
+            if r is not None and r.status_code in _NO_MSGPACK:
+                log.warning("API sin ingest msgpack (HTTP %s); se usa JSON", r.status_code)
+                self.transport = "json"
+                r = None
+            elif r is None:
+                return None
+        if r is None:
+            # AvlRecord -> dict recién acá (borde de serialización)
+            body = json.dumps({"items": items}, separators=(",", ":"), default=json_default).encode()
+            r = await self._post(self.ingest_url, body, _JSON_HEADERS)
+            if r is None:
+                return None
+        try:
+            results = r.json().get("results") or []
+            statuses = [str(res.get("status")) for res in results]
+        except Exception as e:
+            log.error("Respuesta bulk inválida: %s", e)
+            return None
+        if len(statuses) != len(items):
+            log.error("Respuesta bulk con %d resultados para %d items", len(statuses), len(items))
+            return None
+        return statuses
+
+    @staticmethod
+    def _pack(items: List[Dict[str, Any]]) -> bytes:
+        """Sobre msgpack columnar por item: ts_ms[] + data[] (JSON de telemetry.data)."""
+        dumps = json.dumps
+        return msgpack.packb({"items": [
+            {
+                "imei": it["imei"],
+                "codec": it["codec"],
+                "ts_ms": [record_ts_ms(r) for r in it["records"]],
+                "data": [dumps(record_data(r), separators=(",", ":")) for r in it["records"]],
+            }
+            for it in items
+        ]})
+
+    def log_stats(self) -> None:
+        s = self.stats.snapshot()
+        log.info(
+            "forward stats: n=%d ok=%d err=%d timeout=%d rejected=%d in_flight=%d "
+            "avg=%.1fms p50=%.1fms p95=%.1fms p99=%.1fms max=%.1fms",
+            s["count"], s["ok"], s["errors"], s["timeouts"], s["rejected"], self.in_flight,
+            s["avg_ms"], s["p50_ms"], s["p95_ms"], s["p99_ms"], s["max_ms"],
+        )
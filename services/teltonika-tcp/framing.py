@@ -0,0 +1,566 @@
+# -*- coding: utf-8 -*-
+"""
+Framing Teltonika sobre asyncio.Protocol.
+
+En lugar de varios `readexactly` (+ `wait_for`) por frame, cada conexión
+acumula lo recibido en un buffer y parsea todos los frames completos que haya
+en cada `data_received` (equipos que encolan varios paquetes).
+
+Frame TCP:  00000000 | LEN(4) | DATA(LEN) | CRC(4)   (CRC16/IBM en los 16 bits bajos)
+
+- Re-sync: si no hay preámbulo al inicio, se busca el próximo `00000000`
+  con `bytearray.find` (O(n)) y se descarta lo anterior.
+- Los ACK se escriben en el orden de los frames aunque el lote de un frame
+  posterior se resuelva antes (cola de futures por conexión, sin una task
+  por frame).
+- Timeout de lectura con un único timer por conexión que se re-arma sólo
+  cuando vence (no en cada `data_received`).
+- Admisión de IMEI (admission.py): un IMEI desconocido recibe 0x00 en el
+  handshake y se cierra; si la caché no sabe, se pausa la lectura hasta que
+  responda la consulta.
+- Comandos Codec 12 (codec12.py): cola por conexión, un comando en vuelo;
+  se escribe sólo sin ACK pendientes (el equipo espera esos 4 bytes) y la
+  respuesta (frame 0x0C) resuelve el future del comando. La respuesta no trae
+  id: si el comando en vuelo vence, el lugar queda tomado hasta descartar una
+  respuesta tardía o hasta `command_grace` s, así no se la lleva el siguiente.
+- Drenado (reinicio sin tormenta): `drain(delay)` cierra la conexión pasado
+  `delay` s en cuanto no queden ACK pendientes (lotes en curso); un frame a
+  medio recibir o bytes de re-sync no lo retienen: sin ACK, el equipo reenvía.
+- Contabilidad por conexión (`session_info` / `buffers`): bytes in/out,
+  frames, buffers rx/tx y records esperando persistencia; se calcula al
+  consultar, el hot path sólo suma bytes.
+"""
+
+import asyncio
+import logging
+import struct
+import sys
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import codec12
+from avl import decode_avl_payload
+from crc16 import crc16_ibm
+from fastlog import LazyHex, Sampler, suppressed_note
+from metrics import REGISTRY
+
+log = logging.getLogger("teltonika-tcp")
+# logs por frame: a lo más LOG_SAMPLE_RATE/s por IMEI (ráfaga LOG_SAMPLE_BURST)
+LOG_SAMPLER = Sampler()
+
+PREAMBLE = b"\x00\x00\x00\x00"
+_U16 = struct.Struct(">H")
+_U32 = struct.Struct(">I")
+_ACK_ZERO = (0).to_bytes(4, "big")
+
+DECODE_SECONDS = REGISTRY.histogram(
+    "decode_seconds", "Tiempo de decode AVL por frame",
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01),
+)
+ACK_SECONDS = REGISTRY.histogram(
+    "ack_seconds", "Frame recibido -> ACK escrito (incluye coalescencia y persistencia)",
+)
+
+# resultados de FrameBuffer.next_frame()
+FRAME_OK = 0
+FRAME_BAD_CRC = 1
+FRAME_EMPTY = 2  # LEN=0 (keep-alive sin data)
+
+
+class LruDict(dict):
+    """dict con tope de entradas (claves que manda el equipo): al escribir, la clave pasa al final y se descartan las más viejas."""
+
+    __slots__ = ("max_entries",)
+
+    def __init__(self, max_entries: int) -> None:
+        super().__init__()
+        self.max_entries = max(1, max_entries)
+
+    def __setitem__(self, key, value) -> None:
+        dict.pop(self, key, None)
+        dict.__setitem__(self, key, value)
+        if len(self) > self.max_entries:
+            del self[next(iter(self))]
+
+
+class FramingStats:
+    __slots__ = ("connections", "active", "frames", "crc_errors", "decode_errors",
+                 "resync_bytes", "oversized", "timeouts", "bytes_in", "last_seen")
+
+    def __init__(self, max_devices: int = 100_000) -> None:
+        self.connections = 0
+        self.active = 0
+        self.frames = 0
+        self.crc_errors = 0
+        self.decode_errors = 0
+        self.resync_bytes = 0  # bytes descartados buscando preámbulo
+        self.oversized = 0
+        self.timeouts = 0
+        self.bytes_in = 0
+        self.last_seen: Dict[str, float] = LruDict(max_devices)  # IMEI -> epoch del último frame válido
+
+    def snapshot(self) -> Dict[str, Any]:
+        snap = {k: getattr(self, k) for k in self.__slots__ if k != "last_seen"}
+        snap["devices_seen"] = len(self.last_seen)
+        return snap
+
+
+class FrameBuffer:
+    """Buffer de recepción + parser incremental de frames."""
+
+    def __init__(self, max_frame: int, stats: FramingStats) -> None:
+        self._buf = bytearray()
+        self._off = 0  # inicio de lo no consumido (se compacta una vez por feed)
+        self.max_frame = max_frame
+        self._stats = stats
+
+    def feed(self, data: bytes) -> None:
+        if self._off:
+            del self._buf[:self._off]
+            self._off = 0
+        self._buf += data
+
+    def take(self, n: int) -> Optional[bytes]:
+        """Consume n bytes crudos (handshake IMEI); None si aún no llegaron."""
+        if len(self._buf) - self._off < n:
+            return None
+        out = bytes(self._buf[self._off:self._off + n])
+        self._off += n
+        return out
+
+    def peek_u16(self) -> Optional[int]:
+        if len(self._buf) - self._off < 2:
+            return None
+        return _U16.unpack_from(self._buf, self._off)[0]
+
+    def __len__(self) -> int:
+        return len(self._buf) - self._off
+
+    @property
+    def allocated(self) -> int:
+        """Bytes reservados por el bytearray (incluye lo ya consumido y la sobre-asignación)."""
+        return sys.getsizeof(self._buf)
+
+    def next_frame(self) -> Optional[Tuple[int, bytes]]:
+        """Devuelve (FRAME_*, payload) del próximo frame completo, o None si falta data."""
+        buf = self._buf
+        while True:
+            off = self._off
+            end = len(buf)
+            if end - off < 8:
+                return None
+            if buf[off:off + 4] != PREAMBLE:
+                idx = buf.find(PREAMBLE, off + 1)
+                if idx < 0:
+                    # conserva los últimos 3 bytes (posible preámbulo partido)
+                    keep = max(off, end - 3)
+                    self._stats.resync_bytes += keep - off
+                    self._off = keep
+                    return None
+                self._stats.resync_bytes += idx - off
+                self._off = off = idx
+                if end - off < 8:
+                    return None
+
+            data_len = _U32.unpack_from(buf, off + 4)[0]
+            if data_len == 0:
+                self._off = off + 8
+                return FRAME_EMPTY, b""
+            if data_len > self.max_frame:
+                # LEN absurdo: preámbulo falso, se sigue buscando desde el próximo byte
+                self._stats.oversized += 1
+                self._stats.resync_bytes += 1
+                self._off = off + 1
+                continue
+
+            total = 8 + data_len + 4
+            if end - off < total:
+                return None
+            payload = bytes(buf[off + 8:off + 8 + data_len])
+            crc_recv = _U32.unpack_from(buf, off + 8 + data_len)[0]
+            self._off = off + total
+            crc_calc = crc16_ibm(payload) & 0xFFFF
+            if (crc_recv & 0xFFFF) != crc_calc:
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("CRC inválido (calc=0x%04X, recv=0x%04X) => ACK=0", crc_calc, crc_recv & 0xFFFF)
+                return FRAME_BAD_CRC, payload
+            return FRAME_OK, payload
+
+
+class TeltonikaProtocol(asyncio.Protocol):
+    """Una conexión de equipo: handshake IMEI, frames AVL y ACK en orden."""
+
+    def __init__(
+        self,
+        batcher,
+        stats: FramingStats,
+        read_timeout: float = 15.0,
+        max_frame: int = 65536,
+        max_pending: int = 32,
+        hex_dump: bool = False,
+        decode=decode_avl_payload,
+        admission=None,
+        sessions=None,
+        command_grace: float = 5.0,
+    ) -> None:
+        self._batcher = batcher
+        self._sessions = sessions  # conexiones vivas (set-like: add/discard), para drenar
+        self._admission = admission
+        self._admitting = False
+        self._decode = decode
+        self._stats = stats
+        self.read_timeout = read_timeout
+        self.max_pending = max_pending
+        self.hex_dump = hex_dump
+        self._rx = FrameBuffer(max_frame, stats)
+        self._acks: Deque[Tuple[int, Optional[asyncio.Future], float]] = deque()  # (n1, future | None, t0)
+        self._transport: Optional[asyncio.Transport] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._last_rx = 0.0
+        self._paused = False
+        self._draining = False
+        # Codec 12: (frame, future) en cola + future en vuelo (el plazo corre desde send_command)
+        self._cmds: Deque[Tuple[bytes, asyncio.Future]] = deque()
+        self._cmd_inflight: Optional[asyncio.Future] = None  # ya resuelto => esperando respuesta tardía
+        self._cmd_grace: Optional[asyncio.TimerHandle] = None
+        self.command_grace = command_grace
+        self._connected_at = 0.0
+        # contabilidad (ver session_info)
+        self._bytes_in = 0
+        self._bytes_out = 0
+        self._frames = 0
+        self._last_frame = 0.0
+        self.imei: Optional[str] = None
+        self.peer = None
+
+    # ---------------------------------------------------------------
+    # asyncio.Protocol
+    # ---------------------------------------------------------------
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self._transport = transport
+        self.peer = transport.get_extra_info("peername")
+        self._stats.connections += 1
+        self._stats.active += 1
+        if self._sessions is not None:
+            self._sessions.add(self)
+        self._last_rx = self._connected_at = time.monotonic()
+        if self.read_timeout > 0:
+            self._timer = asyncio.get_running_loop().call_later(self.read_timeout, self._on_timer)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self._stats.active -= 1
+        if self._sessions is not None:
+            self._sessions.discard(self)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._transport = None
+        self._fail_commands(ConnectionError("Conexión cerrada"))
+        if exc is not None:
+            log.debug("Cierre por error con %s: %s", self.peer, exc)
+
+    def eof_received(self) -> bool:
+        return False  # cierra; los lotes en curso igual se persisten
+
+    def data_received(self, data: bytes) -> None:
+        self._last_rx = time.monotonic()
+        self._stats.bytes_in += len(data)
+        self._bytes_in += len(data)
+        rx = self._rx
+        rx.feed(data)
+
+        if self.imei is None and (self._admitting or not self._handshake()):
+            return
+
+        while self._transport is not None and not self._paused:
+            frame = rx.next_frame()
+            if frame is None:
+                return
+            kind, payload = frame
+            if kind == FRAME_EMPTY:
+                self.close()  # keep-alive sin data
+                return
+            self._on_frame(kind, payload)
+
+    # ---------------------------------------------------------------
+    # Handshake / frames
+    # ---------------------------------------------------------------
+    def _handshake(self) -> bool:
+        rx = self._rx
+        imei_len = rx.peek_u16()
+        if imei_len is None or len(rx) < 2 + imei_len:
+            return False
+        rx.take(2)
+        imei = rx.take(imei_len).decode(errors="ignore")
+        adm = self._admission
+        ok = adm.check(imei) if adm is not None else True
+        if ok is None:
+            # miss: se espera la consulta sin leer más (los frames quedan en el buffer)
+            self._admitting = True
+            self._transport.pause_reading()
+            adm.resolve(imei).add_done_callback(lambda f: self._on_admission(imei, f))
+            return False
+        return self._admit(imei, ok)
+
+    def _on_admission(self, imei: str, fut: asyncio.Future) -> None:
+        self._admitting = False
+        ok = fut.cancelled() or fut.exception() is not None or fut.result()
+        if self._admit(imei, ok) and self._transport is not None:
+            self._transport.resume_reading()
+            self.data_received(b"")
+
+    def _admit(self, imei: str, ok: bool) -> bool:
+        if self._transport is None:
+            return False
+        if not ok:
+            n = LOG_SAMPLER.allow("rejected")
+            if n is not None:
+                log.info("Conexión %s IMEI=%s rechazado (no registrado)%s", self.peer, imei, suppressed_note(n))
+            self._write(b"\x00")
+            self.close()
+            return False
+        self.imei = imei
+        if self._sessions is not None:
+            self._sessions.bind(imei, self)
+        log.info("Conexión %s IMEI=%s", self.peer, imei)
+        self._write(b"\x01")
+        return True
+
+    def _on_frame(self, kind: int, payload: bytes) -> None:
+        if self.hex_dump and payload and log.isEnabledFor(logging.DEBUG):
+            log.debug("PAYLOAD HEX len=%d : %s", len(payload), LazyHex(payload))
+        if kind == FRAME_BAD_CRC:
+            self._stats.crc_errors += 1
+            if payload[:1] != b"\x0c":  # una respuesta Codec 12 no lleva ACK
+                self._push_ack(0, None)
+            return
+        if payload[0] == codec12.CODEC_12:
+            self._on_command_response(payload)
+            return
+
+        t0 = time.perf_counter()
+        try:
+            codec, n1, records, _ = self._decode(payload)
+            DECODE_SECONDS.observe(time.perf_counter() - t0)
+            if log.isEnabledFor(logging.INFO):
+                n = LOG_SAMPLER.allow(self.imei)
+                if n is not None:
+                    log.info("Paquete IMEI=%s codec=0x%02X records=%d (crc_ok=True)%s", self.imei, codec, n1, suppressed_note(n))
+        except Exception as e:
+            n = LOG_SAMPLER.allow(("decode", self.imei))
+            if n is not None:
+                log.error("Decode falló (IMEI=%s): %s%s", self.imei, e, suppressed_note(n))
+            self._stats.decode_errors += 1
+            self._push_ack(0, None)
+            return
+
+        self._stats.frames += 1
+        self._stats.last_seen[self.imei] = time.time()
+        self._frames += 1
+        self._last_frame = self._last_rx
+        # lote compartido -> API (bulk); si falla, fallback DB / spool
+        fut = self._batcher.enqueue(self.imei, codec, records)
+        self._push_ack(n1, fut, t0)
+
+    def _push_ack(self, n1: int, fut: Optional[asyncio.Future], t0: float = 0.0) -> None:
+        self._acks.append((n1, fut, t0))
+        if fut is None:
+            self._write_acks()
+        else:
+            fut.add_done_callback(self._on_ack_ready)
+            if len(self._acks) >= self.max_pending and not self._paused:
+                # equipo encolando más rápido de lo que persistimos
+                self._paused = True
+                self._transport.pause_reading()
+
+    def _on_ack_ready(self, _fut: asyncio.Future) -> None:
+        self._write_acks()
+
+    def _write_acks(self) -> None:
+        """ACK = cantidad de records sólo si quedaron persistidos; si no, 0 y el equipo reintenta."""
+        acks = self._acks
+        out = bytearray()
+        now = time.perf_counter()
+        while acks:
+            n1, fut, t0 = acks[0]
+            if fut is not None:
+                if not fut.done():
+                    break
+                ok = not fut.cancelled() and fut.exception() is None and fut.result()
+                if not ok:
+                    n1 = 0
+                ACK_SECONDS.observe(now - t0)
+            acks.popleft()
+            out += n1.to_bytes(4, "big") if n1 else _ACK_ZERO
+        if out and self._transport is not None:
+            self._write(bytes(out))
+
+        if self._draining and self._idle():
+            self.close()
+            return
+        if not acks and self._cmds:
+            self._pump_commands()
+        if self._paused and len(acks) < self.max_pending // 2 and self._transport is not None:
+            self._paused = False
+            self._transport.resume_reading()
+            # frames que quedaron en el buffer mientras estaba pausado
+            self.data_received(b"")
+
+    # ---------------------------------------------------------------
+    # Comandos Codec 12
+    # ---------------------------------------------------------------
+    def send_command(self, text: str, timeout: float = 30.0, max_queued: int = 16) -> asyncio.Future:
+        """
+        Future[str] con la respuesta del equipo (TimeoutError / ConnectionError si no llega).
+        El plazo corre desde que se encola: incluye la espera detrás de otros
+        comandos y de ACKs pendientes.
+        """
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        if self._transport is None:
+            fut.set_exception(ConnectionError("Conexión cerrada"))
+        elif len(self._cmds) >= max_queued:
+            fut.set_exception(OverflowError(f"Cola de comandos llena ({max_queued})"))
+        else:
+            timer = loop.call_later(timeout, self._on_command_timeout, fut)
+            fut.add_done_callback(lambda _f: timer.cancel())
+            self._cmds.append((codec12.encode_command(text), fut))
+            self._pump_commands()
+        return fut
+
+    def _pump_commands(self) -> None:
+        if self._cmd_inflight is not None or self._acks or self._transport is None or self.imei is None:
+            return
+        while self._cmds:
+            frame, fut = self._cmds.popleft()
+            if fut.done():  # vencido, o el que lo pidió ya no espera
+                continue
+            self._cmd_inflight = fut
+            self._write(frame)
+            return
+
+    def _on_command_response(self, payload: bytes) -> None:
+        try:
+            text = codec12.parse_response(payload)
+        except ValueError as e:
+            self._stats.decode_errors += 1
+            log.warning("Respuesta Codec 12 inválida (IMEI=%s): %s", self.imei, e)
+            return
+        if self._cmd_inflight is None:
+            log.debug("Respuesta Codec 12 sin comando en vuelo (IMEI=%s): %r", self.imei, text)
+            return
+        fut = self._cmd_inflight
+        self._release_command_slot()
+        if fut.done():
+            log.debug("Respuesta Codec 12 tardía descartada (IMEI=%s): %r", self.imei, text)
+        else:
+            fut.set_result(text)
+        self._pump_commands()
+
+    def _on_command_timeout(self, fut: asyncio.Future) -> None:
+        if fut.done():
+            return
+        fut.set_exception(asyncio.TimeoutError())
+        if self._cmd_inflight is fut:
+            # el equipo puede responder igual: el lugar sigue tomado un rato
+            self._cmd_grace = asyncio.get_running_loop().call_later(self.command_grace, self._on_command_grace, fut)
+        else:
+            # aún en cola: se saca para no ocupar cupo de max_queued
+            self._cmds = deque(c for c in self._cmds if c[1] is not fut)
+
+    def _on_command_grace(self, fut: asyncio.Future) -> None:
+        self._cmd_grace = None
+        if self._cmd_inflight is fut:
+            self._cmd_inflight = None
+            self._pump_commands()
+
+    def _release_command_slot(self) -> None:
+        self._cmd_inflight = None
+        if self._cmd_grace is not None:
+            self._cmd_grace.cancel()
+            self._cmd_grace = None
+
+    def _fail_commands(self, exc: Exception) -> None:
+        pending = [f for _frame, f in self._cmds]
+        self._cmds.clear()
+        if self._cmd_inflight is not None:
+            pending.append(self._cmd_inflight)
+        self._release_command_slot()
+        for fut in pending:
+            if not fut.done():
+                fut.set_exception(exc)
+
+    # ---------------------------------------------------------------
+    # Contabilidad
+    # ---------------------------------------------------------------
+    def buffers(self) -> Tuple[int, int, int, int]:
+        """(rx bufferizado, rx reservado, tx sin enviar, records esperando persistencia)."""
+        tx = self._transport.get_write_buffer_size() if self._transport is not None else 0
+        pending = sum(n1 for n1, fut, _t0 in self._acks if fut is not None)
+        return len(self._rx), self._rx.allocated, tx, pending
+
+    def session_info(self, now: float) -> Dict[str, Any]:
+        rx, rx_alloc, tx, pending = self.buffers()
+        return {
+            "imei": self.imei,
+            "peer": f"{self.peer[0]}:{self.peer[1]}" if self.peer else None,
+            "connected_s": round(now - self._connected_at, 1),
+            "idle_s": round(now - self._last_rx, 1),
+            "since_last_frame_s": round(now - self._last_frame, 1) if self._frames else None,
+            "frames": self._frames,
+            "bytes_in": self._bytes_in,
+            "bytes_out": self._bytes_out,
+            "rx_buffer_bytes": rx,
+            "rx_buffer_alloc_bytes": rx_alloc,
+            "tx_buffer_bytes": tx,
+            "paused": self._paused or self._admitting,
+            "pending_acks": len(self._acks),
+            "pending_records": pending,
+            "pending_commands": len(self._cmds) + (self._cmd_inflight is not None and not self._cmd_inflight.done()),
+        }
+
+    # ---------------------------------------------------------------
+    # Drenado
+    # ---------------------------------------------------------------
+    def drain(self, delay: float = 0.0) -> None:
+        """Cierra la conexión tras `delay` s, sin cortar un ACK pendiente."""
+        if self._transport is None:
+            return
+        asyncio.get_running_loop().call_later(delay, self._start_drain)
+
+    def close(self) -> None:
+        """Cierra ya, sin esperar ACKs pendientes: el equipo reenvía lo que no recibió ACK."""
+        if self._transport is not None:
+            self._transport.close()
+
+    def _start_drain(self) -> None:
+        self._draining = True
+        if self._idle():
+            self.close()
+        # si no, cierra _write_acks al escribir el último ACK
+
+    def _idle(self) -> bool:
+        # el buffer rx no cuenta: puede quedar un resto que nunca completa un frame
+        return not self._acks
+
+    # ---------------------------------------------------------------
+    def _on_timer(self) -> None:
+        self._timer = None
+        if self._transport is None:
+            return
+        idle = time.monotonic() - self._last_rx
+        if idle >= self.read_timeout:
+            if self._acks:
+                # esperando persistencia, no inactividad del equipo
+                self._timer = asyncio.get_running_loop().call_later(self.read_timeout, self._on_timer)
+                return
+            self._stats.timeouts += 1
+            log.debug("Timeout de lectura con %s (IMEI=%s)", self.peer, self.imei)
+            self.close()
+            return
+        self._timer = asyncio.get_running_loop().call_later(self.read_timeout - idle, self._on_timer)
+
+    def _write(self, data: bytes) -> None:
+        self._bytes_out += len(data)
+        self._transport.write(data)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Memoria del proceso, para dimensionar hosts por cantidad de conexiones.
+
+- `summary()`: RSS, tasks asyncio vivas y totales de buffers / records
+  pendientes de las conexiones (SessionRegistry.accounting) con el costo
+  promedio por conexión.
+- tracemalloc bajo demanda: `start(frames)` / `stop()`; `top()` toma un
+  snapshot y devuelve los sitios de asignación con más memoria viva; con
+  `diff` compara contra el snapshot anterior (qué creció entre dos llamadas).
+
+tracemalloc agrega CPU y memoria por asignación: activarlo sólo para medir
+(TRACEMALLOC=N lo arranca al inicio con N frames por traza).
+"""
+
+import asyncio
+import gc
+import os
+import resource
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+_KEYS = ("lineno", "filename", "traceback")
+_IGNORE = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+_last: Optional[tracemalloc.Snapshot] = None
+
+
+def rss_bytes() -> int:
+    """RSS actual (Linux: /proc/self/statm); si no, el máximo (ru_maxrss)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def summary(accounting: Dict[str, int]) -> Dict[str, Any]:
+    rss = rss_bytes()
+    conns = accounting.get("connections", 0)
+    out: Dict[str, Any] = {
+        "rss_bytes": rss,
+        "rss_per_connection_bytes": rss // conns if conns else None,
+        "asyncio_tasks": len(asyncio.all_tasks()),
+        "gc_counts": list(gc.get_count()),
+        **accounting,
+        "tracemalloc": tracemalloc.is_tracing(),
+    }
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        out["traced_bytes"] = current
+        out["traced_peak_bytes"] = peak
+        out["tracemalloc_overhead_bytes"] = tracemalloc.get_tracemalloc_memory()
+    return out
+
+
+def start(frames: int = 1) -> None:
+    global _last
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _last = None
+    tracemalloc.start(max(1, frames))
+
+
+def stop() -> None:
+    global _last
+    _last = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def top(limit: int = 25, key: str = "lineno", diff: bool = False) -> Dict[str, Any]:
+    """Top de sitios de asignación; RuntimeError si tracemalloc no está activo.
+
+    Bloquea mientras toma el snapshot (con muchas trazas, cientos de ms):
+    llamarlo fuera del loop (run_in_executor).
+    """
+    global _last
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc inactivo")
+    if key not in _KEYS:
+        raise ValueError(f"key debe ser uno de {_KEYS}")
+    snap = tracemalloc.take_snapshot().filter_traces(_IGNORE)
+    prev, _last = _last, snap
+
+    compare = diff and prev is not None
+    stats = snap.compare_to(prev, key) if compare else snap.statistics(key)
+    sites: List[Dict[str, Any]] = []
+    for st in stats[:limit]:
+        site = {"site": _site(st.traceback, key), "size_bytes": st.size, "count": st.count}
+        if compare:
+            site["size_diff_bytes"] = st.size_diff
+            site["count_diff"] = st.count_diff
+        sites.append(site)
+    return {
+        "key": key,
+        "diff": compare,
+        "traced_bytes": sum(st.size for st in stats),
+        "sites": sites,
+    }
+
+
+def _site(tb: tracemalloc.Traceback, key: str):
+    if key == "traceback":
+        return [f"{fr.filename}:{fr.lineno}" for fr in tb]
+    fr = tb[0]
+    return fr.filename if key == "filename" else f"{fr.filename}:{fr.lineno}"
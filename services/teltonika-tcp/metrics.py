@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Registro de métricas en proceso con exposición en formato texto de Prometheus
+(sin dependencias: el servicio sólo necesita contadores, gauges e histogramas).
+
+- Counter / Gauge / Histogram: objetos con __slots__; `inc()` / `observe()`
+  son un par de operaciones aritméticas (sin locks: todo corre en el loop).
+- Métricas "callback": se calculan al momento del scrape a partir de los
+  contadores que ya existen (FramingStats, IngestBatcher, Spool...), así el
+  hot path no paga nada extra.
+- `serve()` levanta un endpoint HTTP mínimo (GET /metrics) sobre asyncio;
+  `serve_http()` es el mismo servidor con rutas propias (ver control.py).
+"""
+
+import asyncio
+import bisect
+import logging
+import math
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from urllib.parse import parse_qsl
+
+log = logging.getLogger("teltonika-tcp.metrics")
+
+Labels = Dict[str, str]
+Sample = Tuple[Labels, float]
+CallbackResult = Union[float, int, Iterable[Sample]]
+
+# latencias típicas del servicio (segundos): decode ~µs, API/DB ~ms..s
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _fmt(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    if isinstance(v, int) or float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class Counter:
+    __slots__ = ("name", "help", "value")
+    kind = "counter"
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, n: float = 1) -> None:
+        self.value += n
+
+    def samples(self) -> List[Tuple[str, Labels, float]]:
+        return [(self.name, {}, self.value)]
+
+
+class Gauge(Counter):
+    __slots__ = ()
+    kind = "gauge"
+
+    def set(self, v: float) -> None:
+        self.value = v
+
+    def dec(self, n: float = 1) -> None:
+        self.value -= n
+
+
+class Histogram:
+    __slots__ = ("name", "help", "buckets", "counts", "sum", "count")
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # último = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, v)] += 1
+        self.sum += v
+        self.count += 1
+
+    def samples(self) -> List[Tuple[str, Labels, float]]:
+        out = []
+        acc = 0
+        for bound, c in zip(self.buckets + (math.inf,), self.counts):
+            acc += c
+            out.append((self.name + "_bucket", {"le": _fmt(bound)}, acc))
+        out.append((self.name + "_sum", {}, self.sum))
+        out.append((self.name + "_count", {}, self.count))
+        return out
+
+
+class _Callback:
+    __slots__ = ("name", "help", "kind", "fn")
+
+    def __init__(self, name: str, kind: str, help: str, fn: Callable[[], CallbackResult]) -> None:
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.fn = fn
+
+    def samples(self) -> List[Tuple[str, Labels, float]]:
+        res = self.fn()
+        if isinstance(res, (int, float)):
+            return [(self.name, {}, res)]
+        return [(self.name, labels, v) for labels, v in res]
+
+
+class Registry:
+    def __init__(self, prefix: str = "") -> None:
+        self.prefix = prefix
+        self._metrics: Dict[str, object] = {}
+        self.scrapes = 0
+
+    def _add(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Métrica duplicada: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._add(Counter(self.prefix + name, help))
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._add(Gauge(self.prefix + name, help))
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(self.prefix + name, help, buckets))
+
+    def callback(self, name: str, kind: str, help: str, fn: Callable[[], CallbackResult]) -> None:
+        """Métrica calculada en el scrape; fn devuelve un número o [(labels, valor), ...]."""
+        self._add(_Callback(self.prefix + name, kind, help, fn))
+
+    def render(self) -> str:
+        self.scrapes += 1
+        lines: List[str] = []
+        for m in self._metrics.values():
+            try:
+                samples = m.samples()
+            except Exception as e:
+                log.debug("Métrica %s falló: %s", m.name, e)
+                continue
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            for name, labels, v in samples:
+                lines.append(f"{name}{_labels(labels)} {_fmt(v)}")
+        lines.append("")
+        return "\n".join(lines)
+
+
+# registro por defecto del proceso (cada worker tiene el suyo)
+REGISTRY = Registry(prefix="teltonika_")
+
+
+# -------------------------------------------------------------------
+# Endpoint HTTP
+# -------------------------------------------------------------------
+# route(method, path, query, body) -> (status, content_type, body)
+Route = Callable[[str, str, Dict[str, str], bytes], Awaitable[Tuple[int, str, bytes]]]
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            409: "Conflict", 413: "Payload Too Large", 429: "Too Many Requests", 500: "Internal Server Error",
+            502: "Bad Gateway", 504: "Gateway Timeout"}
+_MAX_BODY = 64 * 1024
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, route: Route) -> None:
+    try:
+        request = await asyncio.wait_for(reader.readline(), timeout=5.0)
+        length = 0
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout=5.0)
+            if not line or line in (b"\r\n", b"\n"):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value.strip() or 0)
+        parts = request.decode("latin-1").split()
+        if len(parts) < 2:
+            return
+        if length > _MAX_BODY:
+            status, ctype, body = 413, "text/plain", b"payload too large\n"
+        else:
+            data = await asyncio.wait_for(reader.readexactly(length), timeout=5.0) if length else b""
+            path, _, query = parts[1].partition("?")
+            status, ctype, body = await route(parts[0], path, dict(parse_qsl(query)), data)
+        writer.write(
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\nContent-Type: {ctype}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except Exception as e:
+        log.debug("Request HTTP falló: %s", e)
+    finally:
+        writer.close()
+
+
+async def serve_http(host: str, port: int, route: Route) -> asyncio.AbstractServer:
+    """Servidor HTTP/1.1 mínimo (una request por conexión) para endpoints internos."""
+    return await asyncio.start_server(lambda r, w: _handle(r, w, route), host, port)
+
+
+async def serve(host: str, port: int, registry: Optional[Registry] = None) -> asyncio.AbstractServer:
+    reg = registry or REGISTRY
+
+    async def route(method: str, path: str, _query: Dict[str, str], _body: bytes) -> Tuple[int, str, bytes]:
+        if method == "GET" and path in ("/metrics", "/"):
+            return 200, "text/plain; version=0.0.4; charset=utf-8", reg.render().encode()
+        return 404, "text/plain", b"not found\n"
+
+    server = await serve_http(host, port, route)
+    log.info("Métricas en http://%s:%d/metrics", host, port)
+    return server
@@ -2,30 +2,63 @@
 # -*- coding: utf-8 -*-
 
 import asyncio
-import struct
-import json
 import os
 import logging
-from typing import Tuple, Dict, Any, List, Optional
-
-import requests
-
-try:
-    import psycopg  # Fallback DB opcional
-except Exception:
-    psycopg = None
+import random
+import signal
+import socket
+import subprocess
+import sys
+from functools import partial
+from typing import Any, Dict, List, Optional, Set
+
+import avl_batch
+import control
+import memprof
+import crc16
+import fastlog
+import metrics
+from admission import AdmissionCache
+from avl import decode_avl_payload
+from batcher import IngestBatcher, Pending
+from db_fallback import DbFallback
+from framing import LOG_SAMPLER, FramingStats, TeltonikaProtocol
+from forwarder import ApiForwarder
+from sessions import SessionRegistry
+from spool import Spool
+from supervisor import WorkerSupervisor
+from udp import TeltonikaDatagramProtocol, UdpStats
 
 # -------------------------------------------------------------------
 # Configuración
 # -------------------------------------------------------------------
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
-logging.basicConfig(level=LOG_LEVEL, format="%(levelname)s:%(name)s:%(message)s")
+# Multi-proceso (SO_REUSEPORT): 1 = proceso único como siempre
+TCP_WORKERS = int(os.getenv("TCP_WORKERS", "1"))
+WORKER_HEARTBEAT = float(os.getenv("WORKER_HEARTBEAT", "2"))  # s, heartbeat + snapshot al supervisor
+WORKER_HEALTH_TIMEOUT = float(os.getenv("WORKER_HEALTH_TIMEOUT", "30"))  # s sin heartbeat => restart
+
+_LOG_FORMAT = "%(levelname)s:%(processName)s:%(name)s:%(message)s" if TCP_WORKERS > 1 else "%(levelname)s:%(name)s:%(message)s"
+# logging en cola + thread (LOG_ASYNC=0 => síncrono); ver fastlog.py
+log_handler = fastlog.setup(LOG_LEVEL, _LOG_FORMAT)
 log = logging.getLogger("teltonika-tcp")
+logging.getLogger("httpx").setLevel(logging.WARNING)  # no loguear cada POST
 
 API_BASE = os.getenv("API_BASE", "http://api:8000").rstrip("/")
-INGEST_URL = f"{API_BASE}/ingest/teltonika/ingest"
+INGEST_URL = f"{API_BASE}/ingest/teltonika/bulk"  # lotes multi-dispositivo
 REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "5.0"))
 
+# Reenvío asíncrono: pool keep-alive + concurrencia acotada
+API_MAX_IN_FLIGHT = int(os.getenv("API_MAX_IN_FLIGHT", "64"))
+API_MAX_CONNECTIONS = int(os.getenv("API_MAX_CONNECTIONS", "32"))
+API_KEEPALIVE_EXPIRY = float(os.getenv("API_KEEPALIVE_EXPIRY", "30"))
+API_TRANSPORT = os.getenv("API_TRANSPORT", "msgpack").lower()  # msgpack | json
+STATS_INTERVAL = float(os.getenv("STATS_INTERVAL", "60"))  # s, 0 = sin log periódico
+
+# Coalescencia de records entre conexiones (BATCH_LINGER_MS=0 => envío inmediato)
+BATCH_MAX_RECORDS = int(os.getenv("BATCH_MAX_RECORDS", "500"))
+BATCH_LINGER_MS = float(os.getenv("BATCH_LINGER_MS", "50"))
+
 # Auditoría (opcional)
 AUDIT_ENABLED = os.getenv("AUDIT_ENABLED", "0").lower() in ("1", "true", "yes", "on")
 AUDIT_URL = f"{API_BASE}/audit/emit"
@@ -37,520 +70,556 @@ DB_PORT = int(os.getenv("POSTGRES_PORT") or os.getenv("DB_PORT") or "5432")
 DB_NAME = os.getenv("POSTGRES_DB") or os.getenv("DB_NAME", "quantumfleet")
 DB_USER = os.getenv("POSTGRES_USER") or os.getenv("DB_USER", "quantum")
 DB_PASSWORD = os.getenv("POSTGRES_PASSWORD") or os.getenv("DB_PASSWORD")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "8"))
+DEVICE_CACHE_TTL = float(os.getenv("DEVICE_CACHE_TTL", "600"))  # s, caché IMEI -> device_id
+
+# Admisión de IMEI en el handshake (IMEI sin device => 0x00); si la DB no responde se admite
+IMEI_ADMISSION = os.getenv("IMEI_ADMISSION", "1").lower() in ("1", "true", "yes", "on")
+ADMISSION_TTL = float(os.getenv("ADMISSION_TTL", "600"))  # s, IMEI conocido
+ADMISSION_NEGATIVE_TTL = float(os.getenv("ADMISSION_NEGATIVE_TTL", "60"))  # s, IMEI desconocido
+ADMISSION_REFRESH = float(os.getenv("ADMISSION_REFRESH", "30"))  # s, carga incremental de devices nuevos
+# El fallback DB crea devices para IMEIs desconocidos sólo sin admisión (con admisión se descartan)
+DB_AUTO_CREATE_DEVICES = os.getenv("DB_AUTO_CREATE_DEVICES", "0" if IMEI_ADMISSION else "1").lower() in ("1", "true", "yes", "on")
+
+# Spool en disco cuando API y DB fallan a la vez (SPOOL_DIR vacío => deshabilitado).
+# Con TCP_WORKERS > 1 cada worker usa su propio subdirectorio SPOOL_DIR/worker-<n>.
+SPOOL_DIR = os.getenv("SPOOL_DIR", "")
+SPOOL_SEGMENT_MB = int(os.getenv("SPOOL_SEGMENT_MB", "16"))
+SPOOL_FSYNC_MS = float(os.getenv("SPOOL_FSYNC_MS", "20"))  # ventana de group commit
+SPOOL_REPLAY_BATCH = int(os.getenv("SPOOL_REPLAY_BATCH", "200"))  # items por re-entrega
+SPOOL_REPLAY_RATE = float(os.getenv("SPOOL_REPLAY_RATE", "2000"))  # records/s, 0 = sin límite
+SPOOL_REPLAY_BACKOFF = float(os.getenv("SPOOL_REPLAY_BACKOFF", "5"))  # s entre reintentos
 
 TCP_HOST = os.getenv("TCP_HOST", os.getenv("LISTEN_HOST", "0.0.0.0"))
 TCP_PORT = int(os.getenv("TCP_PORT", os.getenv("LISTEN_PORT", "5027")))
+# Canal UDP (AVL sobre UDP, ver udp.py); 0 = deshabilitado
+UDP_PORT = int(os.getenv("UDP_PORT", "0"))
+UDP_MAX_PENDING = int(os.getenv("UDP_MAX_PENDING", "4096"))  # datagramas en curso antes de descartar
+# Tope de IMEIs recordados (último frame, duplicados UDP): el IMEI lo manda el equipo
+MAX_TRACKED_IMEIS = int(os.getenv("MAX_TRACKED_IMEIS", "100000"))
+
+# Drenado en SIGTERM: deja de aceptar, termina frames/ACK en curso y cierra cada
+# conexión en un instante aleatorio de [0, DRAIN_JITTER] s (las reconexiones se
+# reparten en vez de llegar todas juntas); a los DRAIN_TIMEOUT s se corta lo que quede.
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "30"))
+DRAIN_JITTER = float(os.getenv("DRAIN_JITTER", "20"))
+# Relevo (SIGUSR2, proceso único): el proceso nuevo hereda los sockets de escucha
+# por estas variables (fds) y el actual drena. Con TCP_WORKERS > 1 los sockets
+# usan SO_REUSEPORT: se arranca la instancia nueva y luego SIGTERM a la vieja.
+TCP_LISTEN_FDS = os.getenv("TCP_LISTEN_FDS", "")
+UDP_LISTEN_FD = os.getenv("UDP_LISTEN_FD", "")
+
+# Endpoint de métricas Prometheus (0 = deshabilitado); con TCP_WORKERS > 1 cada worker usa METRICS_PORT + n.
+# Sin autenticación (incluye IMEIs): sólo loopback salvo que METRICS_HOST lo abra (p.ej. red interna de compose).
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9105"))
+METRICS_PER_IMEI = os.getenv("METRICS_PER_IMEI", "1").lower() in ("1", "true", "yes", "on")
+
+# Endpoint de control local (sesiones + comandos Codec 12, ver control.py); 0 = deshabilitado
+CONTROL_HOST = os.getenv("CONTROL_HOST", "127.0.0.1")
+CONTROL_PORT = int(os.getenv("CONTROL_PORT", "9205"))
+COMMAND_TIMEOUT = float(os.getenv("COMMAND_TIMEOUT", "30"))  # s por comando por defecto
+COMMAND_GRACE = float(os.getenv("COMMAND_GRACE", "5"))  # s esperando la respuesta tardía de un comando vencido
+# tracemalloc desde el arranque con N frames (0 = off; se puede activar luego por el control, ver memprof.py)
+TRACEMALLOC = int(os.getenv("TRACEMALLOC", "0"))
 
 READ_TIMEOUT = float(os.getenv("READ_TIMEOUT", "15"))  # s
+# Decode por lotes con NumPy para backlogs (se ignora si numpy no está instalado)
+AVL_BATCH_DECODE = os.getenv("AVL_BATCH_DECODE", "1").lower() in ("1", "true", "yes", "on")
+AVL_BATCH_MIN_RUN = int(os.getenv("AVL_BATCH_MIN_RUN", "16"))  # records homogéneos mínimos por tramo
+MAX_FRAME_BYTES = int(os.getenv("MAX_FRAME_BYTES", "65536"))  # LEN mayor => preámbulo falso, re-sync
+MAX_PENDING_FRAMES = int(os.getenv("MAX_PENDING_FRAMES", "32"))  # frames sin ACK por conexión antes de pausar lectura
 HEX_DUMP_DEBUG = os.getenv("HEX_DUMP_DEBUG", "0").lower() in ("1", "true", "yes", "on")
 
 # -------------------------------------------------------------------
-# IO 
+# Fallback DB
 # -------------------------------------------------------------------
-IO_NAME_MAP = {
-    239: "Ignition",
-    240: "Movement",
-    21: "GSM Signal",
-    200: "Sleep Mode",
-    71: "GNSS Status",
-    182: "GNSS HDOP",
-    66: "External Voltage",
-    24: "Speed",
-    205: "GSM Cell ID",
-    67: "Battery Voltage",
-    68: "Battery Current",
-    199: "Trip Odometer",
-    216: "Total Odometer",
-    1: "Digital Input 1",
-    9: "Analog Input 1",
-    179: "Digital Output 1",
-    219: "CCID Part1",
-    220: "CCID Part2",
-    221: "CCID Part3",
-    2: "Digital Input 2",
-    3: "Digital Input 3",
-    10: "Analog Input 2",
-    180: "Digital Output 2",
-    72: "Dallas Temperature 1",
-    73: "Dallas Temperature 2",
-    74: "Dallas Temperature 3",
-    75: "Dallas Temperature 4",
-    62: "Dallas Temperature ID 1",
-    63: "Dallas Temperature ID 2",
-    64: "Dallas Temperature ID 3",
-    65: "Dallas Temperature ID 4",
-    78: "iButton",
-    76: "Fuel Counter",
-    10640: "Impulse counter frequency 1",
-    10641: "Impulse counter RPM 1",
-    483: "Impulse Counter 2",
-    10642: "Impulse counter frequency 2",
-    10643: "Impulse counter RPM 2",
-    10911: "Impulse counter value 1",
-    10912: "Impulse counter value 3",
-    10913: "Impulse counter frequency 3",
-    10914: "Impulse counter RPM 3",
-    10915: "Impulse counter value 4",
-    10916: "Impulse counter frequency 4",
-    10917: "Impulse counter RPM 4",
-    4: "Digital Input 4",
-    50: "Digital Output 3",
-    51: "Digital Output 4",
-    11: "Analog Input 3",
-    245: "Analog Input 4",
-    70: "PCB Temperature",
-    5: "Dallas Temperature ID 5",
-    10487: "1Wire Humidity 1",
-    10488: "1Wire Humidity 2",
-    449: "Ignition On Counter",
-    1161: "IMEI",
-    1148: "Connectivity Quality",
-    87: "Fuel Level",
-    88: "Engine Speed",
-    89: "Axle weight 1",
-    90: "Axle weight 2",
-    135: "Fuel Rate",
-    10348: "Fuel level 2",
-    12: "Program Number",
-    13: "Module ID",
-    14: "Engine Worktime",
-    15: "Engine Worktime (Counted)",
-    16: "Total Mileage (Counted)",
-    17: "Fuel Consumed (counted)",
-    18: "Fuel Rate",
-    19: "AdBlue Level Percent",
-    20: "AdBlue Level Liters",
-    23: "Engine Load",
-    25: "Engine Temperature",
-    26: "Axle 1 Load",
-    27: "Axle 2 Load",
-    30: "Vehicle Speed",
-    31: "Accelerator Pedal Position",
-    33: "Fuel Consumed",
-    34: "Fuel Level Liters",
-    35: "Engine RPM",
-    36: "Total Mileage",
-    37: "Fuel Level Percent",
-    141: "Battery Temperature",
-    142: "Battery Level Percent",
-    143: "Door Status",
-    521: "Load Weight",
-    250: "Trip",
-    247: "Crash Detection",
-    251: "Immobilizer",
-    254: "Green Driving Value",
-    249: "Jamming",
-    10611: "RS232_COM1Data",
-    10612: "RS232_COM2Data",
-    191: "Vehicle Speed",
-    192: "Odometer",
-    193: "Trip Distance",
-    194: "Timestamp",
-    10683: "Temperature 1",
-    10684: "Temperature 2",
-    10685: "Temperature 3",
-    10686: "Temperature 4",
-    10687: "Status 1",
-    10688: "Status 2",
-    10691: "Alarm 1",
-    10692: "Alarm 2",
-    10695: "Input 1",
-    10696: "Input 2",
-    10697: "Input 3",
-    10698: "Input 4",
-    701: "BLE Temperature 1",
-    702: "BLE Temperature 2",
-    705: "BLE Battery 1",
-    706: "BLE Battery 2",
-    709: "BLE Humidity 1",
-    710: "BLE Humidity 2"
-}
+db_fallback = DbFallback(
+    DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD,
+    min_size=DB_POOL_MIN,
+    max_size=DB_POOL_MAX,
+    cache_ttl=DEVICE_CACHE_TTL,
+    auto_create=DB_AUTO_CREATE_DEVICES,
+)
+
+admission = AdmissionCache(
+    db_fallback,
+    ttl=ADMISSION_TTL,
+    negative_ttl=ADMISSION_NEGATIVE_TTL,
+    refresh=ADMISSION_REFRESH,
+) if IMEI_ADMISSION and db_fallback.available else None
 
 # -------------------------------------------------------------------
-# Utilidades
+# Ingest a API (asíncrono, ver forwarder.py) + coalescencia (batcher.py)
 # -------------------------------------------------------------------
-def _need(buf: bytes, pos: int, need: int, what: str) -> None:
-    if pos + need > len(buf):
-        raise ValueError(f"Payload truncado: {what} (pos={pos}, need={need}, len={len(buf)})")
+forwarder = ApiForwarder(
+    INGEST_URL,
+    timeout=REQUEST_TIMEOUT,
+    max_in_flight=API_MAX_IN_FLIGHT,
+    max_connections=API_MAX_CONNECTIONS,
+    keepalive_expiry=API_KEEPALIVE_EXPIRY,
+    transport=API_TRANSPORT,
+)
+
+
+async def _fallback_db(items: List[Dict[str, Any]]) -> Optional[Set[str]]:
+    """Todo el sub-lote en una transacción (COPY); IMEIs sin device descartados, o None si falló."""
+    try:
+        _rows, unknown = await db_fallback.insert_batch([(it["imei"], it["records"]) for it in items])
+        return unknown
+    except Exception as e:
+        log.error("Fallback DB falló (%d IMEIs): %s", len(items), e)
+        return None
 
-def _u8(buf: bytes, pos: int) -> Tuple[int, int]:
-    _need(buf, pos, 1, "u8")
-    return buf[pos], pos + 1
 
-def _u16(buf: bytes, pos: int) -> Tuple[int, int]:
-    _need(buf, pos, 2, "u16")
-    return struct.unpack_from(">H", buf, pos)[0], pos + 2
+async def _deliver_items(items: List[Dict[str, Any]]) -> List[Optional[bool]]:
+    """
+    Un POST bulk a la API; lo que no aceptó (lote fallido o IMEI desconocido) va al fallback DB.
+    Por item: True persistido, False falló (reintentable), None descartado (IMEI sin device).
+    """
+    statuses = await forwarder.bulk_ingest(items)
+    if statuses is None:
+        statuses = ["error"] * len(items)
 
-def _u32(buf: bytes, pos: int) -> Tuple[int, int]:
-    _need(buf, pos, 4, "u32")
-    return struct.unpack_from(">I", buf, pos)[0], pos + 4
+    results: List[Optional[bool]] = [st == "ok" for st in statuses]
+    retry = [i for i, ok in enumerate(results) if not ok]
+    if retry:
+        unknown = await _fallback_db([items[i] for i in retry])
+        if unknown is not None:
+            for i in retry:
+                results[i] = None if items[i]["imei"] in unknown else True
+    return results
 
-def _i32(buf: bytes, pos: int) -> Tuple[int, int]:
-    _need(buf, pos, 4, "i32")
-    return struct.unpack_from(">i", buf, pos)[0], pos + 4
 
-def _u64(buf: bytes, pos: int) -> Tuple[int, int]:
-    _need(buf, pos, 8, "u64")
-    return struct.unpack_from(">Q", buf, pos)[0], pos + 8
+async def deliver_batch(batch: List[Pending]) -> List[bool]:
+    """
+    Sink del batcher: API bulk -> fallback DB -> spool en disco.
+    Lo que quedó en el spool se considera aceptado (ACK al equipo) y se
+    re-entrega en segundo plano cuando la API/DB vuelven.
+    """
+    items = [{"imei": p.imei, "codec": p.codec, "records": p.records} for p in batch]
+    results = await _deliver_items(items)
 
-def _to_hex_be(value: int, byte_len: int) -> str:
-    return value.to_bytes(byte_len, "big", signed=False).hex()
+    # los descartados (None) no van al spool: el ACK sale en 0
+    failed = [i for i, ok in enumerate(results) if ok is False]
+    if failed and spool is not None:
+        try:
+            await spool.append([items[i] for i in failed])
+            for i in failed:
+                results[i] = True
+        except Exception as e:
+            log.error("Spool falló (%d items): %s", len(failed), e)
+    return [bool(ok) for ok in results]
 
-def _reverse_hex_bytes(hex_str: str) -> str:
-    return "".join([hex_str[i:i+2] for i in range(0, len(hex_str), 2)][::-1])
 
-def _ascii_from_hex(hex_str: str) -> str:
-    try:
-        return bytes.fromhex(hex_str).decode("ascii", errors="ignore")
-    except Exception:
-        return ""
-
-def _set_named(io_out: dict, io_id: int, value):
-    name = IO_NAME_MAP.get(io_id)
-    if name:
-        io_out[name] = value
-    else:
-        io_out[str(io_id)] = value
-
-# CRC16/IBM (0xA001, init 0x0000)
-def crc16_ibm(data: bytes) -> int:
-    crc = 0x0000
-    for b in data:
-        crc ^= b
-        for _ in range(8):
-            if (crc & 1) != 0:
-                crc = (crc >> 1) ^ 0xA001
-            else:
-                crc >>= 1
-    return crc & 0xFFFF
-
-async def read_exact(reader: asyncio.StreamReader, n: int) -> bytes:
-    return await asyncio.wait_for(reader.readexactly(n), timeout=READ_TIMEOUT)
-
-# Lee 4x00 + LEN(4) + DATA(LEN) + CRC(4). Valida CRC16 sobre DATA (se comparan 16 bits bajos del CRC de 32 bits).
-async def read_frame(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
-    # preámbulo
-    preamble = await read_exact(reader, 4)
-    if preamble != b"\x00\x00\x00\x00":
-        # re-sync byte a byte
-        buf = bytearray(preamble)
-        while True:
-            b = await read_exact(reader, 1)
-            buf.pop(0); buf.append(b[0])
-            if buf == b"\x00\x00\x00\x00":
-                break
-    # len
-    len_bytes = await read_exact(reader, 4)
-    data_len = struct.unpack(">I", len_bytes)[0]
-    if data_len <= 0:
-        return data_len, b""
-
-    # data + crc
-    payload = await read_exact(reader, data_len)
-    crc_recv_b = await read_exact(reader, 4)
-    crc_recv = struct.unpack(">I", crc_recv_b)[0]
-    crc_calc = crc16_ibm(payload) & 0xFFFF
-    crc_ok = ((crc_recv & 0xFFFF) == crc_calc)
-
-    if not crc_ok:
-        if log.isEnabledFor(logging.DEBUG):
-            log.debug("CRC inválido (calc=0x%04X, recv=0x%04X) => ACK=0", crc_calc, crc_recv & 0xFFFF)
-        return -1, payload  # señalamos CRC malo
-    return data_len, payload
+async def replay_spooled(items: List[Dict[str, Any]]) -> bool:
+    """Sink del replayer: True si todo el lote quedó persistido o descartado (si no, se reintenta entero)."""
+    payload = [{"imei": it["imei"], "codec": it["codec"], "records": it["records"]} for it in items]
+    return all(ok is not False for ok in await _deliver_items(payload))
 
-# -------------------------------------------------------------------
-# Decodificación Teltonika AVL (Codec 08 / 8E)
-# -------------------------------------------------------------------
-def decode_avl_payload(payload: bytes) -> Tuple[int, int, List[Dict[str, Any]], bool]:
-    """
-    Retorna: codec, total_records (según cabecera), records_list, crc_ok_assumed(True si read_frame validó)
-    """
-    pos = 0
-    codec, pos = _u8(payload, pos)
-    if codec not in (0x08, 0x8E):
-        raise ValueError(f"Codec no soportado: 0x{codec:02X}")
-
-    n1, pos = _u8(payload, pos)
-    records: List[Dict[str, Any]] = []
-
-    for _ in range(n1):
-        rec: Dict[str, Any] = {}
-        ts_ms, pos = _u64(payload, pos)
-        prio, pos = _u8(payload, pos)
-
-        lon, pos = _i32(payload, pos)
-        lat, pos = _i32(payload, pos)
-        alt, pos = _u16(payload, pos)
-        angle, pos = _u16(payload, pos)
-        sats, pos = _u8(payload, pos)
-        speed, pos = _u16(payload, pos)
-
-        # Event ID + total IO: tamaños varían por codec
-        if codec == 0x08:
-            event_id, pos = _u8(payload, pos)
-            total_io, pos = _u8(payload, pos)
-        else:  # 0x8E
-            event_id, pos = _u16(payload, pos)
-            total_io, pos = _u16(payload, pos)
-
-        io_by_size: Dict[int, Dict[int, int]] = {1: {}, 2: {}, 4: {}, 8: {}}
-        xbytes_map: Dict[int, str] = {}
-        # ---- Grupo 1 byte ----
-        if codec == 0x08:
-            c1, pos = _u8(payload, pos)
-            for _k in range(c1):
-                io_id, pos = _u8(payload, pos)   # ID = 1 byte en 0x08
-                val,   pos = _u8(payload, pos)
-                io_by_size[1][io_id] = val
-        else:  # 0x8E
-            c1, pos = _u16(payload, pos)
-            for _k in range(c1):
-                io_id, pos = _u16(payload, pos)  # ID = 2 bytes en 0x8E
-                val,   pos = _u8(payload, pos)
-                io_by_size[1][io_id] = val
-
-        # ---- Grupo 2 bytes ----
-        if codec == 0x08:
-            c2, pos = _u8(payload, pos)
-            for _k in range(c2):
-                io_id, pos = _u8(payload, pos)
-                val,   pos = _u16(payload, pos)
-                io_by_size[2][io_id] = val
-        else:
-            c2, pos = _u16(payload, pos)
-            for _k in range(c2):
-                io_id, pos = _u16(payload, pos)
-                val,   pos = _u16(payload, pos)
-                io_by_size[2][io_id] = val
-
-        # ---- Grupo 4 bytes ----
-        if codec == 0x08:
-            c4, pos = _u8(payload, pos)
-            for _k in range(c4):
-                io_id, pos = _u8(payload, pos)
-                val,   pos = _u32(payload, pos)
-                io_by_size[4][io_id] = val
-        else:
-            c4, pos = _u16(payload, pos)
-            for _k in range(c4):
-                io_id, pos = _u16(payload, pos)
-                val,   pos = _u32(payload, pos)
-                io_by_size[4][io_id] = val
-
-        # ---- Grupo 8 bytes ----
-        if codec == 0x08:
-            c8, pos = _u8(payload, pos)
-            for _k in range(c8):
-                io_id, pos = _u8(payload, pos)
-                val,   pos = _u64(payload, pos)
-                io_by_size[8][io_id] = val
-        else:
-            c8, pos = _u16(payload, pos)
-            for _k in range(c8):
-                io_id, pos = _u16(payload, pos)
-                val,   pos = _u64(payload, pos)
-                io_by_size[8][io_id] = val
-
-        # ---- Grupo X-bytes (sólo 8E, ya estaba OK) ----
-        if codec == 0x8E:
-            cx, pos = _u16(payload, pos)
-            for _k in range(cx):
-                io_id, pos = _u16(payload, pos)
-                vlen,  pos = _u16(payload, pos)
-                _need(payload, pos, vlen, f"xbytes({io_id})")
-                raw = payload[pos : pos + vlen]
-                pos += vlen
-                xbytes_map[io_id] = raw.hex()
-
-        # Construcción del record
-        gps = {
-            "lat": lat / 1e7,
-            "lon": lon / 1e7,
-            "sat": sats,
-            "hdop": None,
-            "speed": float(speed),
-        }
-        io: Dict[str, Any] = {}
-
-        # Post-proceso: iButton (0x4E, 8 bytes)
-        if 0x4E in io_by_size[8]:
-            ib_val = io_by_size[8][0x4E]
-            ib_hex = _to_hex_be(ib_val, 8).upper()
-            if ib_val != 0:
-                io["IButton"] = ib_hex
-                io["IButton_Reverse"] = _reverse_hex_bytes(ib_hex).upper()
-                io["IButton_Connected"] = True
-            else:
-                io["IButton"] = "0"
-                io["IButton_Reverse"] = ""
-                io["IButton_Connected"] = False
-
-        # Post-proceso: ICCID (DB/DC/DD concatenadas como ASCII)
-        iccid_parts = []
-        for pid in (0xDB, 0xDC, 0xDD):
-            if pid in xbytes_map:
-                iccid_parts.append(_ascii_from_hex(xbytes_map[pid]))
-        if iccid_parts:
-            iccid_full = "".join(iccid_parts).strip("\x00")
-            if iccid_full:
-                io["CCID"] = iccid_full
-                io["CCID Part1"] = _ascii_from_hex(xbytes_map.get(0xDB, ""))
-                io["CCID Part2"] = _ascii_from_hex(xbytes_map.get(0xDC, ""))
-                io["CCID Part3"] = _ascii_from_hex(xbytes_map.get(0xDD, ""))
-
-        # Nombrado amigable para todos los grupos 1/2/4/8
-        for size_group in (1, 2, 4, 8):
-            for io_id, val in io_by_size[size_group].items():
-                _set_named(io, io_id, val)
-
-        # X-bytes restantes expuestos como hex
-        for io_id, hex_val in xbytes_map.items():
-            if io_id not in (0xDB, 0xDC, 0xDD):  # ya procesados
-                _set_named(io, io_id, "0x" + hex_val)
-
-        rec["ts"] = ts_ms / 1000.0
-        rec["event_id"] = event_id
-        rec["priority"] = prio
-        rec["gps"] = gps
-        rec["io"] = io
-        rec["rejected_io"] = {}  # puedes usarlo para IDs que decidas ignorar
-
-        records.append(rec)
-
-    # N2 (debe coincidir con n1, según protocolo)
-    n2, pos = _u8(payload, pos)
-    if n2 != n1:
-        log.debug("Aviso: n1=%d n2=%d (no coinciden)", n1, n2)
-
-    return codec, n1, records, True
+
+spool: Optional[Spool] = None  # se crea en main() (un directorio por worker)
+
+
+async def _open_spool(sp: Spool) -> None:
+    """Abre el spool; si el proceso anterior (relevo) aún lo tiene, espera a que lo libere."""
+    global spool
+    while True:
+        try:
+            sp.open()
+            break
+        except BlockingIOError:
+            await asyncio.sleep(0.5)
+    sp.start(replay_spooled)
+    spool = sp
+
+
+def _make_spool(worker_id: Optional[int]) -> Optional[Spool]:
+    if not SPOOL_DIR:
+        return None
+    directory = SPOOL_DIR if worker_id is None else os.path.join(SPOOL_DIR, f"worker-{worker_id}")
+    return Spool(
+        directory,
+        segment_bytes=SPOOL_SEGMENT_MB * 1024 * 1024,
+        fsync_ms=SPOOL_FSYNC_MS,
+        replay_batch=SPOOL_REPLAY_BATCH,
+        replay_rate=SPOOL_REPLAY_RATE,
+        replay_backoff=SPOOL_REPLAY_BACKOFF,
+    )
+
+batcher = IngestBatcher(deliver_batch, max_records=BATCH_MAX_RECORDS, linger_ms=BATCH_LINGER_MS)
 
 # -------------------------------------------------------------------
-# Fallback DB
+# Servidor TCP
 # -------------------------------------------------------------------
-def db_insert_records(imei: str, records: List[Dict[str, Any]]) -> None:
-    if psycopg is None:
-        raise RuntimeError("psycopg no disponible")
+framing_stats = FramingStats(max_devices=MAX_TRACKED_IMEIS)
+
+if AVL_BATCH_DECODE and avl_batch.np is not None:
+    decode_payload = partial(avl_batch.decode_avl_payload_batch, min_run=AVL_BATCH_MIN_RUN)
+else:
+    decode_payload = decode_avl_payload
+
+
+sessions = SessionRegistry()  # conexiones vivas (drenado) + IMEI -> conexión (comandos)
+
 
-    conn = psycopg.connect(
-        host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, connect_timeout=3
+def protocol_factory() -> TeltonikaProtocol:
+    return TeltonikaProtocol(
+        batcher,
+        framing_stats,
+        read_timeout=READ_TIMEOUT,
+        max_frame=MAX_FRAME_BYTES,
+        max_pending=MAX_PENDING_FRAMES,
+        hex_dump=HEX_DUMP_DEBUG,
+        decode=decode_payload,
+        admission=admission,
+        sessions=sessions,
+        command_grace=COMMAND_GRACE,
+    )
+
+
+udp_stats = UdpStats()
+
+
+def datagram_factory() -> TeltonikaDatagramProtocol:
+    return TeltonikaDatagramProtocol(
+        batcher,
+        udp_stats,
+        last_seen=framing_stats.last_seen,
+        max_pending=UDP_MAX_PENDING,
+        max_tracked=MAX_TRACKED_IMEIS,
+        hex_dump=HEX_DUMP_DEBUG,
+        decode=decode_payload,
+        admission=admission,
     )
-    with conn, conn.cursor() as cur:
-        # Busca o crea device
-        cur.execute("SELECT id FROM devices WHERE external_id=%s LIMIT 1", (imei,))
-        row = cur.fetchone()
-        if row:
-            device_id = row[0]
-        else:
-            # crea con tenant del primero que exista (o 1)
-            cur.execute("SELECT tenant_id FROM devices LIMIT 1")
-            trow = cur.fetchone()
-            tenant_id = trow[0] if trow else 1
-            cur.execute(
-                "INSERT INTO devices (tenant_id, name, external_id) VALUES (%s,%s,%s) RETURNING id",
-                (tenant_id, f"Teltonika {imei}", imei),
-            )
-            device_id = cur.fetchone()[0]
-
-        for rec in records:
-            # t.data => jsonb con gps/io
-            data = {"gps": rec["gps"], "io": rec["io"], "rejected_io": rec.get("rejected_io", {})}
-            cur.execute(
-                "INSERT INTO telemetry (device_id, ts, data) VALUES (%s, to_timestamp(%s), %s::jsonb)",
-                (device_id, rec["ts"], json.dumps(data)),
-            )
 
-        log.info("Fallback DB insertado IMEI=%s (device_id=%s)", imei, device_id)
 
 # -------------------------------------------------------------------
-# Ingest a API
+# Métricas (se leen de los contadores existentes en cada scrape)
 # -------------------------------------------------------------------
-def api_ingest(imei: str, codec: int, records: List[Dict[str, Any]]) -> bool:
+def register_metrics(reg: metrics.Registry) -> None:
+    fs, fw, sp = framing_stats, forwarder.stats, lambda: spool.snapshot() if spool is not None else {}
+    reg.callback("connections_open", "gauge", "Conexiones TCP abiertas", lambda: fs.active)
+    reg.callback("connections_total", "counter", "Conexiones TCP aceptadas", lambda: fs.connections)
+    reg.callback("frames_total", "counter", "Frames AVL válidos", lambda: fs.frames)
+    reg.callback("crc_errors_total", "counter", "Frames con CRC inválido", lambda: fs.crc_errors)
+    reg.callback("decode_errors_total", "counter", "Frames que no se pudieron decodificar", lambda: fs.decode_errors)
+    reg.callback("resync_bytes_total", "counter", "Bytes descartados buscando preámbulo", lambda: fs.resync_bytes)
+    reg.callback("read_timeouts_total", "counter", "Conexiones cerradas por timeout de lectura", lambda: fs.timeouts)
+    reg.callback("received_bytes_total", "counter", "Bytes recibidos de equipos", lambda: fs.bytes_in)
+    if admission is not None:
+        adm = admission
+        reg.callback("admission_total", "counter", "Decisiones de admisión de IMEI", lambda: [
+            ({"result": "admitted"}, adm.admitted), ({"result": "rejected"}, adm.rejected),
+            ({"result": "unverified"}, adm.unverified),
+        ])
+        reg.callback("admission_cache_entries", "gauge", "IMEIs en la caché de admisión", lambda: [
+            ({"kind": kind}, adm.snapshot()[kind]) for kind in ("known", "unknown")
+        ])
+        reg.callback("admission_lookups_total", "counter", "Consultas a devices por misses", lambda: adm.lookups)
+        reg.callback("admission_lookup_errors_total", "counter", "Consultas/refrescos de admisión fallidos", lambda: adm.lookup_errors)
+    if UDP_PORT > 0:
+        us = udp_stats
+        reg.callback("udp_datagrams_total", "counter", "Datagramas UDP recibidos", lambda: us.datagrams)
+        reg.callback("udp_frames_total", "counter", "Datagramas UDP con AVL válido", lambda: us.frames)
+        reg.callback("udp_rejected_total", "counter", "Datagramas UDP descartados por motivo", lambda: [
+            ({"reason": "malformed"}, us.malformed), ({"reason": "decode"}, us.decode_errors),
+            ({"reason": "duplicate"}, us.duplicates), ({"reason": "overload"}, us.dropped),
+            ({"reason": "unknown_imei"}, us.rejected), ({"reason": "admission_pending"}, us.admitting),
+        ])
+        reg.callback("udp_acks_total", "counter", "ACK UDP enviados por resultado", lambda: [
+            ({"result": "ok"}, us.acks), ({"result": "nack"}, us.nacks),
+        ])
+    if METRICS_PER_IMEI:
+        reg.callback(
+            "device_last_seen_timestamp_seconds", "gauge", "Último frame válido por IMEI (epoch)",
+            lambda: [({"imei": imei}, ts) for imei, ts in list(fs.last_seen.items())],
+        )
+
+    reg.callback("log_dropped_total", "counter", "Registros de log descartados (cola llena)",
+                 lambda: log_handler.dropped if log_handler is not None else 0)
+    reg.callback("log_suppressed_total", "counter", "Registros de log suprimidos por muestreo",
+                 lambda: LOG_SAMPLER.suppressed)
+    reg.callback("sessions_connected", "gauge", "Equipos con handshake aceptado conectados", lambda: sessions.devices)
+
+    def conn_buffers():
+        acc = sessions.accounting()
+        return [({"direction": "rx"}, acc["rx_buffer_bytes"]), ({"direction": "rx_alloc"}, acc["rx_buffer_alloc_bytes"]),
+                ({"direction": "tx"}, acc["tx_buffer_bytes"])]
+
+    reg.callback("connection_buffer_bytes", "gauge", "Bytes en buffers de las conexiones TCP", conn_buffers)
+    reg.callback("connection_pending_records", "gauge", "Records decodificados esperando persistencia/ACK",
+                 lambda: sessions.accounting()["pending_records"])
+    reg.callback("process_resident_memory_bytes", "gauge", "RSS del proceso", memprof.rss_bytes)
+    reg.callback("commands_total", "counter", "Comandos Codec 12 por resultado", lambda: [
+        ({"result": "ok"}, sessions.commands_ok), ({"result": "timeout"}, sessions.commands_timeout),
+        ({"result": "failed"}, sessions.commands_failed), ({"result": "not_connected"}, sessions.commands_not_connected),
+    ])
+
+    reg.callback("forward_requests_total", "counter", "POST bulk a la API por resultado", lambda: [
+        ({"result": "ok"}, fw.ok), ({"result": "error"}, fw.errors - fw.timeouts),
+        ({"result": "timeout"}, fw.timeouts), ({"result": "rejected"}, fw.rejected),
+    ])
+    reg.callback("forward_in_flight", "gauge", "POST a la API en curso", lambda: forwarder.in_flight)
+
+    reg.callback("batches_total", "counter", "Lotes despachados por el batcher", lambda: batcher.batches)
+    reg.callback("batch_records_total", "counter", "Records despachados por el batcher", lambda: batcher.batched_records)
+    reg.callback("batch_failed_items_total", "counter", "Items sin persistir (ACK 0)", lambda: batcher.failed_items)
+    reg.callback("batch_pending_records", "gauge", "Records esperando flush", lambda: batcher.pending_records)
+
+    reg.callback("db_fallback_rows_total", "counter", "Filas insertadas por el fallback DB", lambda: db_fallback.rows)
+    reg.callback("db_fallback_errors_total", "counter", "Lotes fallidos en el fallback DB", lambda: db_fallback.errors)
+    reg.callback("db_fallback_unknown_items_total", "counter", "Items descartados en el fallback DB por IMEI sin device", lambda: db_fallback.unknown_items)
+
+    reg.callback("spool_depth_records", "gauge", "Records pendientes en el spool", lambda: sp().get("depth_records", 0))
+    reg.callback("spool_depth_bytes", "gauge", "Bytes pendientes en el spool", lambda: sp().get("depth_bytes", 0))
+    reg.callback("spool_replay_lag_seconds", "gauge", "Antigüedad de la entrada más vieja del spool", lambda: sp().get("replay_lag_s", 0.0))
+    reg.callback("spool_replayed_records_total", "counter", "Records re-entregados desde el spool", lambda: sp().get("replayed_records", 0))
+    reg.callback("spool_corrupt_bytes_total", "counter", "Bytes corruptos del spool apartados en corrupt-*.bin", lambda: sp().get("corrupt_bytes", 0))
+
+
+async def report_stats(interval: float) -> None:
+    """Log periódico de métricas de reenvío, coalescencia, fallback y spool."""
+    while True:
+        await asyncio.sleep(interval)
+        forwarder.log_stats()
+        batcher.log_stats()
+        log.info("framing stats: %s", framing_stats.snapshot())
+        if udp_stats.datagrams:
+            log.info("udp stats: %s", udp_stats.snapshot())
+        if admission is not None:
+            a = admission.snapshot()
+            if a["rejected"] or a["unverified"]:
+                log.info("admission stats: %s", a)
+        d = db_fallback.snapshot()
+        if d["batches"] or d["errors"]:
+            log.info("db fallback stats: %s", d)
+        if spool is not None:
+            sp = spool.snapshot()
+            if sp["depth_items"] or sp["appended_items"]:
+                log.info(
+                    "spool stats: depth=%d items/%d records/%d bytes segments=%d lag=%.1fs "
+                    "appended=%d replayed=%d replay_failures=%d",
+                    sp["depth_items"], sp["depth_records"], sp["depth_bytes"], sp["segments"],
+                    sp["replay_lag_s"], sp["appended_items"], sp["replayed_items"], sp["replay_failures"],
+                )
+
+
+def collect_stats() -> Dict[str, Any]:
+    """Snapshot de métricas del proceso (lo que el supervisor agrega entre workers)."""
+    fwd = forwarder.stats.snapshot()
+    fwd["in_flight"] = forwarder.in_flight
+    return {
+        "connections": framing_stats.active,
+        "sessions": sessions.snapshot(),
+        "framing": framing_stats.snapshot(),
+        "udp": udp_stats.snapshot(),
+        "forward": fwd,
+        "batch": batcher.snapshot(),
+        "db": db_fallback.snapshot(),
+        "admission": admission.snapshot() if admission is not None else {},
+        "spool": spool.snapshot() if spool is not None else {},
+    }
+
+
+async def heartbeat(worker_id: int, stats_queue, interval: float) -> None:
+    """Worker -> supervisor: prueba de vida (el loop no está bloqueado) + métricas."""
+    pid = os.getpid()
+    while True:
+        try:
+            stats_queue.put_nowait((worker_id, pid, collect_stats()))
+        except Exception as e:
+            log.debug("Heartbeat no enviado: %s", e)
+        await asyncio.sleep(interval)
+
+
+async def drain(servers: List[asyncio.AbstractServer], udp_transport) -> None:
+    """Deja de aceptar y cierra las conexiones con jitter a medida que quedan sin trabajo pendiente."""
+    for server in servers:
+        server.close()
+    if udp_transport is not None:
+        udp_transport.pause_reading()  # sigue abierto para los ACK en curso
+    loop = asyncio.get_running_loop()
+    conns = list(sessions)
+    log.info("Drenando %d conexiones (jitter=%.0fs, timeout=%.0fs)", len(conns), DRAIN_JITTER, DRAIN_TIMEOUT)
+    for proto in conns:
+        proto.drain(random.uniform(0.0, DRAIN_JITTER))
+    deadline = loop.time() + DRAIN_TIMEOUT
+    while sessions and loop.time() < deadline:
+        await asyncio.sleep(0.2)
+    if sessions:
+        log.warning("Drenado: %d conexiones cerradas por timeout", len(sessions))
+        for proto in list(sessions):
+            proto.close()
+
+
+def handoff(servers: List[asyncio.AbstractServer], udp_transport) -> bool:
+    """Lanza este mismo servidor heredando los sockets de escucha (sin ventana sin listener)."""
+    tcp_fds = [sock.fileno() for server in servers for sock in server.sockets]
+    fds = list(tcp_fds)
+    env = dict(os.environ, TCP_LISTEN_FDS=",".join(map(str, tcp_fds)))
+    env.pop("UDP_LISTEN_FD", None)
+    if udp_transport is not None:
+        udp_fd = udp_transport.get_extra_info("socket").fileno()
+        fds.append(udp_fd)
+        env["UDP_LISTEN_FD"] = str(udp_fd)
     try:
-        payload = {"imei": imei, "codec": codec, "records": records}
-        r = requests.post(INGEST_URL, json=payload, timeout=REQUEST_TIMEOUT)
-        if r.status_code // 100 == 2:
-            return True
-        log.error("API ingest falló HTTP %s: %s", r.status_code, r.text[:200])
-        return False
-    except Exception as e:
-        log.error("API ingest error: %s", e)
+        proc = subprocess.Popen([sys.executable] + sys.argv, env=env, pass_fds=fds)
+    except OSError as e:
+        log.error("Relevo: no se pudo lanzar el proceso nuevo: %s", e)
         return False
+    log.info("Relevo: proceso nuevo pid=%d con sockets %s; este drena", proc.pid, fds)
+    return True
 
-# -------------------------------------------------------------------
-# Servidor TCP
-# -------------------------------------------------------------------
-async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
-    addr = writer.get_extra_info("peername")
-    try:
-        # Handshake IMEI: 2 bytes length + ascii IMEI
-        raw_len = await read_exact(reader, 2)
-        imei_len = struct.unpack(">H", raw_len)[0]
-        imei_b = await read_exact(reader, imei_len)
-        imei = imei_b.decode(errors="ignore")
-        log.info("Conexión %s IMEI=%s", addr, imei)
-        # responder 0x01
-        writer.write(b"\x01")
-        await writer.drain()
 
+async def _serve_http(name: str, start) -> Optional[asyncio.AbstractServer]:
+    for attempt in range(10):
+        try:
+            return await start()
+        except OSError as e:
+            if not TCP_LISTEN_FDS or attempt == 9:
+                log.error("No se pudo abrir el endpoint de %s: %s", name, e)
+                return None
+            await asyncio.sleep(0.5)  # relevo: el proceso anterior lo libera al empezar a drenar
+    return None
+
+
+def _inherited_sockets() -> List[socket.socket]:
+    return [socket.socket(fileno=int(fd)) for fd in TCP_LISTEN_FDS.split(",") if fd.strip()]
+
+
+async def main(worker_id: Optional[int] = None, stats_queue=None):
+    if TRACEMALLOC > 0:
+        memprof.start(TRACEMALLOC)
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    handoff_requested = False
+
+    def on_sigterm() -> None:
+        if stop.is_set():
+            main_task.cancel()  # segundo SIGTERM: sin esperar el drenado
+        stop.set()
+
+    def on_sigusr2() -> None:
+        nonlocal handoff_requested
+        if not stop.is_set():
+            handoff_requested = True
+            stop.set()
+
+    # SIGTERM => drenar y cerrar batcher/spool/pools de forma ordenada
+    main_task = asyncio.current_task()
+    loop.add_signal_handler(signal.SIGTERM, on_sigterm)
+    if worker_id is None:
+        loop.add_signal_handler(signal.SIGUSR2, on_sigusr2)
+
+    await forwarder.start()
+    await db_fallback.start()
+    if admission is not None:
+        await admission.start()
+    tasks = []
+    sp = _make_spool(worker_id)
+    if sp is not None:
+        tasks.append(asyncio.create_task(_open_spool(sp)))
+    if stats_queue is not None:
+        # multi-proceso: el supervisor loguea las métricas agregadas
+        tasks.append(asyncio.create_task(heartbeat(worker_id, stats_queue, WORKER_HEARTBEAT)))
+    elif STATS_INTERVAL > 0:
+        tasks.append(asyncio.create_task(report_stats(STATS_INTERVAL)))
+
+    # endpoints HTTP internos (con TCP_WORKERS > 1, puerto base + n por worker)
+    http_servers: List[asyncio.AbstractServer] = []
+    if METRICS_PORT > 0:
+        register_metrics(metrics.REGISTRY)
+        srv = await _serve_http("métricas", partial(metrics.serve, METRICS_HOST, METRICS_PORT + (worker_id or 0)))
+        if srv is not None:
+            http_servers.append(srv)
+    if CONTROL_PORT > 0:
+        srv = await _serve_http("control", partial(
+            control.serve, CONTROL_HOST, CONTROL_PORT + (worker_id or 0), sessions, COMMAND_TIMEOUT,
+            extra=lambda: {
+                "batch_pending_records": batcher.pending_records,
+                "forward_in_flight": forwarder.in_flight,
+            },
+        ))
+        if srv is not None:
+            http_servers.append(srv)
+
+    inherited = _inherited_sockets() if worker_id is None else []
+    if inherited:
+        servers = [await loop.create_server(protocol_factory, sock=sock) for sock in inherited]
+    else:
+        servers = [await loop.create_server(protocol_factory, TCP_HOST, TCP_PORT, reuse_port=worker_id is not None)]
+    addrs = ", ".join(str(sock.getsockname()) for server in servers for sock in server.sockets)
+    udp_transport = None
+    if UDP_PORT > 0:
+        if UDP_LISTEN_FD and worker_id is None:
+            udp_sock = socket.socket(fileno=int(UDP_LISTEN_FD))
+            udp_transport, _ = await loop.create_datagram_endpoint(datagram_factory, sock=udp_sock)
+        else:
+            udp_transport, _ = await loop.create_datagram_endpoint(
+                datagram_factory, local_addr=(TCP_HOST, UDP_PORT), reuse_port=worker_id is not None,
+            )
+        addrs += f", udp {udp_transport.get_extra_info('sockname')}"
+    log.info(
+        "Escuchando en %s%s (crc16=%s, decode=%s)", addrs, " (sockets heredados)" if inherited else "",
+        crc16.BACKEND, avl_batch.describe() if decode_payload is not decode_avl_payload else "escalar",
+    )
+    try:
         while True:
-            try:
-                data_len, payload = await read_frame(reader)
-            except asyncio.IncompleteReadError:
+            await stop.wait()
+            if not handoff_requested:
                 break
-
-            if data_len == 0:
-                break  # keep-alive sin data
-            if data_len < 0:
-                # CRC malo → ACK 0
-                writer.write((0).to_bytes(4, "big"))
-                await writer.drain()
-                if HEX_DUMP_DEBUG and payload:
-                    log.debug("PAYLOAD HEX len=%d : %s", len(payload), payload[:256].hex())
-                continue
-
-            if HEX_DUMP_DEBUG:
-                log.debug("PAYLOAD HEX len=%d : %s", len(payload), payload[:min(256, len(payload))].hex())
-
-            try:
-                codec, n1, records, _ = decode_avl_payload(payload)
-                log.info("Paquete codec=0x%02X records=%d (crc_ok=True)", codec, n1)
-            except Exception as e:
-                log.error("Decode falló: %s", e)
-                writer.write((0).to_bytes(4, "big"))
-                await writer.drain()
-                continue
-
-            # Enviar a API; si falla, fallback DB
-            ok = api_ingest(imei, codec, records)
-            if not ok:
-                try:
-                    db_insert_records(imei, records)
-                except Exception as e:
-                    log.error("Fallback DB falló: %s", e)
-
-            # ACK = cantidad de records
-            writer.write((n1).to_bytes(4, "big"))
-            await writer.drain()
-
-    except Exception as e:
-        log.debug("Cierre por error con %s: %s", addr, e)
+            if handoff(servers, udp_transport):
+                for srv in http_servers:
+                    srv.close()  # el proceso nuevo toma los puertos de métricas/control (reintenta)
+                http_servers.clear()
+                break
+            handoff_requested = False  # sin proceso nuevo: se sigue atendiendo
+            stop.clear()
+        await drain(servers, udp_transport)
     finally:
-        try:
-            writer.close()
-            await writer.wait_closed()
-        except Exception:
-            pass
+        for t in tasks:
+            t.cancel()
+        for server in servers:
+            server.close()
+        for srv in http_servers:
+            srv.close()
+        if admission is not None:
+            await admission.close()
+        await batcher.close()
+        if udp_transport is not None:
+            udp_transport.close()
+        if spool is not None:
+            await spool.close()
+        await forwarder.close()
+        await db_fallback.close()
+        log.info("Servidor detenido")
+
+
+def run_worker(worker_id: int, stats_queue) -> None:
+    """Entry point de cada proceso worker (ver supervisor.py)."""
+    global log_handler
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # el supervisor coordina el apagado
+    log_handler = fastlog.setup(LOG_LEVEL, _LOG_FORMAT)  # el thread de logging no sobrevive al fork
+    try:
+        asyncio.run(main(worker_id, stats_queue))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
 
-async def main():
-    server = await asyncio.start_server(handle_client, TCP_HOST, TCP_PORT)
-    addrs = ", ".join(str(sock.getsockname()) for sock in server.sockets)
-    log.info("Escuchando en %s", addrs)
-    async with server:
-        await server.serve_forever()
 
 if __name__ == "__main__":
-    try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
-        pass
+    if TCP_WORKERS > 1:
+        WorkerSupervisor(
+            run_worker,
+            TCP_WORKERS,
+            health_timeout=WORKER_HEALTH_TIMEOUT,
+            stats_interval=STATS_INTERVAL,
+            shutdown_grace=DRAIN_TIMEOUT + 15,
+        ).run()
+    else:
+        try:
+            asyncio.run(main())
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            pass
 
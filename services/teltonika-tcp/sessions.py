@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Registro en proceso de sesiones de equipos conectados.
+
+- Conjunto de conexiones vivas (lo usa el drenado) + índice IMEI -> conexión
+  (una reconexión del mismo IMEI reemplaza a la anterior).
+- `command()` encola un comando Codec 12 en la conexión existente y espera la
+  respuesta correlacionada (ver TeltonikaProtocol.send_command); cuenta
+  resultados y mide el round-trip.
+- `accounting()`: totales de buffers / records pendientes sobre todas las
+  conexiones (incluye las que no terminaron el handshake); se recorre al
+  consultar, para métricas y /memory.
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from metrics import REGISTRY
+
+COMMAND_SECONDS = REGISTRY.histogram(
+    "command_seconds", "Comando Codec 12: encolado -> respuesta del equipo",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+
+# campos numéricos de session_info por los que se puede ordenar (/sessions?sort=)
+SORT_FIELDS = frozenset((
+    "connected_s", "idle_s", "since_last_frame_s", "frames", "bytes_in", "bytes_out",
+    "rx_buffer_bytes", "rx_buffer_alloc_bytes", "tx_buffer_bytes",
+    "pending_acks", "pending_records", "pending_commands",
+))
+
+
+class NotConnected(LookupError):
+    pass
+
+
+class SessionRegistry:
+    def __init__(self) -> None:
+        self._conns: set = set()
+        self._by_imei: Dict[str, Any] = {}
+        # métricas
+        self.commands_ok = 0
+        self.commands_timeout = 0
+        self.commands_failed = 0  # conexión cerrada, cola llena o respuesta inválida
+        self.commands_not_connected = 0
+
+    # --- set-like (conexiones vivas, incluso antes del handshake) ---
+    def add(self, proto) -> None:
+        self._conns.add(proto)
+
+    def discard(self, proto) -> None:
+        self._conns.discard(proto)
+        imei = getattr(proto, "imei", None)
+        if imei is not None and self._by_imei.get(imei) is proto:
+            del self._by_imei[imei]
+
+    def __len__(self) -> int:
+        return len(self._conns)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(list(self._conns))
+
+    def __bool__(self) -> bool:
+        return bool(self._conns)
+
+    # --- por IMEI ---
+    def bind(self, imei: str, proto) -> None:
+        """Handshake aceptado: la conexión pasa a ser la sesión de ese IMEI."""
+        self._by_imei[imei] = proto
+
+    def get(self, imei: str):
+        return self._by_imei.get(imei)
+
+    @property
+    def devices(self) -> int:
+        return len(self._by_imei)
+
+    def describe(self, imei: Optional[str] = None, sort: Optional[str] = None,
+                 limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """session_info de un IMEI o de todos; `sort` = campo de SORT_FIELDS (mayor primero), si no ValueError."""
+        if sort and sort not in SORT_FIELDS:
+            raise ValueError(f"sort debe ser uno de: {', '.join(sorted(SORT_FIELDS))}")
+        if imei is None:
+            protos = list(self._by_imei.values())
+        else:
+            proto = self._by_imei.get(imei)
+            protos = [proto] if proto is not None else []
+        now = time.monotonic()
+        out = [p.session_info(now) for p in protos]
+        if sort:
+            out.sort(key=lambda s: s.get(sort) or 0, reverse=True)
+        return out[:limit] if limit is not None else out
+
+    def accounting(self) -> Dict[str, int]:
+        rx = rx_alloc = tx = pending = 0
+        for proto in list(self._conns):
+            a, b, c, d = proto.buffers()
+            rx += a
+            rx_alloc += b
+            tx += c
+            pending += d
+        return {
+            "connections": len(self._conns),
+            "devices": len(self._by_imei),
+            "rx_buffer_bytes": rx,
+            "rx_buffer_alloc_bytes": rx_alloc,
+            "tx_buffer_bytes": tx,
+            "pending_records": pending,
+        }
+
+    # ---------------------------------------------------------------
+    async def command(self, imei: str, text: str, timeout: float) -> Dict[str, Any]:
+        proto = self._by_imei.get(imei)
+        if proto is None:
+            self.commands_not_connected += 1
+            raise NotConnected(imei)
+        t0 = time.perf_counter()
+        try:
+            response = await proto.send_command(text, timeout)
+        except asyncio.TimeoutError:
+            self.commands_timeout += 1
+            raise
+        except Exception:
+            self.commands_failed += 1
+            raise
+        elapsed = time.perf_counter() - t0
+        COMMAND_SECONDS.observe(elapsed)
+        self.commands_ok += 1
+        return {"imei": imei, "command": text, "response": response, "latency_ms": round(elapsed * 1000.0, 1)}
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "connections": len(self._conns),
+            "devices": len(self._by_imei),
+            "commands_ok": self.commands_ok,
+            "commands_timeout": self.commands_timeout,
+            "commands_failed": self.commands_failed,
+            "commands_not_connected": self.commands_not_connected,
+        }
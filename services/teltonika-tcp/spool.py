@@ -0,0 +1,482 @@
+# -*- coding: utf-8 -*-
+"""
+Spool local en disco para cuando ni la API ni la DB aceptan un lote.
+
+Formato: directorio con segmentos append-only `seg-<n>.spool` de tamaño fijo,
+pre-asignados y mapeados en memoria (mmap). Cada entrada es:
+
+    MARCA(4) | LEN(4, BE) | CRC32(4, BE) | NREC(4, BE) | JSON {"imei", "codec", "records", "t"}
+
+NREC (cantidad de records, cubierto por el CRC) permite contar lo pendiente
+sin decodificar el JSON. La marca permite resincronizar tras una entrada
+corrupta: se busca la próxima entrada válida y los bytes intermedios se
+apartan en `corrupt-<seg>-<offset>.bin`. Los segmentos del formato anterior
+(QFSPOOL1: LEN | CRC32 | JSON) se siguen leyendo; se escribe siempre en
+segmentos nuevos. Las escrituras se hacen
+sobre el mmap y se sincronizan a disco en grupo (msync cada `fsync_ms`);
+`append()` sólo retorna cuando sus entradas quedaron sincronizadas, así el
+ACK al equipo sigue siendo "durable".
+
+Un replayer en segundo plano lee desde el cursor persistido (segmento,
+offset), re-entrega a ritmo controlado con el mismo sink del batcher y
+avanza el cursor sólo cuando el lote fue aceptado (entrega al-menos-una-vez).
+Los segmentos ya consumidos se borran.
+
+El directorio se toma con un flock exclusivo (`lock`): en un relevo de
+proceso (socket heredado) el nuevo espera a que el anterior cierre su spool.
+"""
+
+import asyncio
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from avl import json_default
+
+log = logging.getLogger("teltonika-tcp.spool")
+
+_MAGIC = b"QFSPOOL2"
+_MAGIC_V1 = b"QFSPOOL1"  # segmentos previos (sólo lectura)
+_MARK = b"QFE\x02"
+_ENTRY = struct.Struct(">4sIII")  # marca, len, crc32(nrec + json), nrec
+_ENTRY_V1 = struct.Struct(">II")  # len, crc32
+_U32 = struct.Struct(">I")
+_CURSOR_FILE = "cursor.json"
+
+Item = Dict[str, Any]  # {"imei", "codec", "records", "t"}
+ReplaySink = Callable[[List[Item]], Awaitable[bool]]
+
+
+class _Segment:
+    def __init__(self, path: str, seq: int, size: int, create: bool) -> None:
+        self.path = path
+        self.seq = seq
+        flags = os.O_RDWR | (os.O_CREAT if create else 0)
+        self.fd = os.open(path, flags, 0o644)
+        if create:
+            os.ftruncate(self.fd, size)
+        self.size = os.fstat(self.fd).st_size
+        self.mm = mmap.mmap(self.fd, self.size)
+        if create:
+            self.mm[0:len(_MAGIC)] = _MAGIC
+        magic = self.mm[0:len(_MAGIC)]
+        if magic not in (_MAGIC, _MAGIC_V1):
+            self.close()
+            raise ValueError(f"Segmento inválido: {path}")
+        self.version = 2 if magic == _MAGIC else 1
+        self.write_pos = len(_MAGIC)
+
+    def entry(self, pos: int, limit: Optional[int] = None) -> Optional[Tuple[int, int, Optional[int]]]:
+        """(inicio del JSON, fin, nº de records | None en v1) si en `pos` hay una entrada válida."""
+        limit = self.size if limit is None else limit
+        if self.version == 1:
+            if pos + _ENTRY_V1.size > limit:
+                return None
+            n, crc = _ENTRY_V1.unpack_from(self.mm, pos)
+            start = pos + _ENTRY_V1.size
+            if n == 0 or start + n > limit or zlib.crc32(self.mm[start:start + n]) != crc:
+                return None
+            return start, start + n, None
+        if pos + _ENTRY.size > limit:
+            return None
+        mark, n, crc, nrec = _ENTRY.unpack_from(self.mm, pos)
+        start = pos + _ENTRY.size
+        if mark != _MARK or n == 0 or start + n > limit:
+            return None
+        if zlib.crc32(self.mm[start:start + n], zlib.crc32(_U32.pack(nrec))) != crc:
+            return None
+        return start, start + n, nrec
+
+    def next_entry(self, pos: int, limit: int) -> Optional[int]:
+        """Offset de la próxima entrada válida después de `pos` (v1 no tiene marca: None)."""
+        if self.version == 1:
+            return None
+        while True:
+            pos = self.mm.find(_MARK, pos + 1, limit)
+            if pos < 0:
+                return None
+            if self.entry(pos, limit) is not None:
+                return pos
+
+    def scan_end(self) -> int:
+        """Recorre entradas válidas y devuelve el offset de fin (recuperación)."""
+        pos = len(_MAGIC)
+        while True:
+            e = self.entry(pos)
+            if e is None:
+                nxt = self.next_entry(pos, self.size)
+                if nxt is None:
+                    break  # fin de lo escrito (o cola de una escritura cortada)
+                log.warning("Spool: %d bytes corruptos en %s@%d, se continúa en %d", nxt - pos, self.path, pos, nxt)
+                pos = nxt
+                continue
+            pos = e[1]
+        self.write_pos = pos
+        return pos
+
+    def close(self) -> None:
+        try:
+            self.mm.close()
+        finally:
+            os.close(self.fd)
+
+
+class Spool:
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 16 * 1024 * 1024,
+        fsync_ms: float = 20.0,
+        replay_batch: int = 200,
+        replay_rate: float = 2000.0,
+        replay_backoff: float = 5.0,
+    ) -> None:
+        self.dir = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = max(0.001, fsync_ms / 1000.0)
+        self.replay_batch = max(1, replay_batch)
+        self.replay_rate = replay_rate  # records/s (0 = sin límite)
+        self.replay_backoff = replay_backoff
+
+        self._segments: Dict[int, _Segment] = {}
+        self._write: Optional[_Segment] = None
+        self._read_seq = 0
+        self._read_pos = len(_MAGIC)
+        self._dirty = False
+        self._sync_waiters: List[asyncio.Future] = []
+        self._sync_task: Optional[asyncio.Task] = None
+        self._replay_task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._lock_fd: Optional[int] = None
+        self._quarantined: set = set()  # (seq, offset) ya apartados
+
+        # métricas
+        self.depth_items = 0
+        self.depth_records = 0
+        self.appended_items = 0
+        self.replayed_items = 0
+        self.replayed_records = 0
+        self.replay_failures = 0
+        self.corrupt_bytes = 0
+        self.oldest_ts: Optional[float] = None  # "t" de la próxima entrada a re-entregar
+
+    # ---------------------------------------------------------------
+    # Ciclo de vida
+    # ---------------------------------------------------------------
+    def open(self) -> None:
+        """Recupera el estado del directorio; BlockingIOError si otro proceso lo tiene abierto."""
+        os.makedirs(self.dir, exist_ok=True)
+        fd = os.open(os.path.join(self.dir, "lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            raise BlockingIOError(f"Spool {self.dir} en uso por otro proceso")
+        self._lock_fd = fd
+        seqs = sorted(
+            int(name[4:-6]) for name in os.listdir(self.dir)
+            if name.startswith("seg-") and name.endswith(".spool")
+        )
+        for seq in seqs:
+            try:
+                self._segments[seq] = _Segment(self._path(seq), seq, 0, create=False)
+            except Exception as e:
+                log.error("Spool: se ignora segmento %d: %s", seq, e)
+
+        cursor = self._load_cursor()
+        if self._segments:
+            last = max(self._segments)
+            for seg in self._segments.values():
+                seg.scan_end()
+            self._write = self._segments[last]
+            if self._write.version != 2:
+                self._write = self._new_segment(last + 1, self.segment_bytes)
+            self._read_seq, self._read_pos = cursor or (min(self._segments), len(_MAGIC))
+            if self._read_seq not in self._segments:
+                # el segmento del cursor ya no existe: sigue desde el próximo
+                self._read_seq = min((s for s in self._segments if s > self._read_seq), default=last)
+                self._read_pos = len(_MAGIC)
+            self._drop_consumed()
+        else:
+            self._write = self._new_segment(1, self.segment_bytes)
+            self._read_seq, self._read_pos = 1, len(_MAGIC)
+        self._recount()
+        if self.depth_items:
+            log.warning("Spool: %d entradas (%d records) pendientes de re-entrega", self.depth_items, self.depth_records)
+
+    def start(self, sink: ReplaySink) -> None:
+        self._wakeup = asyncio.Event()
+        self._sync_task = asyncio.create_task(self._sync_loop())
+        self._replay_task = asyncio.create_task(self._replay_loop(sink))
+        if self.depth_items:
+            self._wakeup.set()
+
+    async def close(self) -> None:
+        for t in (self._replay_task, self._sync_task):
+            if t is not None:
+                t.cancel()
+        self._sync_now()
+        for seg in self._segments.values():
+            seg.close()
+        self._segments.clear()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)  # libera el flock
+            self._lock_fd = None
+
+    # ---------------------------------------------------------------
+    # Escritura
+    # ---------------------------------------------------------------
+    async def append(self, items: List[Item]) -> None:
+        """Escribe las entradas y espera al próximo msync (group commit)."""
+        now = time.time()
+        for it in items:
+            it.setdefault("t", now)
+            data = json.dumps(it, separators=(",", ":"), default=json_default).encode()
+            nrec = len(it.get("records") or ())
+            self._append_raw(data, nrec)
+            self.depth_items += 1
+            self.depth_records += nrec
+            self.appended_items += 1
+            if self.oldest_ts is None:
+                self.oldest_ts = it["t"]
+        self._dirty = True
+        fut = asyncio.get_running_loop().create_future()
+        self._sync_waiters.append(fut)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        await fut
+
+    def _append_raw(self, data: bytes, nrec: int) -> None:
+        need = _ENTRY.size + len(data)
+        seg = self._write
+        # deja siempre espacio para el terminador LEN=0
+        if seg.write_pos + need + _ENTRY.size > seg.size:
+            self._sync_now()
+            size = max(self.segment_bytes, len(_MAGIC) + need + _ENTRY.size)
+            seg = self._write = self._new_segment(seg.seq + 1, size)
+        pos = seg.write_pos
+        seg.mm[pos + _ENTRY.size:pos + need] = data
+        _ENTRY.pack_into(seg.mm, pos, _MARK, len(data), zlib.crc32(data, zlib.crc32(_U32.pack(nrec))), nrec)
+        seg.write_pos = pos + need
+
+    async def _sync_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.fsync_interval)
+            if not self._dirty:
+                continue
+            waiters, self._sync_waiters = self._sync_waiters, []
+            self._dirty = False
+            try:
+                await loop.run_in_executor(None, self._write.mm.flush)
+            except Exception as e:
+                log.error("Spool: msync falló: %s", e)
+                for w in waiters:
+                    if not w.done():
+                        w.set_exception(e)
+                continue
+            for w in waiters:
+                if not w.done():
+                    w.set_result(None)
+
+    def _sync_now(self) -> None:
+        if self._write is not None and self._dirty:
+            self._write.mm.flush()
+            self._dirty = False
+        waiters, self._sync_waiters = self._sync_waiters, []
+        for w in waiters:
+            if not w.done():
+                w.set_result(None)
+
+    # ---------------------------------------------------------------
+    # Lectura / re-entrega
+    # ---------------------------------------------------------------
+    def _entries(self) -> Iterator[Tuple[int, _Segment, int, int, Optional[int]]]:
+        """(seq, segmento, inicio, fin, nº de records) desde el cursor, sin decodificar; aparta lo corrupto."""
+        seq, pos = self._read_seq, self._read_pos
+        while True:
+            seg = self._segments.get(seq)
+            if seg is None:
+                return
+            if pos >= seg.write_pos:
+                if seq == self._write.seq:
+                    return
+                nxt = min((s for s in self._segments if s > seq), default=None)
+                if nxt is None:
+                    return
+                seq, pos = nxt, len(_MAGIC)
+                continue
+            e = seg.entry(pos, seg.write_pos)
+            if e is None:
+                end = seg.next_entry(pos, seg.write_pos) or seg.write_pos
+                self._quarantine(seg, pos, end)
+                pos = end
+                continue
+            start, end, nrec = e
+            yield seq, seg, start, end, nrec
+            pos = end
+
+    def _peek(self, max_items: int) -> Tuple[List[Item], Tuple[int, int]]:
+        """Lee hasta max_items desde el cursor sin avanzarlo; devuelve (items, cursor_siguiente)."""
+        items: List[Item] = []
+        cursor = (self._read_seq, self._read_pos)
+        for seq, seg, start, end, _ in self._entries():
+            cursor = (seq, end)
+            try:
+                items.append(json.loads(seg.mm[start:end]))
+            except Exception as e:
+                log.error("Spool: entrada ilegible en seg %d, se descarta: %s", seq, e)
+            if len(items) >= max_items:
+                break
+        return items, cursor
+
+    def _quarantine(self, seg: _Segment, start: int, end: int) -> None:
+        """Copia los bytes corruptos a un archivo aparte (una vez) y los cuenta."""
+        if (seg.seq, start) in self._quarantined:
+            return
+        self._quarantined.add((seg.seq, start))
+        self.corrupt_bytes += end - start
+        path = os.path.join(self.dir, f"corrupt-{seg.seq:012d}-{start}.bin")
+        try:
+            with open(path, "wb") as f:
+                f.write(seg.mm[start:end])
+        except OSError as e:
+            log.error("Spool: no se pudo apartar %s: %s", path, e)
+        log.error("Spool: %d bytes corruptos en seg %d@%d se saltan (copia en %s)", end - start, seg.seq, start, path)
+
+    async def _replay_loop(self, sink: ReplaySink) -> None:
+        while True:
+            if not self.depth_items:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                # deja que se acumule un poco antes de re-entregar
+                await asyncio.sleep(self.replay_backoff)
+                continue
+
+            items, nxt = self._peek(self.replay_batch)
+            if not items:
+                if nxt != (self._read_seq, self._read_pos):
+                    # sólo entradas ilegibles: se dejan atrás
+                    self._read_seq, self._read_pos = nxt
+                    self._save_cursor()
+                    self._drop_consumed()
+                self._recount()
+                await asyncio.sleep(self.replay_backoff)
+                continue
+
+            n_records = sum(len(it.get("records") or ()) for it in items)
+            t0 = time.monotonic()
+            try:
+                ok = await sink(items)
+            except Exception as e:
+                log.error("Spool: re-entrega falló: %s", e)
+                ok = False
+            if not ok:
+                self.replay_failures += 1
+                await asyncio.sleep(self.replay_backoff)
+                continue
+
+            self._read_seq, self._read_pos = nxt
+            self._save_cursor()
+            self._drop_consumed()
+            self.depth_items -= len(items)
+            self.depth_records -= n_records
+            self.replayed_items += len(items)
+            self.replayed_records += n_records
+            head, _ = self._peek(1)
+            self.oldest_ts = head[0].get("t") if head else None
+            if not head:
+                self._recount()
+
+            if self.replay_rate > 0:
+                budget = n_records / self.replay_rate
+                await asyncio.sleep(max(0.0, budget - (time.monotonic() - t0)))
+
+    # ---------------------------------------------------------------
+    # Utilidades
+    # ---------------------------------------------------------------
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.dir, f"seg-{seq:012d}.spool")
+
+    def _new_segment(self, seq: int, size: int) -> _Segment:
+        seg = _Segment(self._path(seq), seq, size, create=True)
+        self._segments[seq] = seg
+        return seg
+
+    def _drop_consumed(self) -> None:
+        for seq in sorted(self._segments):
+            if seq >= self._read_seq or seq == self._write.seq:
+                break
+            seg = self._segments.pop(seq)
+            seg.close()
+            try:
+                os.unlink(seg.path)
+            except FileNotFoundError:
+                pass
+
+    def _load_cursor(self) -> Optional[Tuple[int, int]]:
+        try:
+            with open(os.path.join(self.dir, _CURSOR_FILE), "r", encoding="utf-8") as f:
+                c = json.load(f)
+            return int(c["seq"]), int(c["pos"])
+        except Exception:
+            return None
+
+    def _save_cursor(self) -> None:
+        path = os.path.join(self.dir, _CURSOR_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"seq": self._read_seq, "pos": self._read_pos}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _recount(self) -> None:
+        """
+        Recalcula profundidad recorriendo lo pendiente (arranque / consistencia).
+        Sólo lee encabezados; decodifica la primera entrada (oldest_ts) y las de
+        segmentos v1, que no guardan NREC.
+        """
+        items = records = 0
+        oldest: Optional[float] = None
+        for _seq, seg, start, end, nrec in self._entries():
+            if items == 0 or nrec is None:
+                try:
+                    doc = json.loads(seg.mm[start:end])
+                except Exception:
+                    continue
+                if items == 0:
+                    oldest = doc.get("t")
+                if nrec is None:
+                    nrec = len(doc.get("records") or ())
+            items += 1
+            records += nrec
+        self.depth_items = items
+        self.depth_records = records
+        self.oldest_ts = oldest
+
+    def snapshot(self) -> Dict[str, Any]:
+        pending_bytes = 0
+        for seq, seg in self._segments.items():
+            if seq > self._read_seq:
+                pending_bytes += seg.write_pos - len(_MAGIC)
+            elif seq == self._read_seq:
+                pending_bytes += max(0, seg.write_pos - self._read_pos)
+        return {
+            "depth_items": self.depth_items,
+            "depth_records": self.depth_records,
+            "depth_bytes": pending_bytes,
+            "segments": len(self._segments),
+            "appended_items": self.appended_items,
+            "replayed_items": self.replayed_items,
+            "replayed_records": self.replayed_records,
+            "replay_failures": self.replay_failures,
+            "corrupt_bytes": self.corrupt_bytes,
+            "replay_lag_s": (time.time() - self.oldest_ts) if self.oldest_ts else 0.0,
+        }
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Modo multi-proceso: un supervisor lanza N workers (fork) que escuchan el
+mismo puerto con SO_REUSEPORT; el kernel reparte las conexiones entrantes.
+
+- Cada worker envía un heartbeat periódico con su snapshot de métricas por
+  una cola compartida.
+- Un worker que termina (o que deja de enviar heartbeats dentro de
+  `health_timeout`, p.ej. loop bloqueado) se mata y se relanza con backoff
+  exponencial si cae repetidamente al arrancar.
+- El supervisor agrega las métricas de todos los workers y las loguea cada
+  `stats_interval`.
+"""
+
+import logging
+import multiprocessing as mp
+import os
+import queue
+import signal
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+log = logging.getLogger("teltonika-tcp.supervisor")
+
+# claves que no se suman entre workers (se toma el máximo)
+_MAX_SUFFIXES = ("_ms", "_lag_s", "avg_records_per_batch")
+
+WorkerTarget = Callable[[int, Any], None]  # (worker_id, stats_queue)
+
+
+def aggregate(snapshots: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Suma contadores/gauges y toma el máximo de latencias entre snapshots anidados."""
+    out: Dict[str, Any] = {}
+    for snap in snapshots:
+        for key, val in snap.items():
+            if isinstance(val, dict):
+                out[key] = aggregate([out.get(key) or {}, val])
+            elif isinstance(val, (int, float)) and not isinstance(val, bool):
+                if key.endswith(_MAX_SUFFIXES):
+                    out[key] = max(out.get(key, val), val)
+                else:
+                    out[key] = out.get(key, 0) + val
+    return out
+
+
+class _Worker:
+    __slots__ = ("wid", "proc", "started", "last_beat", "snapshot", "failures", "restart_at")
+
+    def __init__(self, wid: int) -> None:
+        self.wid = wid
+        self.proc: Optional[mp.Process] = None
+        self.started = 0.0
+        self.last_beat = 0.0
+        self.snapshot: Dict[str, Any] = {}
+        self.failures = 0  # caídas seguidas poco después de arrancar
+        self.restart_at = 0.0
+
+
+class WorkerSupervisor:
+    def __init__(
+        self,
+        target: WorkerTarget,
+        workers: int,
+        health_timeout: float = 30.0,
+        stats_interval: float = 60.0,
+        restart_backoff_max: float = 30.0,
+        min_uptime: float = 10.0,
+        shutdown_grace: float = 15.0,
+    ) -> None:
+        self._ctx = mp.get_context("fork")
+        self._target = target
+        self._queue = self._ctx.Queue()
+        self._workers = [_Worker(i) for i in range(workers)]
+        self.health_timeout = health_timeout
+        self.stats_interval = stats_interval
+        self.restart_backoff_max = restart_backoff_max
+        self.min_uptime = min_uptime
+        self.shutdown_grace = shutdown_grace  # >= drenado de los workers (DRAIN_TIMEOUT)
+        self._stopping = False
+        # métricas
+        self.restarts = 0
+        self.health_kills = 0
+
+    # ---------------------------------------------------------------
+    def _spawn(self, w: _Worker) -> None:
+        w.proc = self._ctx.Process(
+            target=self._target, args=(w.wid, self._queue), name=f"teltonika-tcp-{w.wid}", daemon=False
+        )
+        w.proc.start()
+        w.started = w.last_beat = time.monotonic()
+        w.snapshot = {}
+        log.info("Worker %d arrancado (pid=%s)", w.wid, w.proc.pid)
+
+    def _on_exit(self, w: _Worker, now: float) -> None:
+        code = w.proc.exitcode
+        uptime = now - w.started
+        w.proc = None
+        if self._stopping:
+            return
+        w.failures = w.failures + 1 if uptime < self.min_uptime else 0
+        delay = min(self.restart_backoff_max, 0.5 * (2 ** w.failures)) if w.failures else 0.0
+        w.restart_at = now + delay
+        self.restarts += 1
+        log.error("Worker %d terminó (exit=%s, uptime=%.1fs); relanzando en %.1fs", w.wid, code, uptime, delay)
+
+    def _drain_queue(self, timeout: float) -> None:
+        try:
+            msg = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return
+        while True:
+            wid, pid, snap = msg
+            w = self._workers[wid] if 0 <= wid < len(self._workers) else None
+            if w is not None and w.proc is not None and w.proc.pid == pid:
+                w.last_beat = time.monotonic()
+                w.snapshot = snap
+            try:
+                msg = self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def _check(self, now: float) -> None:
+        for w in self._workers:
+            if w.proc is None:
+                if not self._stopping and now >= w.restart_at:
+                    self._spawn(w)
+                continue
+            if not w.proc.is_alive():
+                w.proc.join(0)
+                self._on_exit(w, now)
+            elif now - w.last_beat > self.health_timeout:
+                self.health_kills += 1
+                log.error("Worker %d sin heartbeat hace %.1fs; se mata (pid=%s)", w.wid, now - w.last_beat, w.proc.pid)
+                w.proc.kill()
+                w.proc.join(5)
+                self._on_exit(w, now)
+
+    def snapshot(self) -> Dict[str, Any]:
+        alive = [w for w in self._workers if w.proc is not None and w.proc.is_alive()]
+        agg = aggregate([w.snapshot for w in alive])
+        agg["workers"] = {"configured": len(self._workers), "alive": len(alive), "restarts": self.restarts, "health_kills": self.health_kills}
+        return agg
+
+    def log_stats(self) -> None:
+        s = self.snapshot()
+        log.info("stats agregadas: %s", s)
+
+    # ---------------------------------------------------------------
+    def _request_stop(self, signum, frame) -> None:
+        self._stopping = True
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        log.info("Supervisor pid=%d con %d workers (SO_REUSEPORT)", os.getpid(), len(self._workers))
+
+        next_stats = time.monotonic() + self.stats_interval
+        try:
+            while not self._stopping:
+                self._drain_queue(timeout=0.5)
+                now = time.monotonic()
+                self._check(now)
+                if self.stats_interval > 0 and now >= next_stats:
+                    next_stats = now + self.stats_interval
+                    self.log_stats()
+        finally:
+            self._stopping = True
+            self._shutdown()
+
+    def _shutdown(self) -> None:
+        grace = self.shutdown_grace
+        procs = [w.proc for w in self._workers if w.proc is not None]
+        for p in procs:
+            if p.is_alive():
+                p.terminate()  # SIGTERM: el worker drena conexiones, cierra batcher/spool y sale
+        deadline = time.monotonic() + grace
+        for p in procs:
+            p.join(max(0.0, deadline - time.monotonic()))
+            if p.is_alive():
+                log.warning("Worker pid=%s no terminó en %.0fs; SIGKILL", p.pid, grace)
+                p.kill()
+                p.join()
+        log.info("Supervisor detenido")
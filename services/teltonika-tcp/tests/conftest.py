@@ -0,0 +1,5 @@
+import os, sys
+# Los módulos del servicio se importan planos (como en el contenedor: /app)
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if root not in sys.path:
+    sys.path.insert(0, root)
@@ -0,0 +1,120 @@
+"""Transporte, batcher y frames de prueba para ejercitar los protocolos sin sockets."""
+
+import asyncio
+import struct
+from typing import Any, List, Optional, Tuple
+
+from crc16 import crc16_ibm
+from framing import FramingStats, TeltonikaProtocol
+
+
+class FakeTransport:
+    def __init__(self, protocol=None) -> None:
+        self.protocol = protocol
+        self.out = bytearray()
+        self.paused = False
+        self.closed = False
+
+    def get_extra_info(self, name, default=None):
+        return ("127.0.0.1", 40000) if name == "peername" else default
+
+    def write(self, data: bytes) -> None:
+        assert not self.closed, "write sobre transporte cerrado"
+        self.out += data
+
+    def pause_reading(self) -> None:
+        self.paused = True
+
+    def resume_reading(self) -> None:
+        self.paused = False
+
+    def get_write_buffer_size(self) -> int:
+        return 0
+
+    def is_closing(self) -> bool:
+        return self.closed
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            if self.protocol is not None:
+                self.protocol.connection_lost(None)
+
+    def take(self) -> bytes:
+        out, self.out = bytes(self.out), bytearray()
+        return out
+
+
+class FakeDatagramTransport:
+    def __init__(self) -> None:
+        self.sent: List[Tuple[bytes, Any]] = []
+
+    def sendto(self, data: bytes, addr=None) -> None:
+        self.sent.append((data, addr))
+
+
+class FakeBatcher:
+    """enqueue() devuelve un future que el test resuelve (ok / falla / excepción)."""
+
+    def __init__(self) -> None:
+        self.calls: List[Tuple[str, int, Any, asyncio.Future]] = []
+
+    def enqueue(self, imei: str, codec: int, records) -> asyncio.Future:
+        fut = asyncio.get_running_loop().create_future()
+        self.calls.append((imei, codec, records, fut))
+        return fut
+
+    def settle(self, i: int, ok: bool = True, exc: Optional[Exception] = None) -> None:
+        fut = self.calls[i][3]
+        if exc is not None:
+            fut.set_exception(exc)
+        else:
+            fut.set_result(ok)
+
+
+def open_session(batcher=None, imei: str = "350000000000001", **kw) -> Tuple[TeltonikaProtocol, FakeTransport]:
+    """Protocolo conectado con el handshake ya aceptado (sin timer de lectura salvo que se pida)."""
+    kw.setdefault("read_timeout", 0)
+    proto = TeltonikaProtocol(batcher or FakeBatcher(), FramingStats(), **kw)
+    tr = FakeTransport(proto)
+    proto.connection_made(tr)
+    proto.data_received(handshake(imei))
+    assert tr.take() == b"\x01"
+    return proto, tr
+
+
+def ack(n: int) -> bytes:
+    return n.to_bytes(4, "big")
+
+
+def handshake(imei: str = "350000000000001") -> bytes:
+    return struct.pack(">H", len(imei)) + imei.encode()
+
+
+def avl_payload(n: int, codec: int = 0x08, ts_ms: int = 1_700_000_000_000) -> bytes:
+    """Payload AVL mínimo: n records sin IO."""
+    rec = bytearray()
+    for i in range(n):
+        rec += struct.pack(">QBiiHHBH", ts_ms + i * 1000, 0, -706000000, -334000000, 500, 90, 9, 40)
+        if codec == 0x08:
+            rec += struct.pack(">BB", 0, 0) + b"\x00" * 4  # event, total, 4 grupos vacíos
+        else:
+            rec += struct.pack(">HH", 0, 0) + b"\x00\x00" * 5  # + grupo X-bytes
+    return bytes([codec, n]) + bytes(rec) + bytes([n])
+
+
+def frame(payload: bytes, bad_crc: bool = False) -> bytes:
+    crc = crc16_ibm(payload) & 0xFFFF
+    if bad_crc:
+        crc ^= 0x1
+    return b"\x00\x00\x00\x00" + struct.pack(">I", len(payload)) + payload + struct.pack(">I", crc)
+
+
+def command_response(text: str) -> bytes:
+    body = text.encode()
+    return frame(struct.pack(">BBBI", 0x0C, 1, 0x06, len(body)) + body + b"\x01")
+
+
+def datagram(imei: str, packet_id: int, avl_id: int, payload: bytes) -> bytes:
+    body = struct.pack(">HBBH", packet_id, 0x01, avl_id, len(imei)) + imei.encode() + payload
+    return struct.pack(">H", len(body)) + body
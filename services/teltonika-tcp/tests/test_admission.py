@@ -0,0 +1,57 @@
+import asyncio
+
+from admission import AdmissionCache
+
+
+class _Db:
+    def __init__(self, rows, fail=False):
+        self.rows = rows
+        self.fail = fail
+        self.queries = []
+
+    async def fetch_devices(self, imeis=None, after_id=0):
+        self.queries.append(imeis)
+        if self.fail:
+            raise ConnectionError("sin DB")
+        if imeis is None:
+            return [r for r in self.rows if r[0] > after_id]
+        return [r for r in self.rows if r[1] in imeis]
+
+
+def test_misses_share_one_lookup_and_are_cached():
+    async def scenario():
+        db = _Db([(1, "111", None)])
+        adm = AdmissionCache(db, lookup_window_ms=5)
+        assert adm.check("111") is None and adm.check("999") is None
+        futs = [adm.resolve("111"), adm.resolve("999"), adm.resolve("111")]
+        assert await asyncio.gather(*futs) == [True, False, True]
+        assert db.queries == [["111", "999"]]
+        assert adm.check("111") is True and adm.check("999") is False  # caché positiva y negativa
+        await adm.close()
+
+    asyncio.run(scenario())
+
+
+def test_fail_open_when_db_is_down():
+    async def scenario():
+        db = _Db([], fail=True)
+        adm = AdmissionCache(db, lookup_window_ms=0, retry_after=60)
+        assert await adm.resolve("111") is True
+        assert adm.check("222") is True  # sin volver a consultar durante retry_after
+        assert len(db.queries) == 1 and adm.unverified == 2
+        await adm.close()
+
+    asyncio.run(scenario())
+
+
+def test_refresh_preloads_devices():
+    async def scenario():
+        db = _Db([(1, "111", 5), (2, "222", 5)])
+        adm = AdmissionCache(db)
+        assert await adm.refresh_once() == 2
+        assert adm.check("222") is True
+        db.rows.append((3, "333", 5))
+        assert await adm.refresh_once() == 1  # incremental: id > 2
+        await adm.close()
+
+    asyncio.run(scenario())
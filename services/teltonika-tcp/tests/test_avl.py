@@ -0,0 +1,35 @@
+import struct
+
+import pytest
+
+import avl
+from avl import decode_avl_payload
+from fakes import avl_payload
+
+
+def _large_n_payload(n):
+    # record 8E con el grupo de 1 byte declarando n pares y sin los bytes
+    rec = struct.pack(">QBiiHHBHHH", 1_700_000_000_000, 0, 0, 0, 0, 0, 0, 0, 0, n) + struct.pack(">H", n)
+    return bytes([0x8E, 1]) + rec + b"\x00" * 8 + b"\x01"
+
+
+def test_decodes_minimal_records():
+    for codec in (0x08, 0x8E):
+        c, n1, records, _ = decode_avl_payload(avl_payload(3, codec))
+        assert (c, n1, len(records)) == (codec, 3, 3)
+
+
+def test_truncated_group_with_large_n_is_rejected_before_struct():
+    before = len(avl._PAIRS_CACHE)
+    for n in range(60000, 60050):
+        with pytest.raises(ValueError, match="truncado"):
+            decode_avl_payload(_large_n_payload(n))
+    assert len(avl._PAIRS_CACHE) == before
+
+
+def test_pairs_cache_only_keeps_small_groups():
+    big = avl._PAIRS_CACHE_MAX_N + 1
+    avl._pairs_struct(0x8E, 1, big)
+    assert (0x8E, 1, big) not in avl._PAIRS_CACHE
+    avl._pairs_struct(0x8E, 1, 3)
+    assert (0x8E, 1, 3) in avl._PAIRS_CACHE
@@ -0,0 +1,36 @@
+import asyncio
+
+from batcher import IngestBatcher
+
+
+def test_coalesces_by_size_and_linger():
+    async def scenario():
+        batches = []
+
+        async def sink(batch):
+            batches.append([p.imei for p in batch])
+            return [p.imei != "bad" for p in batch]
+
+        b = IngestBatcher(sink, max_records=4, linger_ms=20)
+        f1 = b.enqueue("a", 8, [1, 2])
+        f2 = b.enqueue("bad", 8, [3, 4])  # 4 records: flush por tamaño
+        f3 = b.enqueue("c", 8, [5])  # flush por linger
+        assert await asyncio.gather(f1, f2, f3) == [True, False, True]
+        assert batches == [["a", "bad"], ["c"]]
+        s = b.snapshot()
+        assert (s["flush_by_size"], s["flush_by_linger"], s["failed_items"]) == (1, 1, 1)
+
+    asyncio.run(scenario())
+
+
+def test_sink_error_fails_whole_batch():
+    async def scenario():
+        async def sink(batch):
+            raise RuntimeError("API caída")
+
+        b = IngestBatcher(sink, max_records=100, linger_ms=1000)
+        futs = [b.enqueue(str(i), 8, [i]) for i in range(3)]
+        await b.close()  # despacha lo pendiente sin esperar el linger
+        assert [f.result() for f in futs] == [False] * 3
+
+    asyncio.run(scenario())
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from fakes import FakeBatcher, avl_payload, command_response, frame, open_session
+
+
+def test_command_roundtrip():
+    async def scenario():
+        proto, tr = open_session()
+        fut = proto.send_command("getver", timeout=1.0)
+        assert b"getver" in tr.take()
+        proto.data_received(command_response("Ver:03.28"))
+        return await fut
+
+    assert asyncio.run(scenario()) == "Ver:03.28"
+
+
+def test_queued_command_times_out_behind_unsettled_acks():
+    async def scenario():
+        batcher = FakeBatcher()
+        proto, tr = open_session(batcher)
+        proto.data_received(frame(avl_payload(2)))  # ACK pendiente: el lote nunca se persiste
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        with pytest.raises(asyncio.TimeoutError):
+            await proto.send_command("getinfo", timeout=0.05)
+        assert loop.time() - t0 < 0.5
+        assert tr.take() == b""  # nunca se escribió
+        assert proto.session_info(0.0)["pending_commands"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_deadline_counts_from_enqueue():
+    async def scenario():
+        proto, tr = open_session()
+        first = proto.send_command("a", timeout=0.1)
+        second = proto.send_command("b", timeout=0.15)
+        with pytest.raises(asyncio.TimeoutError):
+            await first
+        # "b" sigue en cola (lugar reservado a la respuesta tardía de "a"), su plazo ya venía corriendo
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        with pytest.raises(asyncio.TimeoutError):
+            await second
+        assert loop.time() - t0 < 0.1
+
+    asyncio.run(scenario())
+
+
+def test_late_response_is_not_given_to_next_command():
+    async def scenario():
+        proto, tr = open_session(command_grace=1.0)
+        first = proto.send_command("a", timeout=0.05)
+        with pytest.raises(asyncio.TimeoutError):
+            await first
+        second = proto.send_command("b", timeout=1.0)
+        assert b"b" not in tr.take()  # no se escribe mientras puede llegar la respuesta de "a"
+        proto.data_received(command_response("respuesta de a"))
+        assert b"b" in tr.take()
+        proto.data_received(command_response("respuesta de b"))
+        return await second
+
+    assert asyncio.run(scenario()) == "respuesta de b"
+
+
+def test_slot_released_after_grace_without_late_response():
+    async def scenario():
+        proto, tr = open_session(command_grace=0.05)
+        first = proto.send_command("a", timeout=0.05)
+        second = proto.send_command("b", timeout=1.0)
+        with pytest.raises(asyncio.TimeoutError):
+            await first
+        tr.take()
+        await asyncio.sleep(0.1)
+        assert b"b" in tr.take()
+        proto.data_received(command_response("ok"))
+        return await second
+
+    assert asyncio.run(scenario()) == "ok"
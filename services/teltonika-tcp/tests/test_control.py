@@ -0,0 +1,23 @@
+import asyncio
+import json
+
+from control import make_route
+from fakes import avl_payload, frame, open_session
+from sessions import SessionRegistry
+
+
+def test_sessions_sort_whitelist():
+    async def scenario():
+        reg = SessionRegistry()
+        route = make_route(reg)
+        a, _ = open_session(imei="350000000000001", sessions=reg)
+        b, _ = open_session(imei="350000000000002", sessions=reg)
+        b.data_received(frame(avl_payload(1)))
+        status, _ctype, body = await route("GET", "/sessions", {"sort": "frames"}, b"")
+        assert status == 200
+        assert [s["imei"] for s in json.loads(body)["sessions"]] == ["350000000000002", "350000000000001"]
+        for bad in ("peer", "imei", "paused", "__class__"):
+            status, _ctype, body = await route("GET", "/sessions", {"sort": bad}, b"")
+            assert status == 400 and b"sort" in body
+
+    asyncio.run(scenario())
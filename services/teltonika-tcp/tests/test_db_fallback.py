@@ -0,0 +1,42 @@
+import asyncio
+
+from db_fallback import DbFallback
+
+
+class _Cursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.sql = []
+        self._result = []
+
+    async def execute(self, sql, params=()):
+        self.sql.append(sql)
+        if sql.startswith("SELECT external_id"):
+            self._result = [r for r in self.rows if r[0] in params[0]]
+        elif sql.startswith("SELECT tenant_id"):
+            self._result = [(7,)]
+        elif sql.startswith("INSERT INTO devices"):
+            self._result = [(100, 7)]
+
+    async def fetchall(self):
+        return self._result
+
+    async def fetchone(self):
+        return self._result[0] if self._result else None
+
+
+def _db(auto_create):
+    return DbFallback("h", 5432, "db", "u", None, auto_create=auto_create)
+
+
+def test_resolve_does_not_create_devices_without_auto_create():
+    cur = _Cursor([("111", 1, 7)])
+    out = asyncio.run(_db(False)._resolve(cur, ["111", "999"]))
+    assert out == {"111": (1, 7)}
+    assert not any(sql.startswith("INSERT") for sql in cur.sql)
+
+
+def test_resolve_creates_devices_with_auto_create():
+    cur = _Cursor([("111", 1, 7)])
+    out = asyncio.run(_db(True)._resolve(cur, ["111", "999"]))
+    assert out == {"111": (1, 7), "999": (100, 7)}
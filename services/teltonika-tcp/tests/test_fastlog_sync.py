@@ -0,0 +1,16 @@
+from pathlib import Path
+
+import pytest
+
+import fastlog
+
+SERVICES = Path(fastlog.__file__).resolve().parent.parent
+COPIES = [SERVICES / name / "fastlog.py" for name in ("mqtt-worker", "external-collector")]
+
+
+@pytest.mark.parametrize("copy", COPIES, ids=lambda p: p.parent.name)
+def test_copy_in_sync(copy):
+    if not copy.exists():
+        pytest.skip(f"services/{copy.parent.name} no está en el árbol")
+    assert copy.read_bytes() == Path(fastlog.__file__).read_bytes(), \
+        f"{copy} difiere de teltonika-tcp/fastlog.py: copiar el mismo archivo en los tres servicios"
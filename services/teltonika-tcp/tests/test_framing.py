@@ -0,0 +1,251 @@
+import asyncio
+import struct
+
+from fakes import FakeBatcher, FakeTransport, ack, avl_payload, command_response, frame, handshake, open_session
+from framing import FramingStats, TeltonikaProtocol
+
+
+async def _settle(batcher, i, **kw):
+    batcher.settle(i, **kw)
+    await asyncio.sleep(0)  # callbacks del future
+
+
+# -------------------------------------------------------------------
+# ACK
+# -------------------------------------------------------------------
+def test_acks_follow_frame_order():
+    async def scenario():
+        b = FakeBatcher()
+        proto, tr = open_session(b)
+        proto.data_received(frame(avl_payload(2)) + frame(avl_payload(3)))
+        assert [len(c[2]) for c in b.calls] == [2, 3]
+        await _settle(b, 1)
+        assert tr.take() == b""  # el segundo espera al primero
+        await _settle(b, 0)
+        assert tr.take() == ack(2) + ack(3)
+
+    asyncio.run(scenario())
+
+
+def test_zero_ack_when_persistence_fails():
+    async def scenario():
+        b = FakeBatcher()
+        proto, tr = open_session(b)
+        proto.data_received(frame(avl_payload(2)) + frame(avl_payload(1)) + frame(avl_payload(4)))
+        await _settle(b, 0, ok=False)
+        await _settle(b, 1, exc=RuntimeError("spool lleno"))
+        await _settle(b, 2)
+        assert tr.take() == ack(0) + ack(0) + ack(4)
+
+    asyncio.run(scenario())
+
+
+def test_pauses_at_max_pending_and_resumes_below_half():
+    async def scenario():
+        b = FakeBatcher()
+        proto, tr = open_session(b, max_pending=4)
+        proto.data_received(b"".join(frame(avl_payload(1)) for _ in range(6)))
+        assert len(b.calls) == 4 and tr.paused  # los otros 2 quedan en el buffer
+        await _settle(b, 0)
+        await _settle(b, 1)
+        assert len(b.calls) == 4 and tr.paused
+        await _settle(b, 2)  # queda 1 pendiente < 4 // 2
+        assert not tr.paused and len(b.calls) == 6
+        for i in range(3, 6):
+            await _settle(b, i)
+        assert tr.take() == ack(1) * 6
+
+    asyncio.run(scenario())
+
+
+# -------------------------------------------------------------------
+# Re-sync
+# -------------------------------------------------------------------
+def test_resync_skips_garbage_before_preamble():
+    async def scenario():
+        b = FakeBatcher()
+        proto, tr = open_session(b)
+        proto.data_received(b"\xab\xcd\x01" + frame(avl_payload(2)))
+        assert len(b.calls) == 1
+        assert proto._stats.resync_bytes == 3
+
+    asyncio.run(scenario())
+
+
+def test_bad_crc_gets_zero_ack_and_stream_continues():
+    async def scenario():
+        b = FakeBatcher()
+        proto, tr = open_session(b)
+        proto.data_received(frame(avl_payload(2), bad_crc=True) + frame(avl_payload(1)))
+        assert proto._stats.crc_errors == 1
+        assert len(b.calls) == 1
+        await _settle(b, 0)
+        assert tr.take() == ack(0) + ack(1)
+
+    asyncio.run(scenario())
+
+
+def test_bad_crc_on_command_response_has_no_ack():
+    async def scenario():
+        proto, tr = open_session()
+        resp = bytearray(command_response("x"))
+        resp[-1] ^= 0x1
+        proto.data_received(bytes(resp))
+        assert proto._stats.crc_errors == 1
+        assert tr.take() == b""
+
+    asyncio.run(scenario())
+
+
+def test_oversized_length_resyncs_to_next_frame():
+    async def scenario():
+        b = FakeBatcher()
+        proto, tr = open_session(b, max_frame=1024)
+        bogus = b"\x00\x00\x00\x00" + struct.pack(">I", 0xFFFFFFF0)
+        proto.data_received(bogus + frame(avl_payload(3)))
+        assert proto._stats.oversized == 1
+        assert [len(c[2]) for c in b.calls] == [3]
+
+    asyncio.run(scenario())
+
+
+def test_frame_split_across_reads():
+    async def scenario():
+        b = FakeBatcher()
+        proto, tr = open_session(b)
+        data = frame(avl_payload(2)) * 2
+        for i in range(len(data)):
+            proto.data_received(data[i:i + 1])
+        assert [len(c[2]) for c in b.calls] == [2, 2]
+
+    asyncio.run(scenario())
+
+
+def test_empty_frame_closes():
+    async def scenario():
+        proto, tr = open_session()
+        proto.data_received(b"\x00" * 8)
+        assert tr.closed
+
+    asyncio.run(scenario())
+
+
+# -------------------------------------------------------------------
+# Handshake / admisión
+# -------------------------------------------------------------------
+class _Admission:
+    def __init__(self, answer):
+        self.answer = answer
+        self.pending = None
+
+    def check(self, imei):
+        return self.answer
+
+    def resolve(self, imei):
+        self.pending = asyncio.get_running_loop().create_future()
+        return self.pending
+
+
+def _connect(admission, batcher=None):
+    proto = TeltonikaProtocol(batcher or FakeBatcher(), FramingStats(), read_timeout=0, admission=admission)
+    tr = FakeTransport(proto)
+    proto.connection_made(tr)
+    return proto, tr
+
+
+def test_handshake_rejected_by_admission():
+    async def scenario():
+        proto, tr = _connect(_Admission(False))
+        proto.data_received(handshake() + frame(avl_payload(1)))
+        assert tr.take() == b"\x00"
+        assert tr.closed and proto.imei is None
+
+    asyncio.run(scenario())
+
+
+def test_handshake_waits_for_admission_lookup():
+    async def scenario():
+        adm, b = _Admission(None), FakeBatcher()
+        proto, tr = _connect(adm, b)
+        proto.data_received(handshake() + frame(avl_payload(2)))
+        assert tr.paused and tr.take() == b"" and not b.calls
+        adm.pending.set_result(True)
+        await asyncio.sleep(0)
+        assert tr.take() == b"\x01" and not tr.paused
+        assert len(b.calls) == 1  # el frame que esperaba en el buffer
+
+    asyncio.run(scenario())
+
+
+# -------------------------------------------------------------------
+# Drenado / timeout
+# -------------------------------------------------------------------
+def test_drain_waits_for_pending_ack():
+    async def scenario():
+        b = FakeBatcher()
+        proto, tr = open_session(b)
+        proto.data_received(frame(avl_payload(1)))
+        proto.drain(0)
+        await asyncio.sleep(0.01)
+        assert not tr.closed
+        await _settle(b, 0)
+        assert tr.take() == ack(1) and tr.closed
+
+    asyncio.run(scenario())
+
+
+def test_drain_closes_idle_connection():
+    async def scenario():
+        proto, tr = open_session()
+        proto.drain(0)
+        await asyncio.sleep(0.01)
+        assert tr.closed
+
+    asyncio.run(scenario())
+
+
+def test_read_timeout_ignores_wait_for_persistence():
+    async def scenario():
+        b = FakeBatcher()
+        proto, tr = open_session(b, read_timeout=0.05)
+        proto.data_received(frame(avl_payload(1)))
+        await asyncio.sleep(0.12)
+        assert not tr.closed  # esperando el lote, no al equipo
+        await _settle(b, 0)
+        await asyncio.sleep(0.12)
+        assert tr.closed and proto._stats.timeouts == 1
+
+    asyncio.run(scenario())
+
+
+def test_last_seen_is_bounded():
+    stats = FramingStats(max_devices=2)
+    for imei in ("a", "b", "a", "c"):
+        stats.last_seen[imei] = 1.0
+    assert list(stats.last_seen) == ["a", "c"]  # "a" se renovó, "b" era el menos reciente
+
+
+def test_drain_does_not_wait_for_partial_frame():
+    async def scenario():
+        b = FakeBatcher()
+        proto, tr = open_session(b)
+        data = frame(avl_payload(1))
+        proto.data_received(b"\xab" + data + data[:10])  # resto de re-sync + frame a medias
+        proto.drain(0)
+        await asyncio.sleep(0.01)
+        assert not tr.closed  # espera el ACK del lote en curso
+        await _settle(b, 0)
+        assert tr.take() == ack(1) and tr.closed
+
+    asyncio.run(scenario())
+
+
+def test_drain_closes_with_partial_frame_and_no_pending_acks():
+    async def scenario():
+        proto, tr = open_session()
+        proto.data_received(frame(avl_payload(1))[:10])
+        proto.drain(0)
+        await asyncio.sleep(0.01)
+        assert tr.closed
+
+    asyncio.run(scenario())
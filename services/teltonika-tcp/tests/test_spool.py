@@ -0,0 +1,160 @@
+import asyncio
+import json
+import os
+import struct
+import zlib
+
+import spool as spool_mod
+from spool import Spool
+
+
+def _items(n, recs=3, tag="a"):
+    return [{"imei": f"35{i:013d}", "codec": 8, "records": [{"n": j} for j in range(recs)], "tag": tag} for i in range(n)]
+
+
+def _write(sp, items):
+    async def run():
+        sp.start(_never)
+        await sp.append(items)
+        await sp.close()
+
+    asyncio.run(run())
+
+
+async def _never(items):
+    return False
+
+
+def _reopen(path, **kw):
+    sp = Spool(path, **kw)
+    sp.open()
+    return sp
+
+
+def test_recount_uses_headers_only(tmp_path, monkeypatch):
+    sp = _reopen(str(tmp_path))
+    _write(sp, _items(10, recs=4))
+    calls = []
+    real_loads = json.loads
+    monkeypatch.setattr(spool_mod.json, "loads", lambda b, *a, **k: calls.append(1) or real_loads(b, *a, **k))
+    sp = _reopen(str(tmp_path))
+    assert (sp.depth_items, sp.depth_records) == (10, 40)
+    assert len(calls) == 1  # sólo la primera entrada (oldest_ts)
+    asyncio.run(sp.close())
+
+
+def test_corrupt_entry_in_write_segment_is_skipped(tmp_path):
+    sp = _reopen(str(tmp_path))
+    _write(sp, _items(3, tag="x"))
+    sp = _reopen(str(tmp_path))
+    # corrompe el JSON de la segunda entrada del segmento en escritura
+    seg = sp._write
+    _, first_end, _ = seg.entry(len(spool_mod._MAGIC))
+    start, _, _ = seg.entry(first_end)
+    seg.mm[start] ^= 0xFF
+    items, _ = sp._peek(10)
+    assert len(items) == 2
+    assert sp.corrupt_bytes > 0
+    assert any(name.startswith("corrupt-") for name in os.listdir(tmp_path))
+    sp._recount()
+    assert sp.depth_items == 2
+    asyncio.run(sp.close())
+
+
+def test_reads_v1_segments_and_writes_v2(tmp_path):
+    # segmento del formato anterior: LEN | CRC32 | JSON
+    seg = bytearray(4096)
+    seg[0:8] = b"QFSPOOL1"
+    pos = 8
+    for it in _items(2, recs=5):
+        data = json.dumps(it).encode()
+        struct.pack_into(">II", seg, pos, len(data), zlib.crc32(data))
+        seg[pos + 8:pos + 8 + len(data)] = data
+        pos += 8 + len(data)
+    (tmp_path / "seg-000000000001.spool").write_bytes(bytes(seg))
+
+    sp = _reopen(str(tmp_path))
+    assert (sp.depth_items, sp.depth_records) == (2, 10)
+    assert sp._write.version == 2 and sp._write.seq == 2
+    _write(sp, _items(1, recs=1, tag="new"))
+    sp = _reopen(str(tmp_path))
+    items, _ = sp._peek(10)
+    assert [it["tag"] for it in items] == ["a", "a", "new"]
+    asyncio.run(sp.close())
+
+
+async def _wait_for(cond, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not cond():
+        assert loop.time() < deadline, "timeout esperando condición"
+        await asyncio.sleep(0.005)
+
+
+def test_replay_resumes_from_persisted_cursor(tmp_path):
+    kw = dict(replay_batch=2, replay_backoff=0.01, replay_rate=0, segment_bytes=600)
+    sp = _reopen(str(tmp_path), **kw)
+    items = _items(6, recs=2)
+    _write(sp, items)
+    assert len([n for n in os.listdir(tmp_path) if n.endswith(".spool")]) > 1  # varios segmentos
+
+    # primer proceso: acepta un lote y después el sink falla (caída de la API / del proceso)
+    delivered = []
+
+    async def first_run():
+        sp = _reopen(str(tmp_path), **kw)
+        assert sp.depth_items == 6
+
+        async def sink(batch):
+            if delivered:
+                return False
+            delivered.append([it["imei"] for it in batch])
+            return True
+
+        sp.start(sink)
+        await _wait_for(lambda: sp.replay_failures > 0)
+        assert (sp.depth_items, sp.depth_records) == (4, 8)
+        await sp.close()
+
+    asyncio.run(first_run())
+    assert delivered == [[it["imei"] for it in items[:2]]]
+
+    # reinicio: sigue desde el cursor, sin re-entregar lo ya aceptado
+    async def second_run():
+        sp = _reopen(str(tmp_path), **kw)
+        assert (sp.depth_items, sp.depth_records) == (4, 8)
+
+        async def sink(batch):
+            delivered.append([it["imei"] for it in batch])
+            return True
+
+        sp.start(sink)
+        await _wait_for(lambda: sp.depth_items == 0)
+        assert sp.replayed_items == 4 and sp.oldest_ts is None
+        await sp.close()
+
+    asyncio.run(second_run())
+    assert [imei for batch in delivered for imei in batch] == [it["imei"] for it in items]
+    # sólo queda el segmento en escritura
+    assert len([n for n in os.listdir(tmp_path) if n.endswith(".spool")]) == 1
+
+
+def test_unsynced_tail_is_not_replayed_after_crash(tmp_path):
+    sp = _reopen(str(tmp_path))
+    _write(sp, _items(2))
+    sp = _reopen(str(tmp_path))
+    # entrada a medio escribir (el proceso murió antes de completar el encabezado)
+    seg = sp._write
+    pos = seg.write_pos
+    seg.mm[pos:pos + 6] = spool_mod._MARK + b"\x00\x01"
+    seg.mm.flush()
+    asyncio.run(sp.close())
+
+    sp = _reopen(str(tmp_path))
+    items, _ = sp._peek(10)
+    assert len(items) == 2 and sp.depth_items == 2
+    _write(sp, _items(1, tag="after"))
+    sp = _reopen(str(tmp_path))
+    items, _ = sp._peek(10)
+    assert [it["tag"] for it in items] == ["a", "a", "after"]
+    asyncio.run(sp.close())
@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+
+from fakes import FakeBatcher, FakeDatagramTransport, avl_payload, datagram
+from udp import TeltonikaDatagramProtocol, UdpStats, build_ack, parse_datagram
+
+IMEI = "350000000000001"
+ADDR = ("10.0.0.1", 5000)
+
+
+def _open(batcher, **kw):
+    proto = TeltonikaDatagramProtocol(batcher, UdpStats(), **kw)
+    tr = FakeDatagramTransport()
+    proto.connection_made(tr)
+    return proto, tr
+
+
+async def _settle(batcher, i, **kw):
+    batcher.settle(i, **kw)
+    await asyncio.sleep(0)
+
+
+def test_parse_datagram_roundtrip():
+    packet_id, avl_id, imei, avl = parse_datagram(datagram(IMEI, 0xCAFE, 7, avl_payload(2)))
+    assert (packet_id, avl_id, imei) == (0xCAFE, 7, IMEI)
+    assert bytes(avl) == avl_payload(2)
+    with pytest.raises(ValueError):
+        parse_datagram(datagram(IMEI, 1, 1, avl_payload(1))[:-1])
+
+
+def test_ack_after_persistence():
+    async def scenario():
+        b = FakeBatcher()
+        proto, tr = _open(b)
+        proto.datagram_received(datagram(IMEI, 1, 7, avl_payload(3)), ADDR)
+        assert tr.sent == []
+        await _settle(b, 0)
+        assert tr.sent == [(build_ack(1, 7, 3), ADDR)]
+
+    asyncio.run(scenario())
+
+
+def test_duplicate_of_persisted_datagram_resends_ack():
+    async def scenario():
+        b = FakeBatcher()
+        proto, tr = _open(b)
+        dgram = datagram(IMEI, 1, 7, avl_payload(3))
+        proto.datagram_received(dgram, ADDR)
+        await _settle(b, 0)
+        proto.datagram_received(datagram(IMEI, 2, 7, avl_payload(3)), ADDR)  # ACK perdido: reenvío
+        assert len(b.calls) == 1  # no se vuelve a insertar
+        assert tr.sent[-1] == (build_ack(2, 7, 3), ADDR)
+        assert proto._stats.duplicates == 1
+
+    asyncio.run(scenario())
+
+
+def test_duplicate_while_in_flight_is_ignored():
+    async def scenario():
+        b = FakeBatcher()
+        proto, tr = _open(b)
+        dgram = datagram(IMEI, 1, 7, avl_payload(3))
+        proto.datagram_received(dgram, ADDR)
+        proto.datagram_received(dgram, ADDR)
+        assert len(b.calls) == 1 and tr.sent == []
+        await _settle(b, 0)
+        assert tr.sent == [(build_ack(1, 7, 3), ADDR)]
+
+    asyncio.run(scenario())
+
+
+def test_failed_datagram_is_processed_again_on_resend():
+    async def scenario():
+        b = FakeBatcher()
+        proto, tr = _open(b)
+        dgram = datagram(IMEI, 1, 7, avl_payload(3))
+        proto.datagram_received(dgram, ADDR)
+        await _settle(b, 0, ok=False)
+        assert tr.sent == [(build_ack(1, 7, 0), ADDR)]
+        proto.datagram_received(dgram, ADDR)
+        assert len(b.calls) == 2
+        await _settle(b, 1)
+        assert tr.sent[-1] == (build_ack(1, 7, 3), ADDR)
+
+    asyncio.run(scenario())
+
+
+def test_drops_above_max_pending():
+    async def scenario():
+        b = FakeBatcher()
+        proto, tr = _open(b, max_pending=1)
+        proto.datagram_received(datagram(IMEI, 1, 1, avl_payload(1)), ADDR)
+        proto.datagram_received(datagram("350000000000002", 1, 1, avl_payload(1)), ADDR)
+        assert len(b.calls) == 1 and proto._stats.dropped == 1 and tr.sent == []
+
+    asyncio.run(scenario())
+
+
+class _Admission:
+    def __init__(self, known):
+        self.known = known
+        self.resolved = []
+
+    def check(self, imei):
+        return self.known.get(imei)
+
+    def resolve(self, imei):
+        self.resolved.append(imei)
+        self.known[imei] = imei.endswith("1")  # la consulta responde para el reenvío
+        return asyncio.get_running_loop().create_future()
+
+
+def test_admission_miss_drops_until_resolved():
+    async def scenario():
+        b = FakeBatcher()
+        adm = _Admission({})
+        proto, tr = _open(b, admission=adm)
+        proto.datagram_received(datagram(IMEI, 1, 7, avl_payload(1)), ADDR)
+        proto.datagram_received(datagram("350000000000002", 1, 7, avl_payload(1)), ADDR)
+        assert not b.calls and tr.sent == []  # ni insert ni ACK hasta saber
+        assert adm.resolved == [IMEI, "350000000000002"] and proto._stats.admitting == 2
+        # reenvíos: el conocido se procesa, el desconocido se rechaza
+        proto.datagram_received(datagram(IMEI, 2, 7, avl_payload(1)), ADDR)
+        proto.datagram_received(datagram("350000000000002", 2, 7, avl_payload(1)), ADDR)
+        assert [c[0] for c in b.calls] == [IMEI] and proto._stats.rejected == 1
+
+    asyncio.run(scenario())
+
+
+def test_duplicate_state_is_bounded():
+    async def scenario():
+        b = FakeBatcher()
+        proto, tr = _open(b, max_tracked=2)
+        imeis = [f"35000000000000{i}" for i in range(3)]
+        for i, imei in enumerate(imeis):
+            proto.datagram_received(datagram(imei, 1, 7, avl_payload(1)), ADDR)
+            await _settle(b, i)
+        assert list(proto._last) == imeis[1:] and list(proto._last_seen) == imeis[1:]
+        # el más viejo se olvidó: su reenvío se procesa otra vez (al-menos-una-vez)
+        proto.datagram_received(datagram(imeis[0], 2, 7, avl_payload(1)), ADDR)
+        assert len(b.calls) == 4
+
+    asyncio.run(scenario())
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Canal UDP Teltonika (AVL sobre UDP).
+
+Pensado para equipos de baja frecuencia: no hay socket abierto por equipo,
+cada datagrama trae su propio encabezado con IMEI.
+
+Datagrama:  LEN(2) | PACKET_ID(2) | 0x01 | AVL_PACKET_ID(1) | IMEI_LEN(2) | IMEI | AVL DATA
+            AVL DATA = codec | N1 | records | N2   (igual que en TCP, sin preámbulo ni CRC)
+ACK:        0x0005 | PACKET_ID(2) | 0x01 | AVL_PACKET_ID(1) | records aceptados(1)
+
+- Mismo decoder y mismo batcher que TCP: el ACK sale cuando el lote quedó
+  persistido (API / DB / spool); si no, ACK con 0 y el equipo reenvía.
+- Reenvíos: el equipo repite el datagrama (mismo AVL_PACKET_ID) si el ACK se
+  pierde. Se recuerda el último AVL_PACKET_ID por IMEI (hasta `max_tracked`
+  IMEIs, se olvidan los menos recientes): si ya se persistió se re-envía el
+  ACK sin volver a insertar; si aún está en curso se ignora.
+- Admisión (admission.py): datagramas de IMEIs que la caché sabe
+  desconocidos se descartan sin ACK; ante un miss también (sin handshake no
+  hay dónde esperar): la consulta sigue en segundo plano y el reenvío del
+  equipo ya encuentra la respuesta en la caché.
+- Sin control de flujo posible en UDP: por encima de `max_pending` datagramas
+  en curso se descartan (sin ACK) y el equipo reintenta más tarde.
+"""
+
+import asyncio
+import logging
+import struct
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from avl import decode_avl_payload
+from fastlog import LazyHex, suppressed_note
+from framing import ACK_SECONDS, DECODE_SECONDS, LOG_SAMPLER, LruDict
+
+log = logging.getLogger("teltonika-tcp.udp")
+
+_HEADER = struct.Struct(">HHBBH")  # len, packet id, 0x01, avl packet id, imei len
+_ACK = struct.Struct(">HHBBB")
+
+# estado del último AVL_PACKET_ID por IMEI
+_IN_FLIGHT = -1
+
+
+class UdpStats:
+    __slots__ = ("datagrams", "frames", "malformed", "decode_errors", "duplicates",
+                 "dropped", "rejected", "admitting", "acks", "nacks", "bytes_in")
+
+    def __init__(self) -> None:
+        self.datagrams = 0
+        self.frames = 0
+        self.malformed = 0  # encabezado / largo inválido
+        self.decode_errors = 0
+        self.duplicates = 0  # reenvíos de un AVL_PACKET_ID ya visto
+        self.dropped = 0  # descartados por max_pending
+        self.rejected = 0  # IMEI no admitido
+        self.admitting = 0  # descartados esperando la consulta de admisión
+        self.acks = 0
+        self.nacks = 0
+        self.bytes_in = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+def parse_datagram(data: bytes) -> Tuple[int, int, str, memoryview]:
+    """(packet_id, avl_packet_id, imei, avl_data) o ValueError si el encabezado no cierra."""
+    if len(data) < _HEADER.size:
+        raise ValueError(f"Datagrama corto ({len(data)} bytes)")
+    length, packet_id, _unused, avl_id, imei_len = _HEADER.unpack_from(data)
+    if length != len(data) - 2:
+        raise ValueError(f"LEN={length} no coincide con el datagrama ({len(data) - 2})")
+    start = _HEADER.size + imei_len
+    if start + 3 > len(data):
+        raise ValueError("Datagrama sin AVL data")
+    imei = bytes(data[_HEADER.size:start]).decode(errors="ignore")
+    return packet_id, avl_id, imei, memoryview(data)[start:]
+
+
+def build_ack(packet_id: int, avl_id: int, accepted: int) -> bytes:
+    return _ACK.pack(5, packet_id, 0x01, avl_id, accepted & 0xFF)
+
+
+class TeltonikaDatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(
+        self,
+        batcher,
+        stats: UdpStats,
+        last_seen: Optional[Dict[str, float]] = None,
+        max_pending: int = 4096,
+        hex_dump: bool = False,
+        decode=decode_avl_payload,
+        admission=None,
+        max_tracked: int = 100_000,
+    ) -> None:
+        self._batcher = batcher
+        self._admission = admission
+        self._stats = stats
+        self._last_seen = last_seen if last_seen is not None else LruDict(max_tracked)
+        self._decode = decode
+        self.max_pending = max_pending
+        self.hex_dump = hex_dump
+        self.pending = 0
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        # IMEI -> (avl_packet_id, n1 aceptados | _IN_FLIGHT)
+        self._last: Dict[str, Tuple[int, int]] = LruDict(max_tracked)
+
+    def connection_made(self, transport: asyncio.DatagramTransport) -> None:
+        self._transport = transport
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self._transport = None
+
+    def error_received(self, exc: Exception) -> None:
+        log.debug("Error UDP: %s", exc)
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        st = self._stats
+        st.datagrams += 1
+        st.bytes_in += len(data)
+        try:
+            packet_id, avl_id, imei, avl_data = parse_datagram(data)
+        except ValueError as e:
+            st.malformed += 1
+            log.debug("Datagrama inválido de %s: %s", addr, e)
+            return
+        if self.hex_dump and log.isEnabledFor(logging.DEBUG):
+            log.debug("UDP %s IMEI=%s HEX len=%d : %s", addr, imei, len(data), LazyHex(avl_data))
+
+        adm = self._admission
+        if adm is not None:
+            ok = adm.check(imei)
+            if ok is False:
+                st.rejected += 1
+                return
+            if ok is None:
+                adm.resolve(imei)
+                st.admitting += 1
+                return
+
+        last = self._last.get(imei)
+        if last is not None and last[0] == avl_id:
+            st.duplicates += 1
+            if last[1] != _IN_FLIGHT:
+                self._send_ack(addr, packet_id, avl_id, last[1])
+            return
+        if self.pending >= self.max_pending:
+            st.dropped += 1
+            return
+
+        t0 = time.perf_counter()
+        try:
+            codec, n1, records, _ = self._decode(avl_data)
+            DECODE_SECONDS.observe(time.perf_counter() - t0)
+        except Exception as e:
+            n = LOG_SAMPLER.allow(("decode", imei))
+            if n is not None:
+                log.error("Decode UDP falló (IMEI=%s): %s%s", imei, e, suppressed_note(n))
+            st.decode_errors += 1
+            self._send_ack(addr, packet_id, avl_id, 0)
+            return
+
+        st.frames += 1
+        self._last_seen[imei] = time.time()
+        self._last[imei] = (avl_id, _IN_FLIGHT)
+        self.pending += 1
+        fut = self._batcher.enqueue(imei, codec, records)
+        fut.add_done_callback(lambda f: self._on_done(f, addr, imei, packet_id, avl_id, n1, t0))
+
+    def _on_done(self, fut: asyncio.Future, addr, imei: str, packet_id: int, avl_id: int, n1: int, t0: float) -> None:
+        self.pending -= 1
+        ok = not fut.cancelled() and fut.exception() is None and fut.result()
+        accepted = n1 if ok else 0
+        if ok:
+            self._last[imei] = (avl_id, accepted)
+        elif self._last.get(imei) == (avl_id, _IN_FLIGHT):
+            # sin persistir: el reenvío del equipo se procesa de nuevo
+            del self._last[imei]
+        ACK_SECONDS.observe(time.perf_counter() - t0)
+        self._send_ack(addr, packet_id, avl_id, accepted)
+
+    def _send_ack(self, addr, packet_id: int, avl_id: int, accepted: int) -> None:
+        if self._transport is None:
+            return
+        if accepted:
+            self._stats.acks += 1
+        else:
+            self._stats.nacks += 1
+        self._transport.sendto(build_ack(packet_id, avl_id, accepted), addr)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark HTTP del API (ingesta y lectura de telemetría) con N clientes concurrentes.
+
+Cada cliente mantiene una conexión keep-alive propia y encadena requests
+durante `--duration` segundos (tras `--warmup`). Reporta requests/s, códigos
+de respuesta y latencia p50/p90/p99/max.
+
+Escenarios:
+    ingest   POST /ingest/teltonika/ingest  (1 record, external_id rotando entre --devices)
+    batch    POST /ingest/teltonika/ingest  (--batch records por request)
+    http     POST /ingest/http              (token de device: --token)
+    read     GET  /telemetry/query?external_id=...&limit=--limit
+    mixed    80% ingest / 20% read
+
+Uso:
+    python tools/bench_api.py --url http://127.0.0.1:8000 --scenario ingest \\
+        --concurrency 500 --duration 20 --imei-base 350000000000000 --devices 300
+"""
+import argparse, asyncio, json, random, resource, sys, time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+def _percentile(sorted_vals: List[float], p: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = min(len(sorted_vals) - 1, max(0, int(round(p / 100.0 * (len(sorted_vals) - 1)))))
+    return sorted_vals[k]
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.lat: List[float] = []
+        self.status: Dict[int, int] = {}
+        self.errors = 0
+        self.recording = False
+
+    def add(self, status: int, elapsed: float) -> None:
+        if not self.recording:
+            return
+        self.status[status] = self.status.get(status, 0) + 1
+        self.lat.append(elapsed)
+
+
+# -------------------------------------------------------------------
+# Cliente HTTP/1.1 mínimo (keep-alive, Content-Length)
+# -------------------------------------------------------------------
+class Conn:
+    def __init__(self, host: str, port: int) -> None:
+        self.host, self.port = host, port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str, body: bytes = b"") -> Tuple[int, bytes]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+        if body:
+            head += f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+        self.writer.write(head.encode() + b"\r\n" + body)
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("conexión cerrada")
+        status = int(status_line.split()[1])
+        length, close = 0, False
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name = name.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "connection" and value.strip().lower() == "close":
+                close = True
+        data = await self.reader.readexactly(length) if length else b""
+        if close:
+            self.close()
+        return status, data
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def make_request(args, rnd: random.Random) -> Tuple[str, str, bytes]:
+    scenario = args.scenario
+    if scenario == "mixed":
+        scenario = "read" if rnd.random() < 0.2 else "ingest"
+    imei = str(args.imei_base + rnd.randrange(args.devices))
+    now_ms = int(time.time() * 1000)
+    if scenario == "read":
+        return "GET", f"/telemetry/query?external_id={imei}&limit={args.limit}", b""
+    rec = {"ts": now_ms, "gps": {"lat": -33.45, "lon": -70.66, "speed": rnd.randint(0, 90), "sat": 9},
+           "io": {"239": 1, "66": rnd.randint(11000, 14000), "21": 4}}
+    if scenario == "http":
+        return "POST", "/ingest/http", json.dumps({"token": args.token, "data": rec}).encode()
+    if scenario == "batch":
+        batch = [dict(rec, ts=now_ms - i * 1000) for i in range(args.batch)]
+        return "POST", "/ingest/teltonika/ingest", json.dumps({"external_id": imei, "batch": batch}).encode()
+    return "POST", "/ingest/teltonika/ingest", json.dumps({"external_id": imei, **rec}).encode()
+
+
+async def client(args, host: str, port: int, stats: Stats, stop_at: float, seed: int) -> None:
+    rnd = random.Random(seed)
+    conn = Conn(host, port)
+    while time.monotonic() < stop_at:
+        method, path, body = make_request(args, rnd)
+        t0 = time.perf_counter()
+        try:
+            status, _ = await asyncio.wait_for(conn.request(method, path, body), timeout=args.timeout)
+        except Exception:
+            if stats.recording:
+                stats.errors += 1
+            conn.close()
+            await asyncio.sleep(0.05)
+            continue
+        stats.add(status, time.perf_counter() - t0)
+    conn.close()
+
+
+async def run(args) -> Dict[str, object]:
+    u = urlsplit(args.url)
+    host, port = u.hostname or "127.0.0.1", u.port or 80
+    stats = Stats()
+    start = time.monotonic()
+    stop_at = start + args.warmup + args.duration
+    tasks = [asyncio.create_task(client(args, host, port, stats, stop_at, i)) for i in range(args.concurrency)]
+    await asyncio.sleep(args.warmup)
+    stats.recording = True
+    t0 = time.monotonic()
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - t0
+
+    lat = sorted(stats.lat)
+    ok = sum(n for s, n in stats.status.items() if 200 <= s < 300)
+    return {
+        "scenario": args.scenario,
+        "concurrency": args.concurrency,
+        "duration_s": round(elapsed, 1),
+        "requests": len(lat),
+        "rps": round(len(lat) / elapsed, 1) if elapsed else 0.0,
+        "ok_rps": round(ok / elapsed, 1) if elapsed else 0.0,
+        "status": stats.status,
+        "errors": stats.errors,
+        "latency_ms": {
+            "p50": round(_percentile(lat, 50) * 1000, 1),
+            "p90": round(_percentile(lat, 90) * 1000, 1),
+            "p99": round(_percentile(lat, 99) * 1000, 1),
+            "max": round((lat[-1] if lat else 0.0) * 1000, 1),
+        },
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--scenario", choices=("ingest", "batch", "http", "read", "mixed"), default="ingest")
+    ap.add_argument("--concurrency", type=int, default=500)
+    ap.add_argument("--duration", type=float, default=20.0)
+    ap.add_argument("--warmup", type=float, default=3.0)
+    ap.add_argument("--timeout", type=float, default=30.0)
+    ap.add_argument("--imei-base", type=int, default=350000000000000)
+    ap.add_argument("--devices", type=int, default=300)
+    ap.add_argument("--batch", type=int, default=50)
+    ap.add_argument("--limit", type=int, default=50)
+    ap.add_argument("--token", default="")
+    ap.add_argument("--json", action="store_true", help="salida JSON en una línea")
+    args = ap.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < args.concurrency + 64:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, args.concurrency + 1024), hard))
+
+    res = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(res))
+        return
+    for k, v in res.items():
+        print(f"  {k:<12} {v}")
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
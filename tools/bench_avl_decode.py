@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark del decodificador AVL: implementación original (helpers _u8/_u16/...)
+vs. avl.decode_avl_payload (memoryview + struct.Struct precompilados, AvlRecord).
+
+Verifica además que ambas producen exactamente la misma salida (AvlRecord.to_dict())
+y mide memoria retenida por record (tracemalloc) de cada representación.
+
+Uso:
+    python tools/bench_avl_decode.py [--records 1,50,255] [--frames 200] [--memory] [--no-x]
+
+Con NumPy instalado agrega la columna del decode por lotes (avl_batch); con
+--no-x los records 8E no llevan X-bytes de largo variable (backlog homogéneo).
+"""
+import argparse, os, random, struct, sys, time, tracemalloc
+from typing import Tuple, Dict, Any, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from avl_frames import encode_payload, random_record  # noqa: E402
+import avl  # noqa: E402  (avl_frames ya agregó services/teltonika-tcp al path)
+import avl_batch  # noqa: E402
+from avl import IO_NAME_MAP  # noqa: E402
+
+
+# -------------------------------------------------------------------
+# Decodificador original (copia de server.py antes del cambio)
+# -------------------------------------------------------------------
+def _need(buf: bytes, pos: int, need: int, what: str) -> None:
+    if pos + need > len(buf):
+        raise ValueError(f"Payload truncado: {what} (pos={pos}, need={need}, len={len(buf)})")
+
+def _u8(buf: bytes, pos: int) -> Tuple[int, int]:
+    _need(buf, pos, 1, "u8")
+    return buf[pos], pos + 1
+
+def _u16(buf: bytes, pos: int) -> Tuple[int, int]:
+    _need(buf, pos, 2, "u16")
+    return struct.unpack_from(">H", buf, pos)[0], pos + 2
+
+def _u32(buf: bytes, pos: int) -> Tuple[int, int]:
+    _need(buf, pos, 4, "u32")
+    return struct.unpack_from(">I", buf, pos)[0], pos + 4
+
+def _i32(buf: bytes, pos: int) -> Tuple[int, int]:
+    _need(buf, pos, 4, "i32")
+    return struct.unpack_from(">i", buf, pos)[0], pos + 4
+
+def _u64(buf: bytes, pos: int) -> Tuple[int, int]:
+    _need(buf, pos, 8, "u64")
+    return struct.unpack_from(">Q", buf, pos)[0], pos + 8
+
+def _to_hex_be(value: int, byte_len: int) -> str:
+    return value.to_bytes(byte_len, "big", signed=False).hex()
+
+def _reverse_hex_bytes(hex_str: str) -> str:
+    return "".join([hex_str[i:i+2] for i in range(0, len(hex_str), 2)][::-1])
+
+def _ascii_from_hex(hex_str: str) -> str:
+    try:
+        # mismo relleno NUL descartado que avl._ascii (jsonb no acepta \u0000)
+        return bytes.fromhex(hex_str).decode("ascii", errors="ignore").replace("\x00", "")
+    except Exception:
+        return ""
+
+def _set_named(io_out: dict, io_id: int, value):
+    name = IO_NAME_MAP.get(io_id)
+    if name:
+        io_out[name] = value
+    else:
+        io_out[str(io_id)] = value
+
+def decode_avl_payload_legacy(payload: bytes) -> Tuple[int, int, List[Dict[str, Any]], bool]:
+    """
+    Retorna: codec, total_records (según cabecera), records_list, crc_ok_assumed(True si read_frame validó)
+    """
+    pos = 0
+    codec, pos = _u8(payload, pos)
+    if codec not in (0x08, 0x8E):
+        raise ValueError(f"Codec no soportado: 0x{codec:02X}")
+
+    n1, pos = _u8(payload, pos)
+    records: List[Dict[str, Any]] = []
+
+    for _ in range(n1):
+        rec: Dict[str, Any] = {}
+        ts_ms, pos = _u64(payload, pos)
+        prio, pos = _u8(payload, pos)
+
+        lon, pos = _i32(payload, pos)
+        lat, pos = _i32(payload, pos)
+        alt, pos = _u16(payload, pos)
+        angle, pos = _u16(payload, pos)
+        sats, pos = _u8(payload, pos)
+        speed, pos = _u16(payload, pos)
+
+        # Event ID + total IO: tamaños varían por codec
+        if codec == 0x08:
+            event_id, pos = _u8(payload, pos)
+            total_io, pos = _u8(payload, pos)
+        else:  # 0x8E
+            event_id, pos = _u16(payload, pos)
+            total_io, pos = _u16(payload, pos)
+
+        io_by_size: Dict[int, Dict[int, int]] = {1: {}, 2: {}, 4: {}, 8: {}}
+        xbytes_map: Dict[int, str] = {}
+        # ---- Grupo 1 byte ----
+        if codec == 0x08:
+            c1, pos = _u8(payload, pos)
+            for _k in range(c1):
+                io_id, pos = _u8(payload, pos)   # ID = 1 byte en 0x08
+                val,   pos = _u8(payload, pos)
+                io_by_size[1][io_id] = val
+        else:  # 0x8E
+            c1, pos = _u16(payload, pos)
+            for _k in range(c1):
+                io_id, pos = _u16(payload, pos)  # ID = 2 bytes en 0x8E
+                val,   pos = _u8(payload, pos)
+                io_by_size[1][io_id] = val
+
+        # ---- Grupo 2 bytes ----
+        if codec == 0x08:
+            c2, pos = _u8(payload, pos)
+            for _k in range(c2):
+                io_id, pos = _u8(payload, pos)
+                val,   pos = _u16(payload, pos)
+                io_by_size[2][io_id] = val
+        else:
+            c2, pos = _u16(payload, pos)
+            for _k in range(c2):
+                io_id, pos = _u16(payload, pos)
+                val,   pos = _u16(payload, pos)
+                io_by_size[2][io_id] = val
+
+        # ---- Grupo 4 bytes ----
+        if codec == 0x08:
+            c4, pos = _u8(payload, pos)
+            for _k in range(c4):
+                io_id, pos = _u8(payload, pos)
+                val,   pos = _u32(payload, pos)
+                io_by_size[4][io_id] = val
+        else:
+            c4, pos = _u16(payload, pos)
+            for _k in range(c4):
+                io_id, pos = _u16(payload, pos)
+                val,   pos = _u32(payload, pos)
+                io_by_size[4][io_id] = val
+
+        # ---- Grupo 8 bytes ----
+        if codec == 0x08:
+            c8, pos = _u8(payload, pos)
+            for _k in range(c8):
+                io_id, pos = _u8(payload, pos)
+                val,   pos = _u64(payload, pos)
+                io_by_size[8][io_id] = val
+        else:
+            c8, pos = _u16(payload, pos)
+            for _k in range(c8):
+                io_id, pos = _u16(payload, pos)
+                val,   pos = _u64(payload, pos)
+                io_by_size[8][io_id] = val
+
+        # ---- Grupo X-bytes (sólo 8E, ya estaba OK) ----
+        if codec == 0x8E:
+            cx, pos = _u16(payload, pos)
+            for _k in range(cx):
+                io_id, pos = _u16(payload, pos)
+                vlen,  pos = _u16(payload, pos)
+                _need(payload, pos, vlen, f"xbytes({io_id})")
+                raw = payload[pos : pos + vlen]
+                pos += vlen
+                xbytes_map[io_id] = raw.hex()
+
+        # Construcción del record
+        gps = {
+            "lat": lat / 1e7,
+            "lon": lon / 1e7,
+            "sat": sats,
+            "hdop": None,
+            "speed": float(speed),
+        }
+        io: Dict[str, Any] = {}
+
+        # Post-proceso: iButton (0x4E, 8 bytes)
+        if 0x4E in io_by_size[8]:
+            ib_val = io_by_size[8][0x4E]
+            ib_hex = _to_hex_be(ib_val, 8).upper()
+            if ib_val != 0:
+                io["IButton"] = ib_hex
+                io["IButton_Reverse"] = _reverse_hex_bytes(ib_hex).upper()
+                io["IButton_Connected"] = True
+            else:
+                io["IButton"] = "0"
+                io["IButton_Reverse"] = ""
+                io["IButton_Connected"] = False
+
+        # Post-proceso: ICCID (DB/DC/DD concatenadas como ASCII)
+        iccid_parts = []
+        for pid in (0xDB, 0xDC, 0xDD):
+            if pid in xbytes_map:
+                iccid_parts.append(_ascii_from_hex(xbytes_map[pid]))
+        if iccid_parts:
+            iccid_full = "".join(iccid_parts).strip("\x00")
+            if iccid_full:
+                io["CCID"] = iccid_full
+                io["CCID Part1"] = _ascii_from_hex(xbytes_map.get(0xDB, ""))
+                io["CCID Part2"] = _ascii_from_hex(xbytes_map.get(0xDC, ""))
+                io["CCID Part3"] = _ascii_from_hex(xbytes_map.get(0xDD, ""))
+
+        # Nombrado amigable para todos los grupos 1/2/4/8
+        for size_group in (1, 2, 4, 8):
+            for io_id, val in io_by_size[size_group].items():
+                _set_named(io, io_id, val)
+
+        # X-bytes restantes expuestos como hex
+        for io_id, hex_val in xbytes_map.items():
+            if io_id not in (0xDB, 0xDC, 0xDD):  # ya procesados
+                _set_named(io, io_id, "0x" + hex_val)
+
+        rec["ts"] = ts_ms / 1000.0
+        rec["event_id"] = event_id
+        rec["priority"] = prio
+        rec["gps"] = gps
+        rec["io"] = io
+        rec["rejected_io"] = {}  # puedes usarlo para IDs que decidas ignorar
+
+        records.append(rec)
+
+    # N2 (debe coincidir con n1, según protocolo)
+    n2, pos = _u8(payload, pos)
+
+    return codec, n1, records, True
+
+
+# -------------------------------------------------------------------
+# Benchmark
+# -------------------------------------------------------------------
+def make_payloads(codec: int, n_records: int, n_frames: int, seed: int = 1, with_x: bool = True) -> List[bytes]:
+    rng = random.Random(seed)
+    base = int(time.time() * 1000)
+    return [
+        encode_payload([random_record(rng, base + i * 1000, codec, with_x) for i in range(n_records)], codec)
+        for _ in range(n_frames)
+    ]
+
+
+def run(fn, payloads) -> float:
+    t0 = time.perf_counter()
+    for p in payloads:
+        fn(p)
+    return time.perf_counter() - t0
+
+
+def retained_bytes(fn, payloads) -> int:
+    """Bytes retenidos por los records decodificados (sin contar los payloads)."""
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    kept = [fn(p)[2] for p in payloads]
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    del kept
+    return used
+
+
+def memory_report(records: List[int], frames: int) -> None:
+    print(f"{'codec':>6} {'rec/frame':>9} {'legacy B/rec':>13} {'new B/rec':>10} {'ratio':>6}")
+    for codec in (0x08, 0x8E):
+        for n in records:
+            payloads = make_payloads(codec, n, max(1, frames // max(1, n // 10)))
+            total = n * len(payloads)
+            avl.decode_avl_payload(payloads[0])  # layouts/structs cacheados fuera de la medición
+            old = retained_bytes(decode_avl_payload_legacy, payloads) / total
+            new = retained_bytes(avl.decode_avl_payload, payloads) / total
+            print(f"  0x{codec:02X} {n:>9} {old:>13,.0f} {new:>10,.0f} {old / new:>5.1f}x")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--records", default="1,50,255", help="records por frame")
+    ap.add_argument("--frames", type=int, default=200)
+    ap.add_argument("--memory", action="store_true", help="medir memoria por record en vez de velocidad")
+    ap.add_argument("--no-x", action="store_true", help="records 8E sin X-bytes (layout homogéneo)")
+    args = ap.parse_args()
+
+    if args.memory:
+        memory_report([int(x) for x in args.records.split(",")], args.frames)
+        return
+
+    batch = avl_batch.np is not None
+    print(f"{'codec':>6} {'rec/frame':>9} {'legacy rec/s':>14} {'new rec/s':>14} {'speedup':>8}"
+          + (f" {'batch rec/s':>14} {'speedup':>8}" if batch else ""))
+    for codec in (0x08, 0x8E):
+        for n in (int(x) for x in args.records.split(",")):
+            payloads = make_payloads(codec, n, max(1, args.frames // max(1, n // 10)), with_x=not args.no_x)
+            for p in payloads:
+                codec_n, n1, recs, ok = avl.decode_avl_payload(p)
+                legacy = decode_avl_payload_legacy(p)
+                assert (codec_n, n1, [r.to_dict() for r in recs], ok) == legacy, "salida distinta"
+                if batch:
+                    codec_n, n1, recs, ok = avl_batch.decode_avl_payload_batch(p)
+                    assert (codec_n, n1, [r.to_dict() for r in recs], ok) == legacy, "salida distinta (batch)"
+            total = n * len(payloads)
+            t_old = min(run(decode_avl_payload_legacy, payloads) for _ in range(3))
+            t_new = min(run(avl.decode_avl_payload, payloads) for _ in range(3))
+            line = f"  0x{codec:02X} {n:>9} {total / t_old:>14,.0f} {total / t_new:>14,.0f} {t_old / t_new:>7.2f}x"
+            if batch:
+                t_batch = min(run(avl_batch.decode_avl_payload_batch, payloads) for _ in range(3))
+                line += f" {total / t_batch:>14,.0f} {t_old / t_batch:>7.2f}x"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
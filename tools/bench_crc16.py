@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark CRC16/IBM: bit a bit (implementación original) vs tabla vs fast path.
+
+Uso:
+    python tools/bench_crc16.py [--sizes 1024,4096,16384,65536] [--repeat 20]
+"""
+import argparse, os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "services", "teltonika-tcp"))
+import crc16  # noqa: E402
+
+
+def crc16_bitwise(data: bytes) -> int:
+    # Implementación original de server.py (8 iteraciones por byte)
+    crc = 0x0000
+    for b in data:
+        crc ^= b
+        for _ in range(8):
+            if (crc & 1) != 0:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+    return crc & 0xFFFF
+
+
+def bench(fn, data, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(data)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="1024,4096,16384,65536")
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    impls = [("bitwise", crc16_bitwise), ("table", crc16.crc16_ibm_py)]
+    if crc16.BACKEND != "table":
+        impls.append((crc16.BACKEND, crc16.crc16_ibm))
+
+    print(f"backend activo: {crc16.BACKEND}")
+    print(f"{'size':>8} " + " ".join(f"{name:>14}" for name, _ in impls) + f" {'speedup':>9}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        data = os.urandom(size)
+        ref = crc16_bitwise(data)
+        mv = memoryview(data)
+        for name, fn in impls:
+            assert fn(mv) == ref, f"{name}: CRC distinto para size={size}"
+        times = [bench(fn, mv, args.repeat) for _, fn in impls]
+        cols = " ".join(f"{(size / t) / 1e6:>9.1f} MB/s" for t in times)
+        print(f"{size:>8} {cols} {times[0] / times[-1]:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Generador de carga asíncrono para el servidor Teltonika TCP.
+
+Simula N equipos FMC650 concurrentes (una conexión TCP por IMEI), cada uno
+enviando frames Codec 8E (o 8) con backlog de varios records y IO en los
+grupos 1/2/4/8/X bytes, cada `--interval` segundos (con jitter).
+
+Reporta progreso periódico y al final: frames/records por segundo, latencia
+de ACK (p50/p90/p95/p99/max), NACKs (ACK=0), ACK con cantidad incorrecta,
+timeouts y errores de conexión.
+
+Con `--udp` cada equipo envía datagramas AVL sobre UDP (encabezado con IMEI,
+ACK por datagrama y reenvío si no llega).
+
+Uso:
+    python tools/loadgen_teltonika.py --host 127.0.0.1 --port 5027 \\
+        --devices 10000 --interval 10 --records 1-8 --duration 120 --ramp 30
+"""
+import argparse, asyncio, json, os, random, resource, struct, sys, time
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from avl_frames import encode_frame, encode_payload, random_record  # noqa: E402
+
+
+# -------------------------------------------------------------------
+# Métricas
+# -------------------------------------------------------------------
+class Stats:
+    def __init__(self) -> None:
+        self.connected = 0
+        self.active = 0
+        self.connect_errors = 0
+        self.rejected = 0  # handshake IMEI != 0x01
+        self.frames = 0
+        self.records = 0
+        self.acked = 0
+        self.nacks = 0  # ACK = 0
+        self.ack_mismatch = 0  # ACK != records enviados
+        self.timeouts = 0
+        self.conn_lost = 0
+        self.latencies: List[float] = []
+
+    def percentiles(self, lat: List[float]) -> Dict[str, float]:
+        if not lat:
+            return {}
+        data = sorted(lat)
+        pick = lambda q: data[min(len(data) - 1, int(round(q * (len(data) - 1))))] * 1000.0  # noqa: E731
+        return {"p50_ms": pick(0.50), "p90_ms": pick(0.90), "p95_ms": pick(0.95),
+                "p99_ms": pick(0.99), "max_ms": data[-1] * 1000.0}
+
+    def summary(self, elapsed: float) -> Dict[str, object]:
+        sent = max(1, self.frames)
+        return {
+            "elapsed_s": round(elapsed, 1),
+            "devices_connected": self.connected,
+            "devices_active": self.active,
+            "frames": self.frames,
+            "records": self.records,
+            "frames_per_s": round(self.frames / elapsed, 1) if elapsed else 0.0,
+            "records_per_s": round(self.records / elapsed, 1) if elapsed else 0.0,
+            "acked": self.acked,
+            "nack_rate": round(self.nacks / sent, 4),
+            "mismatch_rate": round(self.ack_mismatch / sent, 4),
+            "timeout_rate": round(self.timeouts / sent, 4),
+            "connect_errors": self.connect_errors,
+            "rejected": self.rejected,
+            "conn_lost": self.conn_lost,
+            "ack_latency": {k: round(v, 2) for k, v in self.percentiles(self.latencies).items()},
+        }
+
+
+# -------------------------------------------------------------------
+# Equipo simulado
+# -------------------------------------------------------------------
+def _parse_range(spec: str) -> Tuple[int, int]:
+    lo, _, hi = spec.partition("-")
+    lo_i = int(lo)
+    return lo_i, int(hi) if hi else lo_i
+
+
+def build_frame(rng: random.Random, n: int, codec: int, with_x: bool, period_ms: int) -> bytes:
+    """Backlog de n records espaciados `period_ms` hacia atrás (como un equipo que estuvo offline)."""
+    now = int(time.time() * 1000)
+    recs = [random_record(rng, now - (n - 1 - i) * period_ms, codec=codec, with_x=with_x) for i in range(n)]
+    return encode_frame(recs, codec)
+
+
+async def device(idx: int, args, stats: Stats, stop: asyncio.Event) -> None:
+    rng = random.Random(args.seed + idx)
+    imei = str(args.imei_base + idx).encode()
+    rec_lo, rec_hi = _parse_range(args.records)
+
+    # arranque escalonado para no abrir todas las conexiones a la vez
+    if args.ramp > 0:
+        await asyncio.sleep(args.ramp * idx / args.devices)
+
+    while not stop.is_set():
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(args.host, args.port), timeout=args.timeout)
+        except Exception:
+            stats.connect_errors += 1
+            await asyncio.sleep(1.0 + rng.random())
+            continue
+
+        try:
+            writer.write(struct.pack(">H", len(imei)) + imei)
+            await writer.drain()
+            hs = await asyncio.wait_for(reader.readexactly(1), timeout=args.timeout)
+            if hs != b"\x01":
+                stats.rejected += 1
+                return
+            stats.connected += 1
+            stats.active += 1
+            try:
+                # primer envío desfasado dentro del intervalo
+                await asyncio.sleep(rng.random() * args.interval)
+                while not stop.is_set():
+                    n = rng.randint(rec_lo, rec_hi)
+                    frame = build_frame(rng, n, args.codec, not args.no_x, int(args.interval * 1000) or 1000)
+                    t0 = time.perf_counter()
+                    writer.write(frame)
+                    await writer.drain()
+                    stats.frames += 1
+                    stats.records += n
+                    try:
+                        ack = struct.unpack(">I", await asyncio.wait_for(reader.readexactly(4), timeout=args.timeout))[0]
+                    except asyncio.TimeoutError:
+                        stats.timeouts += 1
+                        break  # el equipo real cierra y reconecta
+                    stats.latencies.append(time.perf_counter() - t0)
+                    if ack == n:
+                        stats.acked += 1
+                    elif ack == 0:
+                        stats.nacks += 1
+                    else:
+                        stats.ack_mismatch += 1
+                    if args.interval > 0:
+                        await asyncio.sleep(args.interval * rng.uniform(0.9, 1.1))
+            finally:
+                stats.active -= 1
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.TimeoutError, OSError):
+            stats.conn_lost += 1
+        finally:
+            writer.close()
+        if not stop.is_set():
+            await asyncio.sleep(1.0 + rng.random())
+
+
+class _UdpClient(asyncio.DatagramProtocol):
+    def __init__(self) -> None:
+        self.acks: asyncio.Queue = asyncio.Queue()
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        if len(data) >= 7:
+            self.acks.put_nowait(struct.unpack(">HHBBB", data[:7]))
+
+
+def build_datagram(imei: bytes, packet_id: int, avl_id: int, payload: bytes) -> bytes:
+    body = struct.pack(">HBBH", packet_id, 0x01, avl_id, len(imei)) + imei + payload
+    return struct.pack(">H", len(body)) + body
+
+
+async def device_udp(idx: int, args, stats: Stats, stop: asyncio.Event) -> None:
+    rng = random.Random(args.seed + idx)
+    imei = str(args.imei_base + idx).encode()
+    rec_lo, rec_hi = _parse_range(args.records)
+    if args.ramp > 0:
+        await asyncio.sleep(args.ramp * idx / args.devices)
+    loop = asyncio.get_running_loop()
+    try:
+        transport, proto = await loop.create_datagram_endpoint(_UdpClient, remote_addr=(args.host, args.port))
+    except OSError:
+        stats.connect_errors += 1
+        return
+    stats.connected += 1
+    stats.active += 1
+    packet_id = rng.randrange(0x10000)
+    try:
+        await asyncio.sleep(rng.random() * args.interval)
+        while not stop.is_set():
+            n = rng.randint(rec_lo, rec_hi)
+            now = int(time.time() * 1000)
+            period = int(args.interval * 1000) or 1000
+            recs = [random_record(rng, now - (n - 1 - i) * period, codec=args.codec, with_x=not args.no_x) for i in range(n)]
+            packet_id = (packet_id + 1) & 0xFFFF
+            dgram = build_datagram(imei, packet_id, packet_id & 0xFF, encode_payload(recs, args.codec))
+            t0 = time.perf_counter()
+            stats.frames += 1
+            stats.records += n
+            ack = None
+            for _attempt in range(3):  # reenvío del mismo AVL packet id si no hay ACK
+                transport.sendto(dgram)
+                try:
+                    while True:
+                        a = await asyncio.wait_for(proto.acks.get(), timeout=args.timeout / 3)
+                        if a[1] == packet_id:
+                            ack = a[4]
+                            break
+                    break
+                except asyncio.TimeoutError:
+                    continue
+            if ack is None:
+                stats.timeouts += 1
+            else:
+                stats.latencies.append(time.perf_counter() - t0)
+                if ack == n:
+                    stats.acked += 1
+                elif ack == 0:
+                    stats.nacks += 1
+                else:
+                    stats.ack_mismatch += 1
+            if args.interval > 0:
+                await asyncio.sleep(args.interval * rng.uniform(0.9, 1.1))
+    finally:
+        stats.active -= 1
+        transport.close()
+
+
+# -------------------------------------------------------------------
+# Main
+# -------------------------------------------------------------------
+async def reporter(stats: Stats, t_start: float, every: float, stop: asyncio.Event) -> None:
+    last_frames, last_t = 0, time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(every)
+        now = time.perf_counter()
+        window = stats.latencies[-5000:]
+        p = stats.percentiles(window)
+        print(
+            f"[{now - t_start:6.1f}s] active={stats.active} frames={stats.frames} "
+            f"({(stats.frames - last_frames) / (now - last_t):.0f}/s) acked={stats.acked} "
+            f"nack={stats.nacks} timeout={stats.timeouts} conn_err={stats.connect_errors} "
+            f"p50={p.get('p50_ms', 0):.1f}ms p99={p.get('p99_ms', 0):.1f}ms",
+            flush=True,
+        )
+        last_frames, last_t = stats.frames, now
+
+
+def _raise_nofile(needed: int) -> None:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(hard, needed)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+        except (ValueError, OSError):
+            pass
+        if target < needed:
+            print(f"AVISO: RLIMIT_NOFILE={target} < {needed} conexiones", file=sys.stderr)
+
+
+async def run(args) -> Dict[str, object]:
+    _raise_nofile(args.devices + 256)
+    stats = Stats()
+    stop = asyncio.Event()
+    t_start = time.perf_counter()
+    dev = device_udp if args.udp else device
+    tasks = [asyncio.create_task(dev(i, args, stats, stop)) for i in range(args.devices)]
+    rep = asyncio.create_task(reporter(stats, t_start, args.report, stop)) if args.report > 0 else None
+
+    await asyncio.sleep(args.duration)
+    stop.set()
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if rep is not None:
+        rep.cancel()
+    return stats.summary(time.perf_counter() - t_start)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=5027)
+    ap.add_argument("--devices", type=int, default=1000)
+    ap.add_argument("--duration", type=float, default=60.0, help="segundos de prueba")
+    ap.add_argument("--interval", type=float, default=10.0, help="s entre frames por equipo (0 = sin pausa)")
+    ap.add_argument("--records", default="1-5", help="records por frame, N o MIN-MAX")
+    ap.add_argument("--codec", type=lambda s: int(s, 16), default=0x8E, help="8 o 8E (hex)")
+    ap.add_argument("--udp", action="store_true", help="AVL sobre UDP en vez de TCP")
+    ap.add_argument("--no-x", action="store_true", help="sin IO de longitud variable (Codec 8E)")
+    ap.add_argument("--ramp", type=float, default=10.0, help="s para abrir todas las conexiones")
+    ap.add_argument("--timeout", type=float, default=30.0, help="timeout de conexión/ACK (s)")
+    ap.add_argument("--imei-base", type=int, default=352000000000000)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--report", type=float, default=5.0, help="s entre líneas de progreso (0 = sólo resumen)")
+    ap.add_argument("--json", action="store_true", help="resumen final en JSON")
+    args = ap.parse_args()
+    if args.codec not in (0x08, 0x8E):
+        ap.error("--codec debe ser 8 o 8E")
+    try:
+        rec_lo, rec_hi = _parse_range(args.records)
+    except ValueError:
+        ap.error("--records debe ser N o MIN-MAX")
+    # N1/N2 del AVL data array ocupan un byte, tanto en TCP como en UDP.
+    if not 1 <= rec_lo <= rec_hi <= 255:
+        ap.error("--records debe cumplir 1 <= MIN <= MAX <= 255")
+
+    try:
+        summary = asyncio.run(run(args))
+    except KeyboardInterrupt:
+        return
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print("\nResumen")
+        for k, v in summary.items():
+            print(f"  {k:20s} {v}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,10 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import argparse, socket, struct, time
+import argparse, os, socket, struct, sys, time
 
-def crc16_ibm(data: bytes) -> int:
-    crc = 0x0000
-    for b in data:
-        crc ^= b
-        for _ in range(8):
-            if (crc & 1) != 0:
-                crc = (crc >> 1) ^ 0xA001
-            else:
-                crc >>= 1
-    return crc & 0xFFFF
+# CRC16/IBM compartido con el servidor TCP
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "services", "teltonika-tcp"))
+from crc16 import crc16_ibm  # noqa: E402
 
 def build_record(ts_ms, lat, lon, speed_kmh):
     # Codec8 simple con 1 record y sin IO (solo contadores 0)
@@ -45,11 +38,10 @@ def build_avl_frame(ts_ms, lat, lon, speed_kmh):
     payload += b"\x01"         # N2=1
     # CRC (4 bytes, pero Teltonika usa CRC16 en lower 16 bits)
     crc = crc16_ibm(payload)
-    payload += struct.pack(">I", crc)  # 4 bytes
 
-    # Header: 00000000 + len(payload)
+    # Header: 00000000 + len(payload); el CRC va después y no cuenta en LEN
     header = b"\x00\x00\x00\x00" + struct.pack(">I", len(payload))
-    return header + payload
+    return header + payload + struct.pack(">I", crc)
 
 def main():
     ap = argparse.ArgumentParser()